@@ -3,7 +3,9 @@ Django settings for chalo_kart project.
 """
 
 from pathlib import Path
+import json
 import os
+import tempfile
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -34,6 +36,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'myapp.metrics.MetricsMiddleware',
+    'myapp.profiling.SlowRequestProfilerMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -60,9 +64,43 @@ CORS_ALLOWED_ORIGIN_REGEXES = [
 ROOT_URLCONF = 'chalo_kart.urls'
 
 # Add channel layers configuration
+# Set REDIS_URL to share groups across ASGI workers. CHANNEL_LAYER_BACKEND picks
+# 'redis' (channels_redis core) or 'redis-pubsub' (also works with the stand-in
+# from `manage.py redis_standin`); without REDIS_URL groups stay in-process.
+REDIS_URL = os.environ.get('REDIS_URL')
+CHANNEL_LAYER_BACKEND = os.environ.get('CHANNEL_LAYER_BACKEND', 'redis')
+
+if not REDIS_URL:
+    _inner_channel_layer = {
+        'backend': 'channels.layers.InMemoryChannelLayer',
+        'config': {},
+    }
+elif CHANNEL_LAYER_BACKEND == 'redis-pubsub':
+    _inner_channel_layer = {
+        'backend': 'channels_redis.pubsub.RedisPubSubChannelLayer',
+        'config': {'hosts': [REDIS_URL]},
+    }
+else:
+    _inner_channel_layer = {
+        'backend': 'channels_redis.core.RedisChannelLayer',
+        'config': {
+            'hosts': [REDIS_URL],
+            'capacity': 200,
+            'expiry': 30,
+            'group_expiry': 3600,
+        },
+    }
+
 CHANNEL_LAYERS = {
     'default': {
-        'BACKEND': 'channels.layers.InMemoryChannelLayer'
+        'BACKEND': 'myapp.channel_layers.BatchingChannelLayer',
+        'CONFIG': {
+            **_inner_channel_layer,
+            'batch_window': 0.005,
+            'batch_size': 50,
+            'expiry': 30,
+            'capacity': 200,
+        },
     }
 }
 
@@ -137,8 +175,8 @@ TEMPLATES = [
 # Add REST Framework settings
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
+        'myapp.authentication.SignedTokenAuthentication',
         'rest_framework.authentication.SessionAuthentication',
-        'rest_framework.authentication.BasicAuthentication',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
@@ -152,6 +190,37 @@ REST_FRAMEWORK = {
     'PAGE_SIZE': 10,
 }
 
+# Fare tariff as JSON, merged over myapp.fares.DEFAULT_TARIFF: time bands,
+# zones, student discount and shuttle per-seat rates
+FARE_TARIFF = json.loads(os.environ.get('FARE_TARIFF', '{}'))
+
+# Surge pricing as JSON, merged over myapp.surge.DEFAULT_SURGE: cell size,
+# rolling window, smoothing, threshold and cap; off unless {"enabled": true}
+SURGE_PRICING = json.loads(os.environ.get('SURGE_PRICING', '{}'))
+
+# Per-endpoint timings are scraped from /metrics, which is only served once
+# METRICS_TOKEN is set (send it as a bearer token); SERVER_TIMING also
+# returns them per response. Both are off by default
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+SERVER_TIMING = os.environ.get('SERVER_TIMING', '').lower() in ('1', 'true', 'yes')
+
+# Opt-in sampling profiler: requests and WebSocket messages slower than
+# PROFILE_THRESHOLD_MS (or 1 in PROFILE_SAMPLE_RATE) keep a collapsed-stack
+# profile in PROFILE_DIR, newest PROFILE_KEEP only; read them at /api/profiles/
+PROFILING = os.environ.get('PROFILING', '').lower() in ('1', 'true', 'yes')
+PROFILE_THRESHOLD_MS = float(os.environ.get('PROFILE_THRESHOLD_MS', 1000))
+PROFILE_SAMPLE_RATE = int(os.environ.get('PROFILE_SAMPLE_RATE', 0))
+PROFILE_INTERVAL_MS = float(os.environ.get('PROFILE_INTERVAL_MS', 5))
+PROFILE_DIR = Path(os.environ.get('PROFILE_DIR', Path(tempfile.gettempdir()) / 'chalo_kart_profiles'))
+PROFILE_KEEP = int(os.environ.get('PROFILE_KEEP', 100))
+
+# Lifetimes (seconds) of the signed tokens issued by /api/users/login/
+ACCESS_TOKEN_LIFETIME = int(os.environ.get('ACCESS_TOKEN_LIFETIME', 15 * 60))
+REFRESH_TOKEN_LIFETIME = int(os.environ.get('REFRESH_TOKEN_LIFETIME', 14 * 24 * 60 * 60))
+
+# Upper bound for ?page_size= on cursor-paginated listings
+MAX_PAGE_SIZE = int(os.environ.get('MAX_PAGE_SIZE', 100))
+
 # Logging configuration
 LOGGING = {
     'version': 1,
@@ -177,12 +246,26 @@ LOGGING = {
     },
 }
 
-# Cache configuration
-CACHES = {
-    'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+# Cache configuration. Set MEMCACHED_LOCATION (host:port, comma-separated) to
+# share cached responses and their invalidations across workers.
+MEMCACHED_LOCATION = os.environ.get('MEMCACHED_LOCATION')
+if MEMCACHED_LOCATION:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.memcached.PyMemcacheCache',
+            'LOCATION': MEMCACHED_LOCATION.split(','),
+        }
     }
-}
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Cache holding API responses for carts, routes and driver profiles
+RESPONSE_CACHE_ALIAS = os.environ.get('RESPONSE_CACHE_ALIAS', 'default')
+RESPONSE_CACHE_TIMEOUT = int(os.environ.get('RESPONSE_CACHE_TIMEOUT', 300))
 
 # File upload settings
 MEDIA_URL = '/media/'
@@ -16,10 +16,12 @@ Including another URLconf
 """
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
+from myapp.metrics import metrics_view
 from myapp.views import (
     UserViewSet, CustomerViewSet, DriverViewSet,
     TripViewSet, WalletViewSet, PaymentViewSet,
-    RouteViewSet, GolfCartViewSet
+    RouteViewSet, GolfCartViewSet, cache_stats, profile_detail, profile_list,
+    surge_status
 )
 
 # Create a router and register the viewsets with it
@@ -35,5 +37,10 @@ router.register(r'golfcarts', GolfCartViewSet)
 
 # The API URLs are now determined automatically by the router.
 urlpatterns = [
+    path('metrics', metrics_view, name='metrics'),
+    path('api/cache-stats/', cache_stats, name='cache-stats'),
+    path('api/profiles/', profile_list, name='profile-list'),
+    path('api/profiles/<str:name>/', profile_detail, name='profile-detail'),
+    path('api/surge/', surge_status, name='surge-status'),
     path('api/', include(router.urls)),
 ]
@@ -0,0 +1,58 @@
+from urllib.parse import parse_qs
+
+from channels.middleware import BaseMiddleware
+from rest_framework.authentication import BaseAuthentication, get_authorization_header
+from rest_framework.exceptions import AuthenticationFailed
+
+from .tokens import TokenError, verify_access_token
+
+KEYWORD = 'Bearer'
+
+
+class SignedTokenAuthentication(BaseAuthentication):
+    """DRF authentication for ``Authorization: Bearer <access token>``."""
+
+    def authenticate(self, request):
+        parts = get_authorization_header(request).split()
+        if not parts or parts[0].lower() != KEYWORD.lower().encode():
+            return None
+        if len(parts) != 2:
+            raise AuthenticationFailed('Invalid token header')
+        try:
+            token = parts[1].decode()
+            return verify_access_token(token), token
+        except (TokenError, UnicodeDecodeError) as e:
+            raise AuthenticationFailed(str(e))
+
+    def authenticate_header(self, request):
+        return f'{KEYWORD} realm="api"'
+
+
+def scope_token(scope):
+    for name, value in scope.get('headers', []):
+        if name == b'authorization':
+            parts = value.decode('latin1').split()
+            if len(parts) == 2 and parts[0].lower() == KEYWORD.lower():
+                return parts[1]
+    # Browsers can't set headers on a WebSocket handshake
+    query = parse_qs(scope.get('query_string', b'').decode())
+    return query.get('token', [None])[0]
+
+
+class TokenAuthMiddleware(BaseMiddleware):
+    """
+    Puts the ``TokenUser`` of a valid access token in ``scope['user']``.
+
+    Sits inside ``AuthMiddlewareStack``, so without a token the session
+    user (or AnonymousUser) is left in place.
+    """
+
+    async def __call__(self, scope, receive, send):
+        token = scope_token(scope)
+        if token:
+            scope = dict(scope)
+            try:
+                scope['user'] = verify_access_token(token)
+            except TokenError:
+                pass
+        return await super().__call__(scope, receive, send)
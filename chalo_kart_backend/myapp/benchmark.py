@@ -0,0 +1,322 @@
+import asyncio
+import random
+import statistics
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from channels.layers import get_channel_layer
+from channels.testing import WebsocketCommunicator
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from .location_buffer import location_buffer
+from .models import Customer, Driver, GolfCart, Payment, Trip, User, Wallet
+from .rollups import backfill_driver_earnings, backfill_payment_rollups
+from .tokens import issue_tokens
+
+CENTER = (26.5123, 80.2329)
+SPREAD = 0.02
+STATUSES = ['REQUESTED', 'ACCEPTED', 'STARTED', 'COMPLETED', 'CANCELLED']
+STATUS_WEIGHTS = [3, 2, 2, 85, 8]
+# Tokens for this many customers are issued; REST calls rotate through them
+REST_ACCOUNTS = 50
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def latency_summary(values):
+    if not values:
+        return None
+    return {
+        'count': len(values),
+        'mean': round(statistics.mean(values), 3),
+        'p50': round(percentile(values, 0.50), 3),
+        'p95': round(percentile(values, 0.95), 3),
+        'p99': round(percentile(values, 0.99), 3),
+        'max': round(max(values), 3),
+    }
+
+
+def point(rng):
+    return {
+        'latitude': round(CENTER[0] + rng.uniform(-SPREAD, SPREAD), 6),
+        'longitude': round(CENTER[1] + rng.uniform(-SPREAD, SPREAD), 6),
+    }
+
+
+class City:
+    """A synthetic campus: drivers with carts, customers with wallets, trip and payment history."""
+
+    def __init__(self, drivers, customers, trips, payments, active_trips, seed=42):
+        self.rng = random.Random(seed)
+        self.counts = {
+            'drivers': drivers, 'customers': customers, 'trips': trips,
+            'payments': payments, 'active_trips': min(active_trips, drivers, customers),
+        }
+
+    def seed(self):
+        started = time.perf_counter()
+        rng, counts = self.rng, self.counts
+        now = timezone.now()
+        with transaction.atomic():
+            # Multi-table inheritance rules out bulk_create; the password is
+            # stored pre-"hashed" so seeding doesn't run PBKDF2 per row
+            self.drivers = []
+            for i in range(counts['drivers']):
+                driver = Driver(
+                    user_name=f'driver {i}', email=f'driver-{i}@bench.example.com',
+                    password='pbkdf2_bench', driving_license=f'BENCH-DL-{i}',
+                    is_available=True
+                )
+                driver.save()
+                self.drivers.append(driver)
+            self.customers = []
+            for i in range(counts['customers']):
+                customer = Customer(
+                    user_name=f'customer {i}', email=f'customer-{i}@bench.example.com',
+                    password='pbkdf2_bench', is_student=rng.random() < 0.6
+                )
+                customer.save()
+                self.customers.append(customer)
+            self.staff = User.objects.create(
+                user_name='bench staff', email='staff@bench.example.com',
+                password='pbkdf2_bench', is_staff=True
+            )
+
+            self.carts = GolfCart.objects.bulk_create([
+                GolfCart(
+                    gc_id=f'BENCH_GC_{i}', driver=driver, registration_no=f'BENCH-REG-{i}',
+                    type='SHUTTLE' if i % 5 == 0 else 'PRIVATE',
+                    capacity=8 if i % 5 == 0 else 4,
+                    status='ACTIVE', location=point(rng)
+                )
+                for i, driver in enumerate(self.drivers)
+            ])
+            self.wallets = Wallet.objects.bulk_create([
+                Wallet(user=customer, current_balance=Decimal('500.00'))
+                for customer in self.customers
+            ])
+
+            trips = []
+            # One live trip per driver/customer pair for the WebSocket clients
+            for i in range(counts['active_trips']):
+                trips.append(Trip(
+                    customer=self.customers[i], driver=self.drivers[i], golf_cart=self.carts[i],
+                    status='STARTED', start_location=point(rng), end_location=point(rng),
+                    start_time=now, fare=Decimal('10.00')
+                ))
+            for _ in range(counts['trips'] - len(trips)):
+                status = rng.choices(STATUSES, STATUS_WEIGHTS)[0]
+                index = rng.randrange(len(self.drivers))
+                assigned = status not in ['REQUESTED', 'CANCELLED']
+                ended = now - timedelta(minutes=rng.randrange(60 * 24 * 90))
+                trips.append(Trip(
+                    customer=rng.choice(self.customers),
+                    driver=self.drivers[index] if assigned else None,
+                    golf_cart=self.carts[index] if assigned else None,
+                    status=status, start_location=point(rng), end_location=point(rng),
+                    duration=rng.randint(3, 30), fare=Decimal(rng.randint(500, 3000)) / 100,
+                    start_time=ended - timedelta(minutes=15) if status == 'COMPLETED' else None,
+                    end_time=ended if status == 'COMPLETED' else None,
+                    rating=rng.randint(3, 5) if status == 'COMPLETED' else None,
+                ))
+            self.trips = Trip.objects.bulk_create(trips, batch_size=2000)
+            self.active_trips = self.trips[:counts['active_trips']]
+
+            Payment.objects.bulk_create([
+                Payment(
+                    wallet=rng.choice(self.wallets), amount=Decimal(rng.randint(500, 3000)) / 100,
+                    type=rng.choice(['ADD', 'DEDUCT']), status='COMPLETED'
+                )
+                for _ in range(counts['payments'])
+            ], batch_size=2000)
+            backfill_driver_earnings()
+            backfill_payment_rollups()
+
+        self.customer_tokens = [
+            issue_tokens(customer)['access'] for customer in self.customers[:REST_ACCOUNTS]
+        ]
+        self.staff_token = issue_tokens(self.staff)['access']
+        # (customer, driver) tokens per live trip
+        self.trip_tokens = {
+            trip.trip_id: (
+                issue_tokens(trip.customer)['access'], issue_tokens(trip.driver)['access']
+            )
+            for trip in self.active_trips
+        }
+        return round(time.perf_counter() - started, 3)
+
+
+def rest_scenarios(city):
+    """(name, method, role, path, body) factories for the hot REST calls."""
+    rng = city.rng
+    return [
+        ('trips_list', 'get', 'customer', lambda: '/api/trips/', None),
+        ('trips_list_by_status', 'get', 'customer',
+         lambda: '/api/trips/?status=COMPLETED&page_size=50', None),
+        ('trip_retrieve', 'get', 'customer',
+         lambda: f'/api/trips/{rng.choice(city.trips).trip_id}/', None),
+        ('trip_create', 'post', 'customer', lambda: '/api/trips/', lambda: {
+            'customer': rng.choice(city.customers).pk,
+            'start_location': point(rng), 'end_location': point(rng),
+            'no_of_seats_booked': 1,
+        }),
+        ('trip_history', 'get', 'customer',
+         lambda: f'/api/customers/{rng.choice(city.customers).pk}/trip_history/', None),
+        ('payments_list', 'get', 'customer', lambda: '/api/payments/', None),
+        ('payments_summary', 'get', 'customer', lambda: '/api/payments/summary/', None),
+        ('payments_monthly_report', 'get', 'staff', lambda: '/api/payments/monthly_report/', None),
+        ('wallet_info', 'get', 'customer', lambda: '/api/wallets/info/', None),
+        ('wallet_add_funds', 'post', 'customer', lambda: '/api/wallets/add_funds/',
+         lambda: {'amount': '5.00'}),
+        ('golfcarts_list', 'get', 'customer', lambda: '/api/golfcarts/', None),
+        ('golfcarts_nearby', 'get', 'customer', lambda: (
+            '/api/golfcarts/nearby/?latitude={latitude}&longitude={longitude}'.format(**point(rng))
+        ), None),
+        ('driver_retrieve', 'get', 'customer',
+         lambda: f'/api/drivers/{rng.choice(city.drivers).pk}/', None),
+        ('driver_earnings_report', 'get', 'customer',
+         lambda: f'/api/drivers/{rng.choice(city.drivers).pk}/earnings_report/?period=month', None),
+    ]
+
+
+def run_rest(city, requests, warmup=5, only=None):
+    client = APIClient()
+    report = {}
+    for name, method, role, path, body in rest_scenarios(city):
+        if only and name not in only:
+            continue
+        timings, queries, statuses, sizes = [], [], {}, []
+        for index in range(warmup + requests):
+            token = city.staff_token if role == 'staff' else city.rng.choice(city.customer_tokens)
+            call = getattr(client, method)
+            kwargs = {'HTTP_AUTHORIZATION': f'Bearer {token}'}
+            if body:
+                kwargs.update(data=body(), format='json')
+            url = path()
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                response = call(url, **kwargs)
+                elapsed = (time.perf_counter() - started) * 1000
+            if index < warmup:
+                continue
+            timings.append(elapsed)
+            queries.append(len(captured))
+            sizes.append(len(response.content))
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+        report[name] = {
+            'method': method.upper(),
+            'requests': requests,
+            'status_codes': statuses,
+            'latency_ms': latency_summary(timings),
+            'requests_per_second': round(len(timings) / (sum(timings) / 1000), 1) if timings else None,
+            'queries_per_request': round(statistics.mean(queries), 2) if queries else None,
+            'max_queries': max(queries) if queries else None,
+            'response_bytes_mean': round(statistics.mean(sizes)) if sizes else None,
+        }
+    return report
+
+
+async def run_websockets(application, city, messages, timeout=30):
+    """
+    One customer and one driver socket per live trip: connect, stream
+    driver locations in, then fan trip updates out to every socket.
+    """
+    rng = city.rng
+    pairs = city.active_trips
+
+    async def connect(trip_id, token):
+        communicator = WebsocketCommunicator(application, f'/ws/trips/{trip_id}/?token={token}')
+        started = time.perf_counter()
+        connected, _ = await communicator.connect(timeout=timeout)
+        if connected:
+            # The initial trip_state snapshot completes the handshake
+            await communicator.receive_json_from(timeout=timeout)
+        return communicator, connected, (time.perf_counter() - started) * 1000
+
+    sockets = await asyncio.gather(*[
+        connect(trip.trip_id, token)
+        for trip in pairs
+        for token in city.trip_tokens[trip.trip_id]
+    ])
+    connect_ms = [elapsed for _, connected, elapsed in sockets if connected]
+    clients = [communicator for communicator, connected, _ in sockets if connected]
+    drivers = [
+        (trip, sockets[2 * index + 1][0]) for index, trip in enumerate(pairs)
+        if sockets[2 * index + 1][1]
+    ]
+    report = {
+        'trips': len(pairs),
+        'sockets': len(sockets),
+        'connected': len(clients),
+        'connect_ms': latency_summary(connect_ms),
+    }
+
+    # Inbound: drivers stream positions; the location buffer counts what the consumers handled
+    def handled():
+        return sum(
+            location_buffer.get(trip.trip_id).updates
+            for trip, _ in drivers if location_buffer.get(trip.trip_id)
+        )
+
+    before = handled()
+    expected = len(drivers) * messages
+    started = time.perf_counter()
+    for _ in range(messages):
+        for _, communicator in drivers:
+            await communicator.send_json_to({'type': 'location_update', 'location': point(rng)})
+    deadline = time.monotonic() + timeout
+    while handled() - before < expected and time.monotonic() < deadline:
+        await asyncio.sleep(0.001)
+    elapsed = time.perf_counter() - started
+    report['inbound'] = {
+        'messages': expected,
+        'handled': handled() - before,
+        'seconds': round(elapsed, 3),
+        'messages_per_second': round((handled() - before) / elapsed, 1) if elapsed else None,
+    }
+
+    # Outbound: trip updates through the channel layer to every socket on the trip
+    layer = get_channel_layer()
+    latencies = []
+
+    async def drain(communicator):
+        received = 0
+        while received < messages:
+            try:
+                message = await communicator.receive_json_from(timeout=timeout)
+            except asyncio.TimeoutError:
+                break
+            if message.get('type') == 'trip_update':
+                received += 1
+                latencies.append((time.time() - message['sent_at']) * 1000)
+
+    readers = [asyncio.ensure_future(drain(communicator)) for communicator in clients]
+    started = time.perf_counter()
+    for sequence in range(messages):
+        await asyncio.gather(*[
+            layer.group_send(f'trip_{trip.trip_id}', {
+                'type': 'trip_update', 'trip_id': trip.trip_id,
+                'sequence': sequence, 'sent_at': time.time(),
+            })
+            for trip in pairs
+        ])
+    await asyncio.gather(*readers)
+    elapsed = time.perf_counter() - started
+    report['fanout'] = {
+        'messages': len(clients) * messages,
+        'delivered': len(latencies),
+        'seconds': round(elapsed, 3),
+        'messages_per_second': round(len(latencies) / elapsed, 1) if elapsed else None,
+        'latency_ms': latency_summary(latencies),
+    }
+
+    for communicator in clients:
+        await communicator.disconnect()
+    return report
@@ -0,0 +1,142 @@
+import asyncio
+import collections
+import logging
+import time
+
+from channels.layers import BaseChannelLayer
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+BATCH_TYPE = 'channel_layer.batch'
+
+
+class _Batch:
+    def __init__(self, message, future):
+        self.messages = [message]
+        self.done = future
+        self.full = asyncio.Event()
+
+
+class BatchingChannelLayer(BaseChannelLayer):
+    """
+    Wraps another channel layer and batches group sends.
+
+    Messages sent to the same group from one event loop within
+    ``batch_window`` seconds (or until ``batch_size`` messages) travel as
+    one envelope, so a burst costs a single round trip to the backend.
+    Receivers unpack envelopes transparently, drop messages older than
+    ``expiry`` and keep at most ``capacity`` unpacked messages per channel.
+    """
+
+    extensions = ['groups', 'flush']
+
+    def __init__(self, backend='channels.layers.InMemoryChannelLayer', config=None,
+                 batch_window=0.005, batch_size=50, expiry=60, capacity=100,
+                 channel_capacity=None):
+        super().__init__(expiry=expiry, capacity=capacity, channel_capacity=channel_capacity)
+        self.inner = import_string(backend)(**(config or {}))
+        self.batch_window = batch_window
+        self.batch_size = batch_size
+        self._batches = {}
+        self._flushing = set()
+        self._received = {}
+        self.stats = collections.Counter()
+
+    async def send(self, channel, message):
+        await self.inner.send(channel, message)
+
+    async def new_channel(self, prefix='specific.'):
+        return await self.inner.new_channel(prefix)
+
+    async def receive(self, channel):
+        buffered = self._received.get(channel)
+        while True:
+            if buffered:
+                message = buffered.popleft()
+                if not buffered:
+                    del self._received[channel]
+                return message
+
+            message = await self.inner.receive(channel)
+            if message.get('type') != BATCH_TYPE:
+                return message
+
+            if time.time() - message['sent_at'] > self.expiry:
+                self.stats['expired'] += len(message['messages'])
+                continue
+            self.stats['received'] += len(message['messages'])
+            buffered = self._received.get(channel)
+            if buffered is None:
+                buffered = self._received[channel] = collections.deque()
+            capacity = self.get_capacity(channel)
+            for item in message['messages']:
+                if len(buffered) >= capacity:
+                    buffered.popleft()
+                    self.stats['dropped'] += 1
+                buffered.append(item)
+
+    async def group_add(self, group, channel):
+        await self.inner.group_add(group, channel)
+
+    async def group_discard(self, group, channel):
+        await self.inner.group_discard(group, channel)
+
+    async def group_send(self, group, message):
+        assert self.valid_group_name(group), 'Group name not valid'
+        if not self.batch_window:
+            await self._send_batch(group, [message])
+            return
+
+        loop = asyncio.get_running_loop()
+        key = (loop, group)
+        batch = self._batches.get(key)
+        if batch is not None:
+            batch.messages.append(message)
+            if len(batch.messages) >= self.batch_size:
+                batch.full.set()
+            await asyncio.shield(batch.done)
+            return
+
+        # The first sender in a window waits for followers, then flushes for all
+        batch = self._batches[key] = _Batch(message, loop.create_future())
+        try:
+            await asyncio.wait_for(batch.full.wait(), self.batch_window)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            del self._batches[key]
+            # Sent from its own task, so followers still get their messages
+            # out (and stop waiting) if this sender is cancelled
+            flush = loop.create_task(self._flush(group, batch))
+            self._flushing.add(flush)
+            flush.add_done_callback(self._flushing.discard)
+        await asyncio.shield(batch.done)
+
+    async def _flush(self, group, batch):
+        try:
+            await self._send_batch(group, batch.messages)
+        except asyncio.CancelledError:
+            batch.done.cancel()
+            raise
+        except Exception as exc:
+            logger.error(f"Error sending batch to group {group}: {str(exc)}")
+            batch.done.set_exception(exc)
+            # Every sender may be gone; don't let asyncio report it again
+            batch.done.add_done_callback(lambda future: future.exception())
+        else:
+            batch.done.set_result(None)
+
+    async def _send_batch(self, group, messages):
+        self.stats['batches'] += 1
+        self.stats['sent'] += len(messages)
+        await self.inner.group_send(group, {
+            'type': BATCH_TYPE,
+            'sent_at': time.time(),
+            'messages': messages,
+        })
+
+    async def flush(self):
+        self._received.clear()
+        if hasattr(self.inner, 'flush'):
+            await self.inner.flush()
@@ -1,17 +1,32 @@
+import asyncio
 import json
+import time
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
 from django.core.exceptions import ObjectDoesNotExist
-from .models import Trip
+from django.utils import timezone
+from .models import Trip, GolfCart, Driver
+from .fleet import MAX_TILES, TILE_PRECISIONS, move_cart, tile_group
+from .location_buffer import FLUSH_INTERVAL, location_buffer
+from .metrics import MetricsConsumerMixin
+from .profiling import ProfilingConsumerMixin
+from .response_cache import response_cache
+from .spatial import cart_index, geohash_tiles
+from .tokens import account_id
 import logging
 
 logger = logging.getLogger(__name__)
 
-class TripConsumer(AsyncWebsocketConsumer):
+class TripConsumer(MetricsConsumerMixin, ProfilingConsumerMixin, AsyncWebsocketConsumer):
+    message_types = ('location_update',)
+
     async def connect(self):
         try:
             self.trip_id = self.scope['url_route']['kwargs']['trip_id']
             self.room_group_name = f'trip_{self.trip_id}'
+            self.trip = None
+            self.golf_cart_id = None
+            self.sends_locations = False
 
             # Verify trip exists and user has access
             if not await self.can_access_trip():
@@ -37,6 +52,13 @@ class TripConsumer(AsyncWebsocketConsumer):
 
     async def disconnect(self, close_code):
         try:
+            # Persist the last buffered position sent over this connection
+            if self.sends_locations:
+                state = location_buffer.get(self.trip_id)
+                if state and state.dirty:
+                    await self.flush_location(state)
+                location_buffer.discard(self.trip_id)
+
             # Leave room group
             await self.channel_layer.group_discard(
                 self.room_group_name,
@@ -49,26 +71,84 @@ class TripConsumer(AsyncWebsocketConsumer):
         try:
             text_data_json = json.loads(text_data)
             message_type = text_data_json.get('type')
+            self.tag_message(message_type)
             
             if message_type == 'location_update':
                 location = text_data_json.get('location')
                 if location and await self.can_update_location():
-                    updated = await self.update_location(location)
-                    if updated:
-                        # Send location update to room group
-                        await self.channel_layer.group_send(
-                            self.room_group_name,
-                            {
-                                'type': 'location_update',
-                                'location': location
-                            }
-                        )
+                    await self.handle_location_update(location)
             
         except json.JSONDecodeError:
             logger.error("Invalid JSON received")
         except Exception as e:
             logger.error(f"Error processing WebSocket message: {str(e)}")
 
+    async def handle_location_update(self, location):
+        try:
+            state = location_buffer.record(self.trip_id, location)
+        except ValueError:
+            logger.error(f"Invalid location for trip {self.trip_id}: {location}")
+            return
+        self.sends_locations = True
+
+        # Bursts only touch memory; the database sees one write per
+        # flush interval or per significant move
+        if state.due_for_flush(time.monotonic()):
+            if not await self.flush_location(state):
+                return
+        elif state.dirty and not state.flush_pending:
+            # Trailing flush, so the last position is saved even if the driver stops sending
+            state.flush_pending = True
+            asyncio.ensure_future(self.flush_location_later(state, FLUSH_INTERVAL))
+
+        if self.golf_cart_id:
+            move_cart(self.golf_cart_id, state.location)
+        await self.broadcast_location(state)
+
+    async def flush_location(self, state):
+        coordinates = state.coordinates
+        if not await self.update_location(state.location):
+            return False
+        state.mark_flushed(time.monotonic(), coordinates)
+        return True
+
+    async def flush_location_later(self, state, delay):
+        try:
+            await asyncio.sleep(delay)
+            state.flush_pending = False
+            # Skipped if the trip was dropped from the buffer meanwhile
+            if state.dirty and location_buffer.get(self.trip_id) is state:
+                await self.flush_location(state)
+        except Exception as e:
+            logger.error(f"Error flushing buffered location: {str(e)}")
+
+    async def broadcast_location(self, state):
+        delay = state.broadcast_delay(time.monotonic())
+        if not delay:
+            await self.send_location_to_group(state)
+        elif not state.broadcast_pending:
+            # Trailing broadcast so subscribers still get the latest position
+            state.broadcast_pending = True
+            asyncio.ensure_future(self.send_location_later(state, delay))
+
+    async def send_location_later(self, state, delay):
+        try:
+            await asyncio.sleep(delay)
+            state.broadcast_pending = False
+            await self.send_location_to_group(state)
+        except Exception as e:
+            logger.error(f"Error sending delayed location update: {str(e)}")
+
+    async def send_location_to_group(self, state):
+        state.broadcast_at = time.monotonic()
+        await self.channel_layer.group_send(
+            self.room_group_name,
+            {
+                'type': 'location_update',
+                'location': state.location
+            }
+        )
+
     async def location_update(self, event):
         try:
             location = event['location']
@@ -81,56 +161,191 @@ class TripConsumer(AsyncWebsocketConsumer):
 
     async def trip_update(self, event):
         try:
+            # The trip changed; reload it the next time it is needed
+            self.trip = None
+            if event.get('status') in ['COMPLETED', 'CANCELLED']:
+                location_buffer.discard(self.trip_id)
             await self.send(text_data=json.dumps(event))
         except Exception as e:
             logger.error(f"Error sending trip update: {str(e)}")
 
     @database_sync_to_async
-    def can_access_trip(self):
+    def load_trip(self):
         try:
-            trip = Trip.objects.get(trip_id=self.trip_id)
-            # Add your access control logic here
-            # For example, check if the user is the driver or passenger
-            return True
+            return Trip.objects.select_related('driver', 'golf_cart').get(
+                trip_id=self.trip_id
+            )
         except ObjectDoesNotExist:
-            return False
+            return None
 
-    @database_sync_to_async
-    def can_update_location(self):
-        try:
-            trip = Trip.objects.get(trip_id=self.trip_id)
-            # Add your authorization logic here
-            # For example, check if the user is the driver
-            return True
-        except ObjectDoesNotExist:
+    async def get_trip(self):
+        # Loaded once per connection and dropped again on trip_update events
+        if self.trip is None:
+            self.trip = await self.load_trip()
+            self.golf_cart_id = self.trip.golf_cart_id if self.trip else None
+        return self.trip
+
+    async def can_access_trip(self):
+        trip = await self.get_trip()
+        if trip is None:
             return False
+        # The token's claims are enough; no user row is loaded
+        user = self.scope.get('user')
+        if user is None or not user.is_authenticated:
+            return False
+        return user.is_staff or account_id(user) in (trip.customer_id, trip.driver_id)
 
-    @database_sync_to_async
-    def update_location(self, location):
-        try:
-            trip = Trip.objects.get(trip_id=self.trip_id)
-            if trip.status != 'Completed':
-                if 'latitude' in location and 'longitude' in location:
-                    trip.driver.location = {
-                        'latitude': location['latitude'],
-                        'longitude': location['longitude']
-                    }
-                    trip.driver.save()
-                    return True
+    async def can_update_location(self):
+        trip = await self.get_trip()
+        if trip is None or trip.status in ['COMPLETED', 'CANCELLED']:
             return False
-        except ObjectDoesNotExist:
+        # Only the assigned driver moves the cart
+        user = self.scope.get('user')
+        return user.is_staff or account_id(user) == trip.driver_id
+
+    async def update_location(self, location):
+        trip = await self.get_trip()
+        if trip is None or trip.status in ['COMPLETED', 'CANCELLED']:
             return False
+        await self.save_location(trip.golf_cart_id, trip.driver_id, location)
+        return True
 
     @database_sync_to_async
-    def get_trip_data(self):
-        try:
-            trip = Trip.objects.get(trip_id=self.trip_id)
-            return {
-                'type': 'trip_state',
-                'status': trip.status,
-                'driver_location': trip.driver.location if trip.driver else None,
-                'start_location': trip.start_location,
-                'end_location': trip.end_location,
-            }
-        except ObjectDoesNotExist:
+    def save_location(self, golf_cart_id, driver_id, location):
+        # Queryset updates skip the signals, so invalidate cached responses here
+        if golf_cart_id:
+            GolfCart.objects.filter(gc_id=golf_cart_id).update(location=location)
+            response_cache.invalidate('golfcart', golf_cart_id)
+        if driver_id:
+            Driver.objects.filter(pk=driver_id).update(last_location_update=timezone.now())
+            response_cache.invalidate('driver', driver_id)
+
+    async def get_trip_data(self):
+        trip = await self.get_trip()
+        if trip is None:
             return None
+        state = location_buffer.get(self.trip_id)
+        if state and state.location:
+            driver_location = state.location
+        else:
+            driver_location = trip.golf_cart.location if trip.golf_cart else None
+        return {
+            'type': 'trip_state',
+            'status': trip.status,
+            'driver_location': driver_location,
+            'start_location': trip.start_location,
+            'end_location': trip.end_location,
+        }
+
+
+class FleetConsumer(MetricsConsumerMixin, ProfilingConsumerMixin, AsyncWebsocketConsumer):
+    message_types = ('subscribe', 'unsubscribe')
+
+    async def connect(self):
+        self.tiles = set()
+        self.bbox = None
+        self.visible = set()
+        # The live fleet feed is for the admin dashboard only
+        user = self.scope.get('user')
+        if user is None or not user.is_authenticated or not user.is_staff:
+            await self.close()
+            return
+        await self.accept()
+
+    async def disconnect(self, close_code):
+        try:
+            for tile in self.tiles:
+                await self.channel_layer.group_discard(tile_group(tile), self.channel_name)
+        except Exception as e:
+            logger.error(f"Error in fleet WebSocket disconnect: {str(e)}")
+
+    async def receive(self, text_data):
+        try:
+            text_data_json = json.loads(text_data)
+            message_type = text_data_json.get('type')
+            self.tag_message(message_type)
+
+            if message_type == 'subscribe':
+                await self.subscribe(text_data_json.get('bbox'))
+            elif message_type == 'unsubscribe':
+                await self.set_tiles(set())
+                self.bbox = None
+                self.visible = set()
+
+        except json.JSONDecodeError:
+            logger.error("Invalid JSON received")
+        except Exception as e:
+            logger.error(f"Error processing fleet WebSocket message: {str(e)}")
+
+    async def subscribe(self, bbox):
+        try:
+            south, west, north, east = (float(value) for value in bbox)
+        except (TypeError, ValueError):
+            await self.send_error('bbox must be [south, west, north, east]')
+            return
+        if south > north or west > east:
+            await self.send_error('bbox must be [south, west, north, east]')
+            return
+
+        tiles = None
+        for precision in TILE_PRECISIONS:
+            tiles = geohash_tiles(south, west, north, east, precision, limit=MAX_TILES)
+            if tiles is not None:
+                break
+        if tiles is None:
+            await self.send_error('Viewport too large')
+            return
+
+        await self.set_tiles(tiles)
+        self.bbox = (south, west, north, east)
+        await database_sync_to_async(cart_index.ensure_loaded)()
+        carts = cart_index.within(south, west, north, east)
+        self.visible = {entry['gc_id'] for entry in carts}
+        await self.send(text_data=json.dumps({
+            'type': 'fleet_snapshot',
+            'carts': [
+                {key: entry[key] for key in ('gc_id', 'latitude', 'longitude', 'type', 'capacity')}
+                for entry in carts
+            ],
+        }))
+
+    async def set_tiles(self, tiles):
+        for tile in self.tiles - tiles:
+            await self.channel_layer.group_discard(tile_group(tile), self.channel_name)
+        for tile in tiles - self.tiles:
+            await self.channel_layer.group_add(tile_group(tile), self.channel_name)
+        self.tiles = tiles
+
+    def in_view(self, delta):
+        south, west, north, east = self.bbox
+        return south <= delta['latitude'] <= north and west <= delta['longitude'] <= east
+
+    async def fleet_update(self, event):
+        if self.bbox is None:
+            return
+        try:
+            carts, removed = [], []
+            for delta in event['carts']:
+                gc_id = delta['gc_id']
+                if delta.get('removed'):
+                    # Moving into another watched tile arrives as a position instead
+                    if gc_id in self.visible and delta.get('moved_to') not in self.tiles:
+                        self.visible.discard(gc_id)
+                        removed.append(gc_id)
+                elif self.in_view(delta):
+                    self.visible.add(gc_id)
+                    carts.append({key: value for key, value in delta.items() if key != 'tile'})
+                elif gc_id in self.visible:
+                    self.visible.discard(gc_id)
+                    removed.append(gc_id)
+            if carts or removed:
+                await self.send(text_data=json.dumps({
+                    'type': 'fleet_update',
+                    'carts': carts,
+                    'removed': removed,
+                }))
+        except Exception as e:
+            logger.error(f"Error sending fleet update: {str(e)}")
+
+    async def send_error(self, message):
+        await self.send(text_data=json.dumps({'type': 'error', 'error': message}))
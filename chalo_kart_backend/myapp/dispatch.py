@@ -0,0 +1,261 @@
+import logging
+import time
+
+from django.db import transaction
+from django.db.models import Sum
+
+from .events import send_trip_update
+from .models import Driver, GolfCart, Trip
+from .response_cache import response_cache
+from .route_optimizer import get_coordinates
+from .spatial import CartIndex
+
+logger = logging.getLogger(__name__)
+
+UNASSIGNABLE = 1e9
+MAX_PICKUP_KM = 5.0
+CANDIDATES_PER_TRIP = 8
+BATCH_SIZE = 200
+
+
+def solve_assignment(cost):
+    """
+    Minimum-cost assignment (Hungarian method, shortest augmenting paths).
+
+    ``cost`` is a list of rows; it may be rectangular. Returns a list with
+    the chosen column for every row, or -1 when the row stays unassigned.
+    """
+    n = len(cost)
+    m = len(cost[0]) if n else 0
+    if not n or not m:
+        return [-1] * n
+    if n > m:
+        transposed = [list(column) for column in zip(*cost)]
+        result = [-1] * n
+        for col, row in enumerate(solve_assignment(transposed)):
+            if row >= 0:
+                result[row] = col
+        return result
+
+    inf = float('inf')
+    u = [0.0] * (n + 1)
+    v = [0.0] * (m + 1)
+    p = [0] * (m + 1)
+    way = [0] * (m + 1)
+    for i in range(1, n + 1):
+        p[0] = i
+        j0 = 0
+        minv = [inf] * (m + 1)
+        used = [False] * (m + 1)
+        while True:
+            used[j0] = True
+            i0 = p[j0]
+            row = cost[i0 - 1]
+            ui0 = u[i0]
+            delta, j1 = inf, 0
+            for j in range(1, m + 1):
+                if not used[j]:
+                    cur = row[j - 1] - ui0 - v[j]
+                    if cur < minv[j]:
+                        minv[j] = cur
+                        way[j] = j0
+                    if minv[j] < delta:
+                        delta, j1 = minv[j], j
+            for j in range(m + 1):
+                if used[j]:
+                    u[p[j]] += delta
+                    v[j] -= delta
+                else:
+                    minv[j] -= delta
+            j0 = j1
+            if p[j0] == 0:
+                break
+        while j0:
+            j1 = way[j0]
+            p[j0] = p[j1]
+            j0 = j1
+
+    result = [-1] * n
+    for j in range(1, m + 1):
+        if p[j]:
+            result[p[j] - 1] = j - 1
+    return result
+
+
+class DispatchEngine:
+    """
+    Matches REQUESTED trips to carts of available drivers in batches.
+
+    Each run collects pending trips, finds candidate carts through the
+    spatial index, solves the pickup-distance assignment and commits all
+    matches in one transaction.
+    """
+
+    def __init__(self, max_pickup_km=MAX_PICKUP_KM,
+                 candidates_per_trip=CANDIDATES_PER_TRIP, batch_size=BATCH_SIZE):
+        self.max_pickup_km = max_pickup_km
+        self.candidates_per_trip = candidates_per_trip
+        self.batch_size = batch_size
+        self.runs = 0
+        self.matched = 0
+        self.busy_seconds = 0.0
+        self.last_latency_ms = 0.0
+
+    def pending_trips(self):
+        return list(
+            Trip.objects.filter(status='REQUESTED', driver__isnull=True)
+            .order_by('created_at')
+            .values('trip_id', 'start_location', 'no_of_seats_booked')[:self.batch_size]
+        )
+
+    def available_carts(self):
+        """
+        Index the carts of available drivers and their remaining seats.
+
+        The index is rebuilt from the database every run so the engine sees
+        positions written by other processes.
+        """
+        available = set(
+            Driver.objects.filter(is_available=True).values_list('id', flat=True)
+        )
+        occupied = dict(
+            Trip.objects.filter(
+                status__in=['ACCEPTED', 'STARTED'],
+                golf_cart__isnull=False
+            ).values('golf_cart_id').annotate(
+                seats=Sum('no_of_seats_booked')
+            ).values_list('golf_cart_id', 'seats')
+        )
+        index, seats = CartIndex(lazy=False), {}
+        for gc_id, location, cart_type, capacity, driver_id in GolfCart.objects.filter(
+            status='ACTIVE', driver__in=available, location__isnull=False
+        ).values_list('gc_id', 'location', 'type', 'capacity', 'driver_id'):
+            taken = occupied.get(gc_id, 0)
+            if cart_type == 'PRIVATE' and taken:
+                continue
+            if capacity - taken > 0 and index.add(
+                gc_id, location, cart_type, capacity, driver_id
+            ):
+                seats[gc_id] = (capacity - taken, driver_id)
+        return index, seats
+
+    def build_cost_matrix(self, trips, index, seats):
+        """Pickup distances in km, ``UNASSIGNABLE`` where a cart cannot serve."""
+        rows, columns, column_index = [], [], {}
+        for trip in trips:
+            row = {}
+            try:
+                latitude, longitude = get_coordinates(trip['start_location'])
+            except ValueError:
+                rows.append(row)
+                continue
+            needed = trip['no_of_seats_booked']
+            candidates = index.nearest(
+                latitude, longitude,
+                k=self.candidates_per_trip,
+                max_distance_km=self.max_pickup_km,
+                predicate=lambda entry: seats.get(entry['gc_id'], (0,))[0] >= needed
+            )
+            for distance, entry in candidates:
+                gc_id = entry['gc_id']
+                if gc_id not in column_index:
+                    column_index[gc_id] = len(columns)
+                    columns.append(gc_id)
+                row[column_index[gc_id]] = distance
+            rows.append(row)
+
+        matrix = [
+            [row.get(j, UNASSIGNABLE) for j in range(len(columns))]
+            for row in rows
+        ]
+        return matrix, columns
+
+    def run_once(self):
+        started = time.perf_counter()
+        trips = self.pending_trips()
+        matches = []
+        if trips:
+            index, seats = self.available_carts()
+            matrix, columns = self.build_cost_matrix(trips, index, seats)
+            for row, (trip, col) in enumerate(zip(trips, solve_assignment(matrix))):
+                if col >= 0 and matrix[row][col] < UNASSIGNABLE:
+                    gc_id = columns[col]
+                    matches.append((trip['trip_id'], gc_id, seats[gc_id][1]))
+            matches = self.commit(matches)
+
+        latency = time.perf_counter() - started
+        self.runs += 1
+        self.matched += len(matches)
+        self.busy_seconds += latency
+        self.last_latency_ms = latency * 1000
+        if trips:
+            logger.info(
+                f"Dispatch matched {len(matches)}/{len(trips)} trips "
+                f"in {self.last_latency_ms:.1f} ms"
+            )
+        return matches
+
+    def commit(self, matches):
+        """
+        Assign the matched trips in one transaction.
+
+        Matches come from a snapshot, so the carts and drivers are locked and
+        checked again first: a match is dropped if the driver went
+        unavailable, the cart left service or changed driver, or another
+        assignment (such as shuttle pooling) took its seats meanwhile.
+        """
+        committed = []
+        if not matches:
+            return committed
+        with transaction.atomic():
+            carts = {
+                cart.gc_id: cart for cart in GolfCart.objects.select_for_update().filter(
+                    gc_id__in={gc_id for _, gc_id, _ in matches}, status='ACTIVE'
+                ).order_by('gc_id')
+            }
+            available = set(
+                Driver.objects.select_for_update().filter(
+                    pk__in={driver_id for _, _, driver_id in matches}, is_available=True
+                ).order_by('pk').values_list('pk', flat=True)
+            )
+            occupied = dict(
+                Trip.objects.filter(
+                    status__in=['ACCEPTED', 'STARTED'], golf_cart_id__in=list(carts)
+                ).values('golf_cart_id').annotate(
+                    seats=Sum('no_of_seats_booked')
+                ).values_list('golf_cart_id', 'seats')
+            )
+            needed = dict(
+                Trip.objects.filter(trip_id__in=[trip_id for trip_id, _, _ in matches])
+                .values_list('trip_id', 'no_of_seats_booked')
+            )
+
+            for trip_id, gc_id, driver_id in matches:
+                cart = carts.get(gc_id)
+                if cart is None or cart.driver_id != driver_id or driver_id not in available:
+                    continue
+                taken, seats = occupied.get(gc_id, 0), needed.get(trip_id, 1)
+                if (cart.type == 'PRIVATE' and taken) or cart.capacity - taken < seats:
+                    continue
+                updated = Trip.objects.filter(
+                    trip_id=trip_id,
+                    status='REQUESTED',
+                    driver__isnull=True
+                ).update(driver_id=driver_id, golf_cart_id=gc_id, status='ACCEPTED')
+                if updated:
+                    occupied[gc_id] = taken + seats
+                    committed.append((trip_id, gc_id, driver_id))
+                    response_cache.invalidate('driver', driver_id)
+                    send_trip_update(
+                        trip_id, status='ACCEPTED', driver_id=driver_id, golf_cart_id=gc_id
+                    )
+        return committed
+
+    def stats(self):
+        return {
+            'runs': self.runs,
+            'matched': self.matched,
+            'last_latency_ms': round(self.last_latency_ms, 2),
+            'avg_latency_ms': round(self.busy_seconds / self.runs * 1000, 2) if self.runs else 0,
+            'matches_per_second': round(self.matched / self.busy_seconds, 1) if self.busy_seconds else 0,
+        }
@@ -0,0 +1,51 @@
+import datetime
+import logging
+from decimal import Decimal
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+TRIP_EVENT_FIELDS = [
+    'status', 'driver_id', 'golf_cart_id', 'route_id', 'fare',
+    'start_time', 'end_time', 'rating', 'no_of_seats_booked',
+]
+
+
+def _json_value(value):
+    if isinstance(value, Decimal):
+        return str(value)
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    return value
+
+
+def trip_snapshot(trip):
+    return {field: getattr(trip, field) for field in TRIP_EVENT_FIELDS}
+
+
+def trip_delta(before, trip):
+    """Fields of ``trip`` that differ from an earlier ``trip_snapshot``."""
+    after = trip_snapshot(trip)
+    return {field: value for field, value in after.items() if before.get(field) != value}
+
+
+def send_trip_update(trip_id, **changes):
+    """
+    Push a compact ``trip_update`` to the trip's group once the current
+    transaction commits, so subscribers never see rolled back changes.
+    """
+    if not changes:
+        return
+    event = {'type': 'trip_update', 'trip_id': trip_id}
+    event.update({field: _json_value(value) for field, value in changes.items()})
+
+    def publish():
+        try:
+            async_to_sync(get_channel_layer().group_send)(f'trip_{trip_id}', event)
+        except Exception as e:
+            logger.error(f"Failed to publish trip update for {trip_id}: {str(e)}")
+
+    transaction.on_commit(publish)
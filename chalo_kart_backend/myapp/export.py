@@ -0,0 +1,81 @@
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+CHUNK_SIZE = 2000
+BUFFER_SIZE = 64 * 1024
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+# Flat projections: the export never builds model instances or nested serializers
+TRIP_EXPORT_FIELDS = [
+    'trip_id', 'customer_id', 'customer__user_name', 'driver_id',
+    'driver__user_name', 'golf_cart_id', 'route_id', 'status', 'fare',
+    'duration', 'no_of_seats_booked', 'start_location', 'end_location',
+    'start_time', 'end_time', 'rating', 'created_at',
+]
+PAYMENT_EXPORT_FIELDS = [
+    'payment_id', 'wallet_id', 'trip_id', 'amount', 'type', 'status',
+    'created_at', 'updated_at',
+]
+
+
+class Echo:
+    """File-like object that hands back what csv.writer writes to it."""
+
+    def write(self, value):
+        return value
+
+
+def column_name(field):
+    return field.replace('__', '_')
+
+
+def csv_value(value):
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, cls=DjangoJSONEncoder)
+    return value
+
+
+def csv_rows(rows, fields):
+    writer = csv.writer(Echo())
+    yield writer.writerow([column_name(field) for field in fields])
+    for row in rows:
+        yield writer.writerow([csv_value(value) for value in row])
+
+
+def ndjson_rows(rows, fields):
+    columns = [column_name(field) for field in fields]
+    for row in rows:
+        yield json.dumps(dict(zip(columns, row)), cls=DjangoJSONEncoder) + '\n'
+
+
+def buffered(pieces, size=BUFFER_SIZE):
+    # One network write per ~64 KiB instead of one per row
+    buffer, length = [], 0
+    for piece in pieces:
+        buffer.append(piece)
+        length += len(piece)
+        if length >= size:
+            yield ''.join(buffer)
+            buffer, length = [], 0
+    if buffer:
+        yield ''.join(buffer)
+
+
+def stream_export(queryset, fields, output, filename, chunk_size=CHUNK_SIZE):
+    """
+    Stream ``queryset`` as CSV or NDJSON with constant memory.
+
+    Rows are read with a server-side ``iterator`` over a ``values_list``
+    projection, ordered by primary key (creation order for generated ids).
+    """
+    rows = queryset.order_by('pk').values_list(*fields).iterator(chunk_size=chunk_size)
+    body = csv_rows(rows, fields) if output == 'csv' else ndjson_rows(rows, fields)
+    response = StreamingHttpResponse(buffered(body), content_type=FORMATS[output])
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{output}"'
+    return response
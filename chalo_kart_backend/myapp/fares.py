@@ -0,0 +1,262 @@
+import threading
+from decimal import ROUND_HALF_UP, Decimal
+from zoneinfo import ZoneInfo
+
+from django.conf import settings
+from django.utils import timezone
+
+from .route_optimizer import AVERAGE_SPEED_KMH, get_coordinates, haversine_km
+from .surge import surge_monitor
+
+CENT = Decimal('0.01')
+KM = Decimal('0.001')
+ONE = Decimal('1')
+ZERO = Decimal('0')
+MINUTES_PER_DAY = 24 * 60
+
+# The default private rates are the original flat ones; deployments add time
+# bands, zones and a student discount through settings.FARE_TARIFF
+DEFAULT_TARIFF = {
+    'timezone': None,
+    'base_fare': '5.00',
+    'per_km': '2.00',
+    'per_minute': '0.50',
+    'minimum_fare': '0.00',
+    'student_discount': '0',
+    # Shuttles charge every booked seat this much instead of the private rates
+    'shuttle_per_seat': {'base_fare': '2.00', 'per_km': '0.80', 'per_minute': '0.20'},
+    # [{'name', 'start': 'HH:MM', 'end': 'HH:MM', 'multiplier'}]; may wrap midnight
+    'time_bands': [],
+    # [{'name', 'south', 'west', 'north', 'east', 'multiplier', 'surcharge'}]; first
+    # zone containing the pickup (else the dropoff) applies
+    'zones': [],
+}
+
+
+def to_minutes(clock):
+    hours, minutes = clock.split(':')
+    return int(hours) * 60 + int(minutes)
+
+
+class Rates:
+    __slots__ = ('base_fare', 'per_km', 'per_minute')
+
+    def __init__(self, config):
+        self.base_fare = Decimal(config['base_fare'])
+        self.per_km = Decimal(config['per_km'])
+        self.per_minute = Decimal(config['per_minute'])
+
+
+class Zone:
+    __slots__ = ('name', 'south', 'west', 'north', 'east', 'multiplier', 'surcharge')
+
+    def __init__(self, config):
+        self.name = config['name']
+        self.south, self.west = float(config['south']), float(config['west'])
+        self.north, self.east = float(config['north']), float(config['east'])
+        self.multiplier = Decimal(config.get('multiplier', '1'))
+        self.surcharge = Decimal(config.get('surcharge', '0'))
+
+    def contains(self, point):
+        return self.south <= point[0] <= self.north and self.west <= point[1] <= self.east
+
+
+class Tariff:
+    """
+    A tariff compiled into lookup tables: Decimal rates, and the time band
+    of every minute of the day, so pricing a trip is arithmetic only.
+    """
+
+    def __init__(self, config):
+        config = {**DEFAULT_TARIFF, **config}
+        self.timezone = ZoneInfo(config['timezone']) if config['timezone'] else None
+        self.private = Rates(config)
+        self.shuttle = Rates({**DEFAULT_TARIFF['shuttle_per_seat'], **config['shuttle_per_seat']})
+        self.minimum_fare = Decimal(config['minimum_fare'])
+        self.student_factor = ONE - Decimal(config['student_discount'])
+        self.zones = [Zone(zone) for zone in config['zones']]
+
+        self.bands = [(None, ONE)]
+        self.band_by_minute = [0] * MINUTES_PER_DAY
+        for band in config['time_bands']:
+            self.bands.append((band['name'], Decimal(band['multiplier'])))
+            start, end = to_minutes(band['start']), to_minutes(band['end'])
+            minutes = range(start, end) if start < end else (
+                list(range(start, MINUTES_PER_DAY)) + list(range(0, end))
+            )
+            for minute in minutes:
+                self.band_by_minute[minute] = len(self.bands) - 1
+
+    def band(self, at):
+        local = timezone.localtime(at, self.timezone) if self.timezone else timezone.localtime(at)
+        return self.bands[self.band_by_minute[local.hour * 60 + local.minute]]
+
+    def zone(self, pickup, dropoff):
+        for point in (pickup, dropoff):
+            if point is None:
+                continue
+            for zone in self.zones:
+                if zone.contains(point):
+                    return zone
+        return None
+
+    def price(self, distance_km, minutes, band, zone=None, seats=1, shuttle=False,
+              student=False, surge=ONE):
+        rates = self.shuttle if shuttle else self.private
+        units = Decimal(seats) if shuttle else ONE
+        base = rates.base_fare * units
+        distance = rates.per_km * distance_km * units
+        time = rates.per_minute * minutes * units
+        band_name, band_multiplier = band
+        multiplier = band_multiplier * surge * (zone.multiplier if zone else ONE)
+        surcharge = zone.surcharge if zone else ZERO
+        subtotal = (base + distance + time) * multiplier + surcharge
+        total = subtotal * self.student_factor if student else subtotal
+        fare = max(total, self.minimum_fare).quantize(CENT, rounding=ROUND_HALF_UP)
+        return {
+            'fare': fare,
+            'distance_km': distance_km,
+            'duration_minutes': minutes,
+            'base_fare': base.quantize(CENT, rounding=ROUND_HALF_UP),
+            'distance_charge': distance.quantize(CENT, rounding=ROUND_HALF_UP),
+            'time_charge': time.quantize(CENT, rounding=ROUND_HALF_UP),
+            'multiplier': multiplier,
+            'time_band': band_name,
+            'surge': surge,
+            'zone': zone.name if zone else None,
+            'zone_surcharge': surcharge.quantize(CENT, rounding=ROUND_HALF_UP),
+            'student_discount': (subtotal - total).quantize(CENT, rounding=ROUND_HALF_UP),
+            'seats': seats,
+            'shuttle': shuttle,
+        }
+
+
+_lock = threading.Lock()
+_compiled = (None, None)
+
+
+def tariff():
+    """The compiled tariff for the current ``FARE_TARIFF`` setting."""
+    global _compiled
+    config = getattr(settings, 'FARE_TARIFF', None) or {}
+    source, compiled = _compiled
+    if source is not config:
+        with _lock:
+            compiled = Tariff(config)
+            _compiled = (config, compiled)
+    return compiled
+
+
+def estimate_minutes(distance_km):
+    return int((distance_km / Decimal(str(AVERAGE_SPEED_KMH)) * 60).to_integral_value(ROUND_HALF_UP))
+
+
+def path_km(points):
+    total = sum(haversine_km(a, b) for a, b in zip(points, points[1:]))
+    return Decimal(str(total)).quantize(KM)
+
+
+def leg(start, end, route=None, duration=None):
+    """``(distance_km, minutes, pickup, dropoff)`` for a trip or a candidate."""
+    try:
+        pickup = get_coordinates(start) if start else None
+        dropoff = get_coordinates(end) if end else None
+    except ValueError:
+        pickup = dropoff = None
+    if route is not None:
+        distance_km = Decimal(route.distance).quantize(KM)
+    elif pickup and dropoff:
+        distance_km = path_km([pickup, dropoff])
+    else:
+        distance_km = ZERO
+    minutes = duration or (route.estimated_duration if route is not None else 0)
+    return distance_km, minutes or estimate_minutes(distance_km), pickup, dropoff
+
+
+def candidate_leg(candidate, routes):
+    """Leg for one ``quote`` candidate: a route id, a list of stops, or two locations."""
+    if not isinstance(candidate, dict):
+        raise ValueError('Each candidate must be an object')
+    if candidate.get('route'):
+        route = routes.get(candidate['route'])
+        if route is None:
+            raise ValueError(f"Unknown route {candidate['route']}")
+        return leg(route.start_coordinates, route.end_coordinates, route)
+    if candidate.get('stops'):
+        points = [get_coordinates(stop) for stop in candidate['stops']]
+        if len(points) < 2:
+            raise ValueError('A candidate needs at least 2 stops')
+        distance_km = path_km(points)
+        return distance_km, estimate_minutes(distance_km), points[0], points[-1]
+    start, end = candidate.get('start_location'), candidate.get('end_location')
+    if not start or not end:
+        raise ValueError('A candidate needs a route, stops, or start and end locations')
+    pickup, dropoff = get_coordinates(start), get_coordinates(end)
+    distance_km = path_km([pickup, dropoff])
+    return distance_km, estimate_minutes(distance_km), pickup, dropoff
+
+
+def as_json(quote):
+    # Decimals as strings, so clients see the exact amounts
+    return {key: str(value) if isinstance(value, Decimal) else value for key, value in quote.items()}
+
+
+def quote_many(candidates, at=None, seats=1, shuttle=False, student=False, surge=False):
+    """
+    Price a batch of candidate trips in one pass.
+
+    Each candidate is ``(distance_km, minutes, pickup, dropoff)``. The
+    tariff, the time band and the rider's flags are looked up once for the
+    whole batch. With ``surge`` each pickup's live multiplier is applied.
+    """
+    compiled = tariff()
+    band = compiled.band(at or timezone.now())
+    return [
+        compiled.price(
+            distance_km, minutes, band, compiled.zone(pickup, dropoff),
+            seats=seats, shuttle=shuttle, student=student,
+            surge=surge_monitor.multiplier(pickup) if surge else ONE
+        )
+        for distance_km, minutes, pickup, dropoff in candidates
+    ]
+
+
+def trip_fares(trips, surge=False):
+    """
+    Decimal fares for ``trips``, in order, from each route (or straight-line
+    distance) and duration.
+
+    Trips are grouped by time band, seats and rider type so each group is
+    priced with a single ``quote_many`` call.
+    """
+    compiled = tariff()
+    groups = {}
+    for index, trip in enumerate(trips):
+        at = trip.start_time or trip.created_at or timezone.now()
+        cart = trip.golf_cart
+        customer = trip.customer
+        key = (
+            compiled.band(at),
+            trip.no_of_seats_booked or 1,
+            cart is not None and cart.type == 'SHUTTLE',
+            customer is not None and customer.is_student,
+        )
+        groups.setdefault(key, (at, []))[1].append(index)
+
+    fares = [None] * len(trips)
+    for (_, seats, shuttle, student), (at, indexes) in groups.items():
+        candidates = [
+            leg(trips[i].start_location, trips[i].end_location, trips[i].route, trips[i].duration)
+            for i in indexes
+        ]
+        quotes = quote_many(candidates, at=at, seats=seats, shuttle=shuttle,
+                            student=student, surge=surge)
+        for i, quote in zip(indexes, quotes):
+            fares[i] = quote['fare']
+    return fares
+
+
+def trip_fare(trip, surge=False):
+    """Decimal fare for ``trip`` from its route (or straight-line distance) and duration."""
+    fare, = trip_fares([trip], surge=surge)
+    return fare
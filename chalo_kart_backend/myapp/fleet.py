@@ -0,0 +1,130 @@
+import asyncio
+import logging
+import threading
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+
+from .spatial import cart_index, geohash
+from .surge import surge_monitor
+
+logger = logging.getLogger(__name__)
+
+# Viewers subscribe at the finest precision that keeps their viewport
+# under MAX_TILES tiles, so every change is published at each precision.
+TILE_PRECISIONS = (5, 4)
+MAX_TILES = 32
+FLUSH_INTERVAL = 1.0
+
+
+def tile_group(tile):
+    return f'fleet_{tile}'
+
+
+def cart_delta(entry, tile):
+    return {
+        'gc_id': entry['gc_id'],
+        'latitude': entry['latitude'],
+        'longitude': entry['longitude'],
+        'type': entry['type'],
+        'capacity': entry['capacity'],
+        'tile': tile,
+    }
+
+
+class FleetPublisher:
+    """
+    Collects cart position changes per geohash tile and sends each tile
+    group one batched ``fleet_update`` per flush interval.
+
+    Sync request threads record and flush (after commit) alongside the event
+    loop, so ``pending`` and ``_scheduled`` are only touched under ``_lock``.
+    """
+
+    def __init__(self, interval=FLUSH_INTERVAL):
+        self.interval = interval
+        self.pending = {}
+        self._scheduled = False
+        self._lock = threading.Lock()
+
+    def record(self, gc_id, entry, previous):
+        changes = []
+        for precision in TILE_PRECISIONS:
+            new_tile = geohash(entry['latitude'], entry['longitude'], precision) if entry else None
+            old_tile = (
+                geohash(previous['latitude'], previous['longitude'], precision)
+                if previous else None
+            )
+            if old_tile and old_tile != new_tile:
+                changes.append((old_tile, {'gc_id': gc_id, 'removed': True, 'moved_to': new_tile}))
+            if new_tile:
+                changes.append((new_tile, cart_delta(entry, new_tile)))
+        with self._lock:
+            for tile, delta in changes:
+                self.pending.setdefault(tile, {})[gc_id] = delta
+
+    def publish(self):
+        """Flush on the running event loop's schedule, or after commit from sync code."""
+        with self._lock:
+            if not self.pending:
+                return
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                loop = None
+            if loop is not None:
+                if self._scheduled:
+                    return
+                self._scheduled = True
+        if loop is None:
+            transaction.on_commit(lambda: async_to_sync(self.flush)())
+            return
+        loop.call_later(self.interval, lambda: asyncio.ensure_future(self.flush()))
+
+    async def flush(self):
+        with self._lock:
+            self._scheduled = False
+            pending, self.pending = self.pending, {}
+        channel_layer = get_channel_layer()
+        for tile, deltas in pending.items():
+            try:
+                await channel_layer.group_send(tile_group(tile), {
+                    'type': 'fleet_update',
+                    'carts': list(deltas.values()),
+                })
+            except Exception as e:
+                logger.error(f"Error publishing fleet update for tile {tile}: {str(e)}")
+
+
+fleet_publisher = FleetPublisher()
+
+
+def _publish_change(gc_id, previous):
+    entry = cart_index.get(gc_id)
+    if entry == previous:
+        return
+    fleet_publisher.record(gc_id, entry, previous)
+    fleet_publisher.publish()
+
+
+def move_cart(gc_id, location):
+    """Move an indexed cart and tell fleet viewers about it."""
+    previous = cart_index.get(gc_id)
+    cart_index.move(gc_id, location)
+    entry = cart_index.get(gc_id)
+    if entry and entry['driver_id']:
+        surge_monitor.move_driver(entry['driver_id'], (entry['latitude'], entry['longitude']))
+    _publish_change(gc_id, previous)
+
+
+def sync_cart(cart):
+    previous = cart_index.get(cart.gc_id)
+    cart_index.update_cart(cart)
+    _publish_change(cart.gc_id, previous)
+
+
+def drop_cart(gc_id):
+    previous = cart_index.get(gc_id)
+    cart_index.remove(gc_id)
+    _publish_change(gc_id, previous)
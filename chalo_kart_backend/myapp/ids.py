@@ -0,0 +1,196 @@
+import logging
+import os
+import socket
+import tempfile
+import threading
+import time
+import zlib
+from pathlib import Path
+
+from django.conf import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+# Snowflake layout: 41 bits of milliseconds since EPOCH_MS, 10 bits of node,
+# 12 bits of per-millisecond sequence. Encoded as 13 Crockford base32
+# characters, so string order is creation order.
+EPOCH_MS = 1704067200000  # 2024-01-01T00:00:00Z
+NODE_BITS = 10
+SEQUENCE_BITS = 12
+MAX_NODE = (1 << NODE_BITS) - 1
+MAX_SEQUENCE = (1 << SEQUENCE_BITS) - 1
+# The node is a host id in the high bits and a worker slot, leased by each
+# process on the host, in the low bits
+WORKER_BITS = 5
+MAX_HOST = (1 << (NODE_BITS - WORKER_BITS)) - 1
+MAX_WORKER = (1 << WORKER_BITS) - 1
+ID_LENGTH = 13
+ALPHABET = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+
+logger = logging.getLogger(__name__)
+
+_lease_lock = threading.Lock()
+_lease = None  # (pid, slot, open lock file)
+
+
+def host_node():
+    """Host id from ``ID_GENERATOR_NODE`` (setting or env), else from the hostname."""
+    node = getattr(settings, 'ID_GENERATOR_NODE', None) or os.environ.get('ID_GENERATOR_NODE')
+    if node is not None:
+        node = int(node)
+        if not 0 <= node <= MAX_HOST:
+            raise ValueError(f"ID_GENERATOR_NODE must be between 0 and {MAX_HOST}")
+        return node
+    return zlib.crc32(socket.gethostname().encode()) & MAX_HOST
+
+
+def slot_dir():
+    return Path(
+        getattr(settings, 'ID_GENERATOR_SLOT_DIR', None)
+        or os.environ.get('ID_GENERATOR_SLOT_DIR')
+        or Path(tempfile.gettempdir()) / 'chalo_kart_id_slots'
+    )
+
+
+def worker_slot():
+    """
+    This process's worker slot on the host.
+
+    A slot is held as an exclusive ``flock`` on its file for the life of the
+    process, so the OS frees it when the process exits or crashes and no
+    two live processes on a host share one.
+
+    Without ``fcntl`` (Windows) the slot falls back to the low bits of the
+    pid, and two processes whose pids agree in those bits share a node and
+    can mint the same id in the same millisecond. Run a single worker per
+    ``ID_GENERATOR_NODE`` there.
+    """
+    global _lease
+    with _lease_lock:
+        pid = os.getpid()
+        if _lease is not None:
+            if _lease[0] == pid:
+                return _lease[1]
+            # Inherited over fork; the parent keeps its own lock
+            if _lease[2] is not None:
+                _lease[2].close()
+            _lease = None
+        if fcntl is None:
+            slot = pid & MAX_WORKER
+            logger.warning(
+                f"fcntl is unavailable; using worker slot {slot} from pid {pid}. "
+                f"Processes whose pids match in the low {WORKER_BITS} bits can "
+                f"generate duplicate ids; give each one its own ID_GENERATOR_NODE"
+            )
+            _lease = (pid, slot, None)
+            return slot
+
+        directory = slot_dir()
+        directory.mkdir(parents=True, exist_ok=True)
+        for slot in range(MAX_WORKER + 1):
+            lock_file = open(directory / f'slot-{slot}.lock', 'a')
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock_file.close()
+                continue
+            _lease = (pid, slot, lock_file)
+            return slot
+    raise RuntimeError(f"All {MAX_WORKER + 1} id generator slots in {directory} are taken")
+
+
+def default_node():
+    return (host_node() << WORKER_BITS) | worker_slot()
+
+
+def encode(value):
+    chars = []
+    for _ in range(ID_LENGTH):
+        value, index = divmod(value, 32)
+        chars.append(ALPHABET[index])
+    return ''.join(reversed(chars))
+
+
+def decode(text):
+    value = 0
+    for char in text.upper():
+        value = value * 32 + ALPHABET.index(char)
+    return value
+
+
+class IdGenerator:
+    """
+    Thread-safe, per-process monotonic id source.
+
+    If the clock steps backwards or a millisecond runs out of sequence
+    numbers, ids keep counting from the last timestamp handed out instead
+    of repeating one. A forked child picks a fresh node on first use.
+    """
+
+    def __init__(self, node=None):
+        self._fixed_node = node
+        self._lock = threading.Lock()
+        self._pid = None
+        self.node = node
+        self.last_ms = 0
+        self.sequence = 0
+
+    def next_int(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                self._pid = os.getpid()
+                self.node = self._fixed_node if self._fixed_node is not None else default_node()
+                self.last_ms, self.sequence = 0, 0
+
+            now = int(time.time() * 1000) - EPOCH_MS
+            if now > self.last_ms:
+                self.last_ms, self.sequence = now, 0
+            elif self.sequence < MAX_SEQUENCE:
+                self.sequence += 1
+            else:
+                self.last_ms, self.sequence = self.last_ms + 1, 0
+            return (
+                (self.last_ms << (NODE_BITS + SEQUENCE_BITS))
+                | (self.node << SEQUENCE_BITS)
+                | self.sequence
+            )
+
+    def next_id(self, prefix=''):
+        return f'{prefix}{encode(self.next_int())}'
+
+
+def parse(value):
+    """Split an id (with or without prefix) into ``(unix_ms, node, sequence)``."""
+    number = decode(value[-ID_LENGTH:])
+    return (
+        (number >> (NODE_BITS + SEQUENCE_BITS)) + EPOCH_MS,
+        (number >> SEQUENCE_BITS) & MAX_NODE,
+        number & MAX_SEQUENCE,
+    )
+
+
+generator = IdGenerator()
+
+
+def new_id(prefix=''):
+    return generator.next_id(prefix)
+
+
+# Field defaults; module-level so migrations can reference them
+def new_payment_id():
+    return new_id('PAY_')
+
+
+def new_trip_id():
+    return new_id('TRIP_')
+
+
+def new_route_id():
+    return new_id('ROUTE_')
+
+
+def new_wallet_id():
+    return new_id('WALLET_')
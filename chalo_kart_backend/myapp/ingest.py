@@ -0,0 +1,238 @@
+import collections
+import json
+import time
+from decimal import Decimal
+
+from django.db import DatabaseError, transaction
+from rest_framework import serializers
+
+from .fares import trip_fares
+from .response_cache import response_cache
+from .rollups import adjust_payment_rollup, earnings_key, payment_key, refresh_driver_earnings
+from .serializers import PaymentImportSerializer, TripImportSerializer
+
+CHUNK_SIZE = 500
+MAX_REPORTED_ERRORS = 100
+
+
+class PrefetchedQueryset:
+    """
+    Stands in for a related field's queryset while one chunk is validated.
+
+    Every primary key in the chunk is loaded with a single ``in_bulk`` and
+    lookups are answered from memory, so validating N rows costs one
+    query per related field instead of N.
+    """
+
+    def __init__(self, queryset, values):
+        self.model = queryset.model
+        pk = self.model._meta.pk
+        keys = set()
+        for value in values:
+            try:
+                keys.add(pk.to_python(value))
+            except Exception:
+                continue
+        self.objects = queryset.in_bulk(keys) if keys else {}
+
+    def get(self, pk):
+        try:
+            return self.objects[self.model._meta.pk.to_python(pk)]
+        except KeyError:
+            raise self.model.DoesNotExist
+        except Exception:
+            raise ValueError(pk)
+
+
+def read_ndjson(lines):
+    """Yield ``(line_number, row, error)`` for each non-blank line."""
+    for number, line in enumerate(lines, start=1):
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield number, None, f'Invalid JSON: {e}'
+            continue
+        if not isinstance(row, dict):
+            yield number, None, 'Each line must be a JSON object'
+            continue
+        yield number, row, None
+
+
+def chunked(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class BulkIngestor:
+    """
+    Validates NDJSON rows with a model serializer and writes them with
+    ``bulk_create``, one transaction per chunk.
+
+    Subclasses set ``serializer_class`` and may override ``prepare`` (a
+    pass over the chunk's unsaved instances) and ``after_create``.
+
+    Rows may carry their own primary key and ``created_at``; both are kept,
+    so imported history lands on its original dates.
+    """
+
+    serializer_class = None
+    chunk_size = CHUNK_SIZE
+
+    def __init__(self, chunk_size=None):
+        if chunk_size:
+            self.chunk_size = chunk_size
+        self.model = self.serializer_class.Meta.model
+        self.rows = 0
+        self.created = 0
+        self.failed = 0
+        self.errors = []
+        self.started = None
+
+    def add_error(self, line, errors):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': line, 'errors': errors})
+
+    def related_querysets(self, serializer, rows):
+        for name, field in serializer.fields.items():
+            if isinstance(field, serializers.PrimaryKeyRelatedField) and not field.read_only:
+                values = [row[name] for row in rows if row.get(name) is not None]
+                field.queryset = PrefetchedQueryset(field.queryset, values)
+
+    def validate(self, chunk):
+        numbers, rows = [], []
+        for number, row, error in chunk:
+            if error:
+                self.add_error(number, {'non_field_errors': [error]})
+            else:
+                numbers.append(number)
+                rows.append(row)
+        if not rows:
+            return []
+
+        # One serializer validates the whole chunk, so its fields are built once
+        serializer = self.serializer_class()
+        self.related_querysets(serializer, rows)
+        valid = []
+        for number, row in zip(numbers, rows):
+            try:
+                data = serializer.run_validation(row)
+            except serializers.ValidationError as e:
+                self.add_error(number, e.detail)
+            else:
+                valid.append((number, self.model(**data)))
+        return self.drop_existing(valid)
+
+    def drop_existing(self, valid):
+        """Report rows whose primary key is already used, in the database or earlier in the chunk."""
+        pk = self.model._meta.pk
+        taken = set(
+            self.model.objects.filter(pk__in=[instance.pk for _, instance in valid])
+            .values_list('pk', flat=True)
+        )
+        kept = []
+        for number, instance in valid:
+            if instance.pk in taken:
+                self.add_error(number, {pk.name: [f'{instance.pk} already exists']})
+                continue
+            taken.add(instance.pk)
+            kept.append((number, instance))
+        return kept
+
+    def prepare(self, instances):
+        pass
+
+    def after_create(self, instances):
+        pass
+
+    def write(self, valid):
+        instances = [instance for _, instance in valid]
+        self.prepare(instances)
+        # bulk_create stamps auto_now_add fields with the import time
+        supplied = [(instance, instance.created_at) for instance in instances if instance.created_at]
+        try:
+            with transaction.atomic():
+                self.model.objects.bulk_create(instances, batch_size=self.chunk_size)
+                if supplied:
+                    for instance, created_at in supplied:
+                        instance.created_at = created_at
+                    self.model.objects.bulk_update(
+                        [instance for instance, _ in supplied], ['created_at'],
+                        batch_size=self.chunk_size
+                    )
+                self.after_create(instances)
+        except DatabaseError as e:
+            for number, _ in valid:
+                self.add_error(number, {'non_field_errors': [f'Database error: {e}']})
+            return
+        self.created += len(instances)
+
+    def run(self, lines):
+        self.started = time.perf_counter()
+        for chunk in chunked(read_ndjson(lines), self.chunk_size):
+            self.rows += len(chunk)
+            valid = self.validate(chunk)
+            if valid:
+                self.write(valid)
+        return self.report()
+
+    def report(self):
+        elapsed = time.perf_counter() - self.started if self.started else 0
+        return {
+            'rows': self.rows,
+            'created': self.created,
+            'failed': self.failed,
+            'seconds': round(elapsed, 3),
+            'rows_per_second': round(self.rows / elapsed, 1) if elapsed else None,
+            'errors': self.errors,
+        }
+
+
+class TripIngestor(BulkIngestor):
+    serializer_class = TripImportSerializer
+
+    def prepare(self, trips):
+        # Routes were attached during validation, so no query per trip here
+        for trip, fare in zip(trips, trip_fares(trips)):
+            trip.fare = fare
+
+    def after_create(self, trips):
+        # bulk_create skips signals; refresh each touched driver-day once
+        for key in {earnings_key(trip) for trip in trips} - {None}:
+            refresh_driver_earnings(*key)
+        # and the cache invalidation the Trip post_save receiver would do
+        drivers = {trip.driver_id for trip in trips} - {None}
+        if drivers:
+            response_cache.invalidate('driver', *drivers)
+
+
+class PaymentIngestor(BulkIngestor):
+    serializer_class = PaymentImportSerializer
+
+    def after_create(self, payments):
+        # Imported history is recorded as-is; it does not move wallet balances.
+        # Each payment counts towards the day it was originally made
+        totals = collections.defaultdict(lambda: [0, Decimal('0')])
+        for payment in payments:
+            total = totals[payment_key(payment)]
+            total[0] += 1
+            total[1] += payment.amount
+        for key, (count, amount) in totals.items():
+            adjust_payment_rollup(key, count, amount)
+
+
+INGESTORS = {
+    'trips': TripIngestor,
+    'payments': PaymentIngestor,
+}
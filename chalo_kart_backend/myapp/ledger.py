@@ -0,0 +1,78 @@
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Payment, Wallet
+
+
+class InsufficientFunds(ValueError):
+    pass
+
+
+class IdempotencyConflict(ValueError):
+    """An idempotency key was reused for a different amount or payment type."""
+
+
+def apply_wallet_change(wallet_id, amount, payment_type, trip=None, idempotency_key=None):
+    """
+    Move ``amount`` into (ADD) or out of (DEDUCT) a wallet and record the payment.
+
+    The balance changes with a single conditional ``UPDATE ... SET
+    current_balance = current_balance +/- amount`` in the same transaction
+    as the payment insert, so concurrent writers never lose an update and
+    a deduction never takes the balance below zero.
+
+    A repeated ``idempotency_key`` on the same wallet returns the payment
+    recorded the first time instead of moving money again, and raises
+    ``IdempotencyConflict`` if the amount or type differ. Keys are scoped
+    to the wallet. Returns ``(payment, created)``.
+    """
+    amount = Decimal(amount)
+    if amount <= 0:
+        raise ValueError("Amount must be positive")
+    if payment_type not in ('ADD', 'DEDUCT'):
+        raise ValueError(f"Unknown payment type {payment_type}")
+
+    try:
+        with transaction.atomic():
+            # Write first: the row lock is taken before anything is read
+            rows = Wallet.objects.filter(pk=wallet_id)
+            if payment_type == 'DEDUCT':
+                rows = rows.filter(current_balance__gte=amount)
+                delta = -amount
+            else:
+                delta = amount
+            if not rows.update(current_balance=F('current_balance') + delta,
+                               last_updated=timezone.now()):
+                if not Wallet.objects.filter(pk=wallet_id).exists():
+                    raise Wallet.DoesNotExist(f"Wallet {wallet_id} not found")
+                raise InsufficientFunds("Insufficient balance")
+
+            payment = Payment.objects.create(
+                wallet_id=wallet_id,
+                trip=trip,
+                amount=amount,
+                type=payment_type,
+                status='COMPLETED',
+                idempotency_key=idempotency_key
+            )
+            return payment, True
+    except (IntegrityError, InsufficientFunds):
+        # A replayed key rolls back its own balance change above
+        if idempotency_key:
+            existing = Payment.objects.filter(
+                wallet_id=wallet_id, idempotency_key=idempotency_key
+            ).first()
+            if existing:
+                if existing.amount != amount or existing.type != payment_type:
+                    raise IdempotencyConflict(
+                        f"Idempotency key {idempotency_key} was used for a different payment"
+                    )
+                return existing, False
+        raise
+
+
+def wallet_balance(wallet_id):
+    return Wallet.objects.values_list('current_balance', flat=True).get(pk=wallet_id)
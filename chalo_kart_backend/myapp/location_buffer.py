@@ -0,0 +1,79 @@
+import threading
+import time
+
+from .route_optimizer import get_coordinates, haversine_km
+
+FLUSH_INTERVAL = 10.0
+FLUSH_DISTANCE_KM = 0.05
+BROADCAST_INTERVAL = 1.0
+
+
+class TripLocation:
+    """Latest known position of one trip and when it was last persisted/sent."""
+
+    def __init__(self, trip_id):
+        self.trip_id = trip_id
+        self.location = None
+        self.coordinates = None
+        self.received_at = 0.0
+        self.flushed_coordinates = None
+        self.flushed_at = 0.0
+        self.broadcast_at = 0.0
+        self.broadcast_pending = False
+        self.flush_pending = False
+        self.updates = 0
+
+    @property
+    def dirty(self):
+        return self.coordinates is not None and self.coordinates != self.flushed_coordinates
+
+    def due_for_flush(self, now, interval=FLUSH_INTERVAL, distance_km=FLUSH_DISTANCE_KM):
+        if not self.dirty:
+            return False
+        if self.flushed_coordinates is None or now - self.flushed_at >= interval:
+            return True
+        return haversine_km(self.flushed_coordinates, self.coordinates) >= distance_km
+
+    def mark_flushed(self, now, coordinates=None):
+        self.flushed_coordinates = coordinates or self.coordinates
+        self.flushed_at = now
+
+    def broadcast_delay(self, now, interval=BROADCAST_INTERVAL):
+        """Seconds to wait before the next broadcast is allowed (0 = send now)."""
+        return max(0.0, self.broadcast_at + interval - now)
+
+
+class LocationBuffer:
+    """
+    Per-process buffer of the latest location per trip.
+
+    Bursts of updates overwrite each other in memory; the consumer only
+    writes to the database when a position is due for flushing, and drops
+    the trip once its sender disconnects or the trip ends.
+    """
+
+    def __init__(self):
+        self._trips = {}
+        self._lock = threading.Lock()
+
+    def record(self, trip_id, location, now=None):
+        coordinates = get_coordinates(location)
+        with self._lock:
+            state = self._trips.get(trip_id)
+            if state is None:
+                state = self._trips[trip_id] = TripLocation(trip_id)
+        state.location = {'latitude': coordinates[0], 'longitude': coordinates[1]}
+        state.coordinates = coordinates
+        state.received_at = time.monotonic() if now is None else now
+        state.updates += 1
+        return state
+
+    def get(self, trip_id):
+        return self._trips.get(trip_id)
+
+    def discard(self, trip_id):
+        with self._lock:
+            return self._trips.pop(trip_id, None)
+
+
+location_buffer = LocationBuffer()
@@ -0,0 +1,26 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from myapp.rollups import backfill_driver_earnings, backfill_payment_rollups
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the pre-aggregated report tables from the raw trip and payment history'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help='Only rebuild days from this date (YYYY-MM-DD)')
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            try:
+                since = datetime.date.fromisoformat(options['since'])
+            except ValueError:
+                raise CommandError('--since must be a YYYY-MM-DD date')
+
+        rows = backfill_driver_earnings(since)
+        self.stdout.write(f"Driver earnings: {rows} driver-day rows")
+
+        rows = backfill_payment_rollups(since)
+        self.stdout.write(f"Payments: {rows} wallet-day rows")
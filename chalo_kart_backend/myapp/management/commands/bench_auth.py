@@ -0,0 +1,77 @@
+import base64
+import json
+import statistics
+import time
+
+from django.contrib.auth.models import User as AuthUser
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authentication import BasicAuthentication
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from myapp.authentication import SignedTokenAuthentication
+from myapp.models import Customer
+from myapp.tokens import issue_tokens
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare the per-request cost of HTTP Basic authentication with '
+        'signed access tokens'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=50)
+        parser.add_argument('--token-requests', type=int, default=20000)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                report = self.run(options['requests'], options['token_requests'])
+                raise Rollback
+        except Rollback:
+            pass
+        self.stdout.write(json.dumps(report, indent=2))
+
+    def run(self, basic_requests, token_requests):
+        password = 'bench-password'
+        AuthUser.objects.create_user('_auth_bench', 'auth-bench@example.com', password)
+        customer = Customer.objects.create(
+            user_name='auth bench', email='auth-bench@example.com', password=password
+        )
+        credentials = base64.b64encode(f'_auth_bench:{password}'.encode()).decode()
+        access = issue_tokens(customer)['access']
+
+        factory = APIRequestFactory()
+        basic = factory.get('/api/trips/', HTTP_AUTHORIZATION=f'Basic {credentials}')
+        bearer = factory.get('/api/trips/', HTTP_AUTHORIZATION=f'Bearer {access}')
+
+        def measure(authenticator, request, count):
+            timings = []
+            with CaptureQueriesContext(connection) as captured:
+                for _ in range(count):
+                    started = time.perf_counter()
+                    user, _ = authenticator.authenticate(Request(request))
+                    timings.append((time.perf_counter() - started) * 1e6)
+            assert user.is_authenticated
+            return {
+                'requests': count,
+                'median_us': round(statistics.median(timings), 1),
+                'p99_us': round(sorted(timings)[int(count * 0.99) - 1], 1),
+                'queries_per_request': len(captured) / count,
+            }
+
+        report = {
+            'basic': measure(BasicAuthentication(), basic, basic_requests),
+            'signed_token': measure(SignedTokenAuthentication(), bearer, token_requests),
+        }
+        report['speedup'] = round(
+            report['basic']['median_us'] / report['signed_token']['median_us'], 1
+        )
+        return report
@@ -0,0 +1,159 @@
+import asyncio
+import json
+import multiprocessing
+import statistics
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from myapp.channel_layers import BatchingChannelLayer
+from myapp.redis_standin import PubSubServer
+
+GROUP = 'trip_bench'
+BACKENDS = {
+    'redis': 'channels_redis.core.RedisChannelLayer',
+    'redis-pubsub': 'channels_redis.pubsub.RedisPubSubChannelLayer',
+}
+
+
+def make_layer(redis_url, backend, batch_window):
+    return BatchingChannelLayer(
+        backend=BACKENDS[backend],
+        config={'hosts': [redis_url]},
+        batch_window=batch_window,
+    )
+
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))], 3)
+
+
+def run_worker(index, redis_url, backend, expected, timeout, ready, results):
+    """Simulates one ASGI worker process with a socket subscribed to the group."""
+
+    async def consume():
+        layer = make_layer(redis_url, backend, 0)
+        channel = await layer.new_channel()
+        await layer.group_add(GROUP, channel)
+        ready.put(index)
+        latencies = []
+        deadline = time.time() + timeout
+        while len(latencies) < expected:
+            try:
+                message = await asyncio.wait_for(
+                    layer.receive(channel), max(0.01, deadline - time.time())
+                )
+            except asyncio.TimeoutError:
+                break
+            if message.get('type') == 'location_update':
+                latencies.append((time.time() - message['sent_at']) * 1000)
+        await layer.group_discard(GROUP, channel)
+        await layer.flush()
+        return latencies
+
+    latencies = asyncio.run(consume())
+    results.put((index, latencies))
+
+
+class Command(BaseCommand):
+    help = 'Measure location update fan-out across N worker processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--messages', type=int, default=500)
+        parser.add_argument('--rate', type=float, default=200,
+                            help='Location updates published per second')
+        parser.add_argument('--redis-url',
+                            help='Redis to use; starts the local stand-in when omitted')
+        parser.add_argument('--backend', choices=sorted(BACKENDS), default='redis-pubsub')
+        parser.add_argument('--batch-window', type=float, default=0.005)
+        parser.add_argument('--timeout', type=float, default=30)
+
+    def handle(self, *args, **options):
+        redis_url = options['redis_url']
+        if not redis_url:
+            if options['backend'] != 'redis-pubsub':
+                raise CommandError('The stand-in only supports --backend redis-pubsub')
+            redis_url = self.start_standin()
+
+        context = multiprocessing.get_context('spawn')
+        ready, results = context.Queue(), context.Queue()
+        workers = [
+            context.Process(target=run_worker, args=(
+                index, redis_url, options['backend'], options['messages'],
+                options['timeout'], ready, results
+            ))
+            for index in range(options['workers'])
+        ]
+        for worker in workers:
+            worker.start()
+        for _ in workers:
+            ready.get(timeout=options['timeout'])
+
+        publish_seconds = asyncio.run(self.publish(redis_url, options))
+
+        received = dict(results.get(timeout=options['timeout'] * 2) for _ in workers)
+        for worker in workers:
+            worker.join()
+
+        latencies = [value for values in received.values() for value in values]
+        expected = options['messages'] * options['workers']
+        report = {
+            'backend': options['backend'],
+            'redis_url': redis_url,
+            'workers': options['workers'],
+            'published': options['messages'],
+            'publish_seconds': round(publish_seconds, 3),
+            'delivered': len(latencies),
+            'delivery_ratio': round(len(latencies) / expected, 4) if expected else 0,
+            'per_worker': {index: len(values) for index, values in sorted(received.items())},
+            'latency_ms': {
+                'mean': round(statistics.mean(latencies), 3) if latencies else None,
+                'p50': percentile(latencies, 0.50),
+                'p95': percentile(latencies, 0.95),
+                'p99': percentile(latencies, 0.99),
+                'max': round(max(latencies), 3) if latencies else None,
+            },
+        }
+        self.stdout.write(json.dumps(report, indent=2))
+
+    async def publish(self, redis_url, options):
+        layer = make_layer(redis_url, options['backend'], options['batch_window'])
+        interval = 1.0 / options['rate'] if options['rate'] else 0
+        started = time.time()
+        pending = []
+        for sequence in range(options['messages']):
+            pending.append(asyncio.ensure_future(layer.group_send(GROUP, {
+                'type': 'location_update',
+                'location': {'latitude': 26.5, 'longitude': 80.3},
+                'sequence': sequence,
+                'sent_at': time.time(),
+            })))
+            if interval:
+                await asyncio.sleep(interval)
+        await asyncio.gather(*pending)
+        elapsed = time.time() - started
+        # Give the backend a moment to deliver before tearing down connections
+        await asyncio.sleep(0.5)
+        await layer.flush()
+        return elapsed
+
+    def start_standin(self):
+        server = PubSubServer(port=0)
+        started = threading.Event()
+
+        def serve():
+            async def run():
+                await server.start()
+                started.set()
+                await server.serve_forever()
+            asyncio.run(run())
+
+        threading.Thread(target=serve, daemon=True).start()
+        if not started.wait(5):
+            raise CommandError('Redis stand-in did not start')
+        return f"redis://{server.host}:{server.port}"
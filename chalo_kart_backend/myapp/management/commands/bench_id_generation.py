@@ -0,0 +1,119 @@
+import json
+import multiprocessing
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from myapp.ids import IdGenerator
+
+
+class Rollback(Exception):
+    pass
+
+
+def generate_in_process(node, count):
+    generator = IdGenerator(node=node)
+    return [generator.next_id('PAY_') for _ in range(count)]
+
+
+class Command(BaseCommand):
+    help = (
+        'Generate ids from many threads and processes, check they are unique '
+        'and ordered, and measure Payment insert throughput'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--processes', type=int, default=4)
+        parser.add_argument('--count', type=int, default=20000,
+                            help='Ids per thread/process')
+        parser.add_argument('--inserts', type=int, default=20000,
+                            help='Payments to insert (in a rolled-back transaction)')
+
+    def handle(self, *args, **options):
+        report = {
+            'threads': self.bench_threads(options['threads'], options['count']),
+            'processes': self.bench_processes(options['processes'], options['count']),
+            'inserts': self.bench_inserts(options['inserts']),
+        }
+        self.stdout.write(json.dumps(report, indent=2))
+        failures = [name for name, result in report.items() if not result['ok']]
+        if failures:
+            raise CommandError(f"Id generation failed checks: {', '.join(failures)}")
+
+    def bench_threads(self, threads, count):
+        generator = IdGenerator()
+        results = [None] * threads
+
+        def worker(index):
+            ids = [generator.next_id('PAY_') for _ in range(count)]
+            results[index] = ids
+
+        workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+        started = time.perf_counter()
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        total = threads * count
+        ordered = all(ids == sorted(ids) for ids in results)
+        unique = len({value for ids in results for value in ids})
+        return {
+            'ids': total,
+            'unique': unique,
+            'per_thread_ordered': ordered,
+            'ids_per_second': round(total / elapsed),
+            'ok': unique == total and ordered,
+        }
+
+    def bench_processes(self, processes, count):
+        started = time.perf_counter()
+        with multiprocessing.get_context('spawn').Pool(processes) as pool:
+            results = pool.starmap(generate_in_process, [(node, count) for node in range(processes)])
+        elapsed = time.perf_counter() - started
+
+        total = processes * count
+        unique = len({value for ids in results for value in ids})
+        return {
+            'ids': total,
+            'unique': unique,
+            'seconds_including_spawn': round(elapsed, 3),
+            'ok': unique == total,
+        }
+
+    def bench_inserts(self, inserts):
+        # Imported here: spawned id workers load this module before Django is set up
+        from myapp.models import Customer, Payment, Wallet
+
+        result = {}
+        try:
+            with transaction.atomic():
+                customer = Customer.objects.create(
+                    user_name='id bench', email=f'id-bench-{time.time_ns()}@example.com',
+                    password='pbkdf2_bench'
+                )
+                wallet = Wallet.objects.create(user=customer)
+                started = time.perf_counter()
+                # Payments are built one by one so every row goes through the field default
+                Payment.objects.bulk_create(
+                    [Payment(wallet=wallet, amount=1, type='ADD', status='COMPLETED')
+                     for _ in range(inserts)],
+                    batch_size=1000
+                )
+                elapsed = time.perf_counter() - started
+                stored = Payment.objects.filter(wallet=wallet).count()
+                result = {
+                    'database': connection.vendor,
+                    'rows': inserts,
+                    'stored': stored,
+                    'inserts_per_second': round(inserts / elapsed),
+                    'ok': stored == inserts,
+                }
+                raise Rollback
+        except Rollback:
+            pass
+        return result
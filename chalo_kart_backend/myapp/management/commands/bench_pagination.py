@@ -0,0 +1,90 @@
+import json
+import statistics
+import time
+
+from django.contrib.auth.models import User as AuthUser
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from myapp.models import Customer, Trip
+from myapp.pagination import KeysetPagination
+from myapp.views import TripViewSet
+
+
+class Rollback(Exception):
+    pass
+
+
+class PageNumberTripViewSet(TripViewSet):
+    pagination_class = PageNumberPagination
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare first-page and deep-page latency of the trip listing under '
+        'page-number and keyset pagination on seeded data'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=50000)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                report = self.run(options['rows'], options['repeat'])
+                raise Rollback
+        except Rollback:
+            pass
+        self.stdout.write(json.dumps(report, indent=2))
+
+    def run(self, rows, repeat):
+        admin = AuthUser.objects.create_superuser('_pagination_bench', 'bench@example.com', None)
+        customer = Customer.objects.create(
+            user_name='pagination bench', email='pagination-bench@example.com',
+            password='pbkdf2_bench'
+        )
+        Trip.objects.bulk_create(
+            [Trip(customer=customer, status='COMPLETED') for _ in range(rows)],
+            batch_size=2000
+        )
+        page_size = KeysetPagination().page_size
+        last_page = rows // page_size
+
+        # The keyset cursor for the same depth starts after the row ending the previous page
+        boundary = Trip.objects.order_by('-created_at', '-pk')[(last_page - 1) * page_size]
+        paginator = KeysetPagination()
+        paginator.base_url = '/api/trips/'
+        deep_cursor = paginator.encode_cursor(boundary, reverse=False)
+
+        factory = APIRequestFactory(SERVER_NAME='localhost')
+
+        def measure(viewset, url):
+            view = viewset.as_view({'get': 'list'})
+            timings, queries = [], 0
+            for _ in range(repeat):
+                request = factory.get(url)
+                force_authenticate(request, user=admin)
+                with CaptureQueriesContext(connection) as captured:
+                    started = time.perf_counter()
+                    view(request).render()
+                    timings.append((time.perf_counter() - started) * 1000)
+                queries = len(captured)
+            return {'median_ms': round(statistics.median(timings), 2), 'queries': queries}
+
+        return {
+            'rows': rows,
+            'page_size': page_size,
+            'deep_page': last_page,
+            'page_number': {
+                'first': measure(PageNumberTripViewSet, '/api/trips/'),
+                'deep': measure(PageNumberTripViewSet, f'/api/trips/?page={last_page}'),
+            },
+            'keyset': {
+                'first': measure(TripViewSet, '/api/trips/'),
+                'deep': measure(TripViewSet, deep_cursor),
+            },
+        }
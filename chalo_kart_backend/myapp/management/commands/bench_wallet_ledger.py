@@ -0,0 +1,120 @@
+import json
+import threading
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import OperationalError, connection, connections
+
+from myapp.ledger import InsufficientFunds, apply_wallet_change, wallet_balance
+from myapp.models import Customer, Payment, Wallet
+
+
+def naive_change(wallet_id, amount, payment_type):
+    # The read-modify-write the ledger replaced, kept for comparison
+    wallet = Wallet.objects.get(pk=wallet_id)
+    if payment_type == 'DEDUCT':
+        if wallet.current_balance < amount:
+            raise InsufficientFunds("Insufficient balance")
+        wallet.current_balance -= amount
+    else:
+        wallet.current_balance += amount
+    wallet.save()
+
+
+class Command(BaseCommand):
+    help = (
+        'Hammer one wallet from many threads with top-ups and deductions and '
+        'check the final balance against the recorded payments'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--ops', type=int, default=100,
+                            help='Operations per thread')
+        parser.add_argument('--mode', choices=['ledger', 'naive'], default='ledger')
+        parser.add_argument('--replays', type=int, default=2,
+                            help='Times each idempotency key is sent (ledger mode)')
+
+    def handle(self, *args, **options):
+        customer = Customer.objects.create(
+            user_name='ledger bench', email=f'ledger-bench-{time.time_ns()}@example.com',
+            password='pbkdf2_bench'
+        )
+        wallet = Wallet.objects.create(
+            wallet_id=f'BENCH_{time.time_ns()}', user=customer, current_balance=Decimal('100.00')
+        )
+        try:
+            report = self.run(wallet.wallet_id, options)
+        finally:
+            customer.delete()
+        self.stdout.write(json.dumps(report, indent=2))
+        if options['mode'] == 'ledger' and not report['consistent']:
+            raise CommandError('Final balance does not match the recorded payments')
+
+    def run(self, wallet_id, options):
+        initial = wallet_balance(wallet_id)
+        outcomes = {'applied': 0, 'replayed': 0, 'insufficient': 0, 'busy': 0}
+        applied = {'ADD': Decimal('0'), 'DEDUCT': Decimal('0')}
+        lock = threading.Lock()
+
+        def worker(index):
+            try:
+                for op in range(options['ops']):
+                    payment_type = 'ADD' if op % 2 else 'DEDUCT'
+                    amount = Decimal('1.25') if payment_type == 'ADD' else Decimal('1.00')
+                    key = f'{wallet_id}:{index}:{op}'
+                    for _ in range(options['replays'] if options['mode'] == 'ledger' else 1):
+                        try:
+                            if options['mode'] == 'ledger':
+                                _, created = apply_wallet_change(
+                                    wallet_id, amount, payment_type, idempotency_key=key
+                                )
+                            else:
+                                naive_change(wallet_id, amount, payment_type)
+                                created = True
+                        except InsufficientFunds:
+                            outcome = 'insufficient'
+                        except OperationalError:
+                            # SQLite gives up on a writer after its lock timeout
+                            outcome = 'busy'
+                        else:
+                            outcome = 'applied' if created else 'replayed'
+                        with lock:
+                            outcomes[outcome] += 1
+                            if outcome == 'applied':
+                                applied[payment_type] += amount
+            finally:
+                connections.close_all()
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(options['threads'])]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        final = wallet_balance(wallet_id)
+        expected = initial + applied['ADD'] - applied['DEDUCT']
+        attempts = sum(outcomes.values())
+        report = {
+            'mode': options['mode'],
+            'database': connection.vendor,
+            'threads': options['threads'],
+            'attempts': attempts,
+            'seconds': round(elapsed, 3),
+            'ops_per_second': round(attempts / elapsed, 1) if elapsed else None,
+            'outcomes': outcomes,
+            'final_balance': str(final),
+            'expected_balance': str(expected),
+            'lost_amount': str(expected - final),
+            'consistent': final == expected,
+        }
+        if options['mode'] == 'ledger':
+            recorded = Payment.objects.filter(wallet_id=wallet_id)
+            report['payments_recorded'] = recorded.count()
+            report['consistent'] = report['consistent'] and (
+                report['payments_recorded'] == outcomes['applied']
+            )
+        return report
@@ -0,0 +1,27 @@
+import json
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from myapp.ingest import CHUNK_SIZE, INGESTORS
+
+
+class Command(BaseCommand):
+    help = 'Bulk-load trips or payments from an NDJSON file (one JSON object per line)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(INGESTORS))
+        parser.add_argument('path', help="NDJSON file, or '-' for stdin")
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        ingestor = INGESTORS[options['kind']](chunk_size=options['chunk_size'])
+        if options['path'] == '-':
+            report = ingestor.run(sys.stdin)
+        else:
+            try:
+                with open(options['path'], encoding='utf-8') as lines:
+                    report = ingestor.run(lines)
+            except OSError as e:
+                raise CommandError(str(e))
+        self.stdout.write(json.dumps(report, indent=2))
@@ -0,0 +1,26 @@
+import asyncio
+
+from django.core.management.base import BaseCommand
+
+from myapp.redis_standin import PubSubServer
+
+
+class Command(BaseCommand):
+    help = 'Run a local Redis pub/sub stand-in for multi-worker development'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=6379)
+
+    def handle(self, *args, **options):
+        server = PubSubServer(options['host'], options['port'])
+
+        async def run():
+            await server.start()
+            self.stdout.write(f"Redis stand-in listening on redis://{server.host}:{server.port}")
+            await server.serve_forever()
+
+        try:
+            asyncio.run(run())
+        except KeyboardInterrupt:
+            pass
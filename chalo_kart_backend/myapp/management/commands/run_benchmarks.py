@@ -0,0 +1,97 @@
+import json
+import platform
+import sys
+
+import django
+from asgiref.sync import async_to_sync
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import (
+    setup_databases, setup_test_environment, teardown_databases, teardown_test_environment
+)
+from django.utils import timezone
+
+SUITES = ['rest', 'websocket']
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed a synthetic city in a throwaway test database, drive the REST '
+        'API and TripConsumer sockets in-process and print latency, query '
+        'and throughput figures as JSON'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--drivers', type=int, default=1000)
+        parser.add_argument('--customers', type=int, default=5000)
+        parser.add_argument('--trips', type=int, default=20000)
+        parser.add_argument('--payments', type=int, default=20000)
+        parser.add_argument('--requests', type=int, default=100,
+                            help='Measured requests per REST scenario')
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument('--scenario', action='append',
+                            help='Only run this REST scenario (repeatable)')
+        parser.add_argument('--clients', type=int, default=200,
+                            help='Live trips, each with a customer and a driver socket')
+        parser.add_argument('--messages', type=int, default=20,
+                            help='Location updates per driver and trip updates per trip')
+        parser.add_argument('--suite', choices=SUITES, action='append')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--output', help='Also write the report to this file')
+
+    def handle(self, *args, **options):
+        suites = options['suite'] or SUITES
+        # Consumers reach the database from other threads, so the data has to
+        # be committed: use a test database rather than a rolled-back transaction
+        setup_test_environment()
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            report = self.run(options, suites)
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+
+        output = json.dumps(report, indent=2)
+        self.stdout.write(output)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+
+    def run(self, options, suites):
+        # Imported once the test database is in place
+        from chalo_kart.asgi import application
+        from myapp.benchmark import City, run_rest, run_websockets
+
+        if options['drivers'] < 1 or options['customers'] < 1:
+            raise CommandError('Need at least one driver and one customer')
+        city = City(
+            options['drivers'], options['customers'], options['trips'],
+            options['payments'], options['clients'], seed=options['seed']
+        )
+        report = {
+            'meta': {
+                'started_at': timezone.now().isoformat(),
+                'python': sys.version.split()[0],
+                'django': django.get_version(),
+                'database': connection.vendor,
+                'machine': platform.machine(),
+                'options': {
+                    key: options[key] for key in [
+                        'drivers', 'customers', 'trips', 'payments', 'requests',
+                        'warmup', 'clients', 'messages', 'seed',
+                    ]
+                },
+            },
+            'city': dict(city.counts),
+        }
+        report['city']['seed_seconds'] = city.seed()
+
+        if 'rest' in suites:
+            report['rest'] = run_rest(
+                city, options['requests'], warmup=options['warmup'], only=options['scenario']
+            )
+        if 'websocket' in suites:
+            report['websocket'] = async_to_sync(run_websockets)(
+                application, city, options['messages']
+            )
+        return report
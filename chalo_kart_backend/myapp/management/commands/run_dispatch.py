@@ -0,0 +1,34 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand
+
+from myapp.dispatch import DispatchEngine, MAX_PICKUP_KM, BATCH_SIZE
+
+
+class Command(BaseCommand):
+    help = 'Match REQUESTED trips to available drivers every few seconds'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=5.0,
+                            help='Seconds between dispatch runs')
+        parser.add_argument('--once', action='store_true',
+                            help='Run a single dispatch round and exit')
+        parser.add_argument('--max-pickup-km', type=float, default=MAX_PICKUP_KM)
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        engine = DispatchEngine(
+            max_pickup_km=options['max_pickup_km'],
+            batch_size=options['batch_size']
+        )
+        try:
+            while True:
+                matches = engine.run_once()
+                if matches or options['once']:
+                    self.stdout.write(json.dumps(engine.stats()))
+                if options['once']:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            self.stdout.write(json.dumps(engine.stats()))
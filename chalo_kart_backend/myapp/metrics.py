@@ -0,0 +1,246 @@
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.http import Http404, HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+
+from .response_cache import response_cache
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+# name: (help, buckets)
+HISTOGRAMS = {
+    'chalo_http_request_duration_seconds': ('Wall time per request', DURATION_BUCKETS),
+    'chalo_http_db_queries': ('Database queries per request', QUERY_BUCKETS),
+    'chalo_http_db_duration_seconds': ('Database time per request', DURATION_BUCKETS),
+    'chalo_http_serializer_duration_seconds': ('Serializer time per request', DURATION_BUCKETS),
+    'chalo_http_response_bytes': ('Response body size', BYTES_BUCKETS),
+    'chalo_ws_message_duration_seconds': ('Wall time per consumer message', DURATION_BUCKETS),
+    'chalo_ws_db_queries': ('Database queries per consumer message', QUERY_BUCKETS),
+    'chalo_ws_db_duration_seconds': ('Database time per consumer message', DURATION_BUCKETS),
+}
+
+# The request or consumer message being measured, visible to the database
+# wrapper in sync_to_async threads too
+current_sample = contextvars.ContextVar('metrics_sample', default=None)
+
+
+class Sample:
+    __slots__ = ('label', 'queries', 'db_seconds', 'serializer_seconds')
+
+    def __init__(self, label=None):
+        self.label = label
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.serializer_seconds = 0.0
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{escape(value)}"' for name, value in pairs) + '}'
+
+
+class MetricsRegistry:
+    """In-process histograms rendered in the Prometheus text format."""
+
+    def __init__(self):
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name, labels, value):
+        key = (name, tuple(labels))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = Histogram(HISTOGRAMS[name][1])
+            series.observe(value)
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+    def render(self):
+        with self._lock:
+            series = sorted(
+                (key, list(histogram.counts), histogram.sum, histogram.count)
+                for key, histogram in self._series.items()
+            )
+        lines = []
+        for name, (help_text, buckets) in HISTOGRAMS.items():
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} histogram')
+            for (series_name, labels), counts, total, count in series:
+                if series_name != name:
+                    continue
+                cumulative = 0
+                for bound, bucket_count in zip(buckets, counts):
+                    cumulative += bucket_count
+                    lines.append(f'{name}_bucket{format_labels(labels, [("le", bound)])} {cumulative}')
+                lines.append(f'{name}_bucket{format_labels(labels, [("le", "+Inf")])} {count}')
+                lines.append(f'{name}_sum{format_labels(labels)} {total:.6f}')
+                lines.append(f'{name}_count{format_labels(labels)} {count}')
+
+        cache = response_cache.stats()
+        lines.append('# HELP chalo_response_cache_events_total Response cache lookups and writes')
+        lines.append('# TYPE chalo_response_cache_events_total counter')
+        for event in ['hits', 'misses', 'not_modified', 'stores', 'invalidations']:
+            lines.append(f'chalo_response_cache_events_total{{event="{event}"}} {cache[event]}')
+        return '\n'.join(lines) + '\n'
+
+
+metrics = MetricsRegistry()
+
+
+def query_timer(execute, sql, params, many, context):
+    sample = current_sample.get()
+    if sample is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        sample.queries += 1
+        sample.db_seconds += time.perf_counter() - started
+
+
+def add_query_timer(connection):
+    if query_timer not in connection.execute_wrappers:
+        connection.execute_wrappers.append(query_timer)
+
+
+def timed_serializer(serializer):
+    """Charge ``serializer``'s top-level ``to_representation`` to the current sample."""
+    represent = serializer.to_representation
+
+    def to_representation(instance):
+        sample = current_sample.get()
+        started = time.perf_counter()
+        try:
+            return represent(instance)
+        finally:
+            if sample is not None:
+                sample.serializer_seconds += time.perf_counter() - started
+
+    serializer.to_representation = to_representation
+    return serializer
+
+
+@contextmanager
+def measure(label=None):
+    sample = Sample(label)
+    token = current_sample.set(sample)
+    try:
+        yield sample
+    finally:
+        current_sample.reset(token)
+
+
+def endpoint_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    return match.view_name or match._func_path
+
+
+class MetricsMiddleware:
+    """
+    Records wall time, query count and time, serializer time and response
+    size per endpoint, and adds a ``Server-Timing`` header when
+    ``SERVER_TIMING`` is on.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if request.path == '/metrics':
+            return self.get_response(request)
+        started = time.perf_counter()
+        with measure() as sample:
+            response = self.get_response(request)
+        elapsed = time.perf_counter() - started
+
+        labels = (('endpoint', endpoint_name(request)), ('method', request.method))
+        metrics.observe(
+            'chalo_http_request_duration_seconds',
+            labels + (('status', response.status_code),), elapsed
+        )
+        metrics.observe('chalo_http_db_queries', labels, sample.queries)
+        metrics.observe('chalo_http_db_duration_seconds', labels, sample.db_seconds)
+        metrics.observe('chalo_http_serializer_duration_seconds', labels, sample.serializer_seconds)
+        if not response.streaming:
+            metrics.observe('chalo_http_response_bytes', labels, len(response.content))
+
+        if getattr(settings, 'SERVER_TIMING', False):
+            response['Server-Timing'] = (
+                f'app;dur={elapsed * 1000:.2f}, '
+                f'db;dur={sample.db_seconds * 1000:.2f};desc="{sample.queries} queries", '
+                f'ser;dur={sample.serializer_seconds * 1000:.2f}'
+            )
+        return response
+
+
+class MetricsConsumerMixin:
+    """Records wall time and database work per consumer message type."""
+
+    # Client payload types worth their own series; anything else is 'other'
+    message_types = ()
+
+    def tag_message(self, message_type):
+        """Name the message being measured after its payload ``type``."""
+        sample = current_sample.get()
+        if sample is not None:
+            name = message_type if message_type in self.message_types else 'other'
+            sample.label = f'{sample.label}:{name}'
+
+    async def dispatch(self, message):
+        started = time.perf_counter()
+        with measure(message['type']) as sample:
+            try:
+                await super().dispatch(message)
+            finally:
+                labels = (('consumer', self.__class__.__name__), ('message_type', sample.label))
+                metrics.observe(
+                    'chalo_ws_message_duration_seconds', labels, time.perf_counter() - started
+                )
+                metrics.observe('chalo_ws_db_queries', labels, sample.queries)
+                metrics.observe('chalo_ws_db_duration_seconds', labels, sample.db_seconds)
+
+
+def metrics_view(request):
+    # Endpoint names and timings are internal: only served to scrapers
+    # holding METRICS_TOKEN, and not at all without one
+    token = getattr(settings, 'METRICS_TOKEN', None)
+    if not token:
+        raise Http404
+    supplied = request.headers.get('Authorization', '').partition('Bearer ')[2]
+    if not constant_time_compare(supplied, token):
+        return HttpResponseForbidden()
+    return HttpResponse(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,30 @@
+# Generated by Django 3.2.25 on 2026-10-18 10:09
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DriverDailyEarnings',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('trip_count', models.IntegerField(default=0)),
+                ('total_earnings', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('rating_sum', models.FloatField(default=0)),
+                ('rated_trips', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('driver', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_earnings', to='myapp.driver')),
+            ],
+            options={
+                'unique_together': {('driver', 'date')},
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 3.2.25 on 2026-10-18 10:10
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0002_driver_daily_earnings'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('type', models.CharField(max_length=10)),
+                ('status', models.CharField(max_length=20)),
+                ('count', models.IntegerField(default=0)),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('wallet', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_rollups', to='myapp.wallet')),
+            ],
+            options={
+                'unique_together': {('wallet', 'date', 'type', 'status')},
+            },
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 3.2.25 on 2026-10-18 10:13
+
+from django.db import migrations, models
+import myapp.ids
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0004_payment_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='payment',
+            name='payment_id',
+            field=models.CharField(default=myapp.ids.new_payment_id, max_length=50, primary_key=True, serialize=False),
+        ),
+        migrations.AlterField(
+            model_name='route',
+            name='route_id',
+            field=models.CharField(default=myapp.ids.new_route_id, max_length=50, primary_key=True, serialize=False),
+        ),
+        migrations.AlterField(
+            model_name='trip',
+            name='trip_id',
+            field=models.CharField(default=myapp.ids.new_trip_id, max_length=50, primary_key=True, serialize=False),
+        ),
+        migrations.AlterField(
+            model_name='wallet',
+            name='wallet_id',
+            field=models.CharField(default=myapp.ids.new_wallet_id, max_length=50, primary_key=True, serialize=False),
+        ),
+    ]
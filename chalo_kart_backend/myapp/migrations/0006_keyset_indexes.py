@@ -0,0 +1,21 @@
+# Generated by Django 3.2.25 on 2026-10-18 10:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0005_generated_ids'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['created_at', 'payment_id'], name='payment_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='trip',
+            index=models.Index(fields=['created_at', 'trip_id'], name='trip_created_idx'),
+        ),
+    ]
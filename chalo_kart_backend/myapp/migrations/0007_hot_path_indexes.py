@@ -0,0 +1,45 @@
+# Generated by Django 3.2.25 on 2026-10-18 10:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0006_keyset_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['wallet', 'created_at', 'payment_id'], name='payment_wallet_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='paymentdailyrollup',
+            index=models.Index(fields=['date', 'status'], name='payment_rollup_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='trip',
+            index=models.Index(fields=['customer', 'created_at', 'trip_id'], name='trip_customer_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='trip',
+            index=models.Index(fields=['status', 'created_at', 'trip_id'], name='trip_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='trip',
+            index=models.Index(condition=models.Q(('driver__isnull', True), ('status', 'REQUESTED')), fields=['created_at'], name='trip_dispatch_queue_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='trip',
+            index=models.Index(condition=models.Q(('status', 'COMPLETED')), fields=['driver', 'end_time'], name='trip_driver_completed_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='trip',
+            index=models.Index(condition=models.Q(('status__in', ['ACCEPTED', 'STARTED'])), fields=['driver'], name='trip_active_driver_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='trip',
+            index=models.Index(condition=models.Q(('status__in', ['ACCEPTED', 'STARTED'])), fields=['golf_cart'], name='trip_active_cart_idx'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 3.2.25 on 2026-10-18 10:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0007_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='payment',
+            name='idempotency_key',
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name='payment',
+            constraint=models.UniqueConstraint(fields=('wallet', 'idempotency_key'), name='payment_wallet_idempotency_key'),
+        ),
+    ]
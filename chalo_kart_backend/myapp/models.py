@@ -1,7 +1,9 @@
 from django.db import models
 from django.core.validators import MinValueValidator, MaxValueValidator
-from django.utils import timezone
 from django.contrib.auth.hashers import make_password
+from .fares import trip_fare
+from .route_optimizer import optimize_route
+from .ids import new_payment_id, new_route_id, new_trip_id, new_wallet_id
 
 class User(models.Model):
     user_name = models.CharField(max_length=100)
@@ -86,7 +88,7 @@ class GolfCart(models.Model):
         return f"{self.type} Cart: {self.registration_no}"
 
 class Route(models.Model):
-    route_id = models.CharField(max_length=50, primary_key=True)
+    route_id = models.CharField(max_length=50, primary_key=True, default=new_route_id)
     start_coordinates = models.JSONField(default=dict)
     end_coordinates = models.JSONField(default=dict)
     stop_lists = models.JSONField(default=list)
@@ -98,11 +100,11 @@ class Route(models.Model):
         return f"Route {self.route_id}"
 
     @staticmethod
-    def calculate_optimal_route(stops):
-        return stops
+    def calculate_optimal_route(stops, return_to_start=False, fix_end=False):
+        return optimize_route(stops, return_to_start=return_to_start, fix_end=fix_end)
 
 class Trip(models.Model):
-    trip_id = models.CharField(max_length=50, primary_key=True)
+    trip_id = models.CharField(max_length=50, primary_key=True, default=new_trip_id)
     customer = models.ForeignKey(Customer, on_delete=models.SET_NULL, null=True)
     driver = models.ForeignKey(Driver, on_delete=models.SET_NULL, null=True)
     golf_cart = models.ForeignKey(GolfCart, on_delete=models.SET_NULL, null=True)
@@ -128,21 +130,41 @@ class Trip(models.Model):
     rating = models.FloatField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            # Keyset pagination order
+            models.Index(fields=['created_at', 'trip_id'], name='trip_created_idx'),
+            # Trip history, status-filtered listings and the dispatch queue
+            models.Index(fields=['customer', 'created_at', 'trip_id'], name='trip_customer_created_idx'),
+            models.Index(fields=['status', 'created_at', 'trip_id'], name='trip_status_created_idx'),
+            models.Index(
+                fields=['created_at'], name='trip_dispatch_queue_idx',
+                condition=models.Q(status='REQUESTED', driver__isnull=True)
+            ),
+            # Earnings rollups and reports
+            models.Index(
+                fields=['driver', 'end_time'], name='trip_driver_completed_idx',
+                condition=models.Q(status='COMPLETED')
+            ),
+            # Active trips per driver/cart (serializers, pooling, dispatch)
+            models.Index(
+                fields=['driver'], name='trip_active_driver_idx',
+                condition=models.Q(status__in=['ACCEPTED', 'STARTED'])
+            ),
+            models.Index(
+                fields=['golf_cart'], name='trip_active_cart_idx',
+                condition=models.Q(status__in=['ACCEPTED', 'STARTED'])
+            ),
+        ]
+
     def __str__(self):
         return f"Trip {self.trip_id}: {self.status}"
 
-    def calculate_fare(self):
-        base_fare = 5.00
-        per_km_rate = 2.00
-        per_minute_rate = 0.50
-        
-        distance_fare = float(self.route.distance) * per_km_rate if self.route else 0
-        time_fare = self.duration * per_minute_rate if self.duration else 0
-        
-        return base_fare + distance_fare + time_fare
+    def calculate_fare(self, surge=False):
+        return trip_fare(self, surge=surge)
 
 class Wallet(models.Model):
-    wallet_id = models.CharField(max_length=50, primary_key=True)
+    wallet_id = models.CharField(max_length=50, primary_key=True, default=new_wallet_id)
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     current_balance = models.DecimalField(max_digits=10, decimal_places=2, default=0)
     last_updated = models.DateTimeField(auto_now=True)
@@ -150,37 +172,23 @@ class Wallet(models.Model):
     def __str__(self):
         return f"Wallet: {self.user.user_name}"
 
-    def add_funds(self, amount):
-        if amount <= 0:
-            raise ValueError("Amount must be positive")
-        self.current_balance += amount
-        self.save()
-        
-        Payment.objects.create(
-            wallet=self,
-            amount=amount,
-            type='ADD',
-            status='COMPLETED'
-        )
+    def add_funds(self, amount, idempotency_key=None):
+        return self._apply(amount, 'ADD', idempotency_key)
 
-    def deduct_funds(self, amount):
-        if amount <= 0:
-            raise ValueError("Amount must be positive")
-        if self.current_balance < amount:
-            raise ValueError("Insufficient balance")
-        
-        self.current_balance -= amount
-        self.save()
-        
-        Payment.objects.create(
-            wallet=self,
-            amount=amount,
-            type='DEDUCT',
-            status='COMPLETED'
+    def deduct_funds(self, amount, idempotency_key=None, trip=None):
+        return self._apply(amount, 'DEDUCT', idempotency_key, trip)
+
+    def _apply(self, amount, payment_type, idempotency_key=None, trip=None):
+        from .ledger import apply_wallet_change, wallet_balance
+        payment, _ = apply_wallet_change(
+            self.wallet_id, amount, payment_type,
+            trip=trip, idempotency_key=idempotency_key
         )
+        self.current_balance = wallet_balance(self.wallet_id)
+        return payment
 
 class Payment(models.Model):
-    payment_id = models.CharField(max_length=50, primary_key=True)
+    payment_id = models.CharField(max_length=50, primary_key=True, default=new_payment_id)
     wallet = models.ForeignKey(Wallet, on_delete=models.CASCADE)
     trip = models.ForeignKey(Trip, on_delete=models.SET_NULL, null=True, blank=True)
     amount = models.DecimalField(max_digits=10, decimal_places=2)
@@ -198,13 +206,55 @@ class Payment(models.Model):
         ],
         default='PENDING'
     )
+    idempotency_key = models.CharField(max_length=100, null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at', 'payment_id'], name='payment_created_idx'),
+            # A user's payments, newest first (listing, recent transactions, export)
+            models.Index(fields=['wallet', 'created_at', 'payment_id'], name='payment_wallet_created_idx'),
+        ]
+        constraints = [
+            # Keys are chosen by clients, so they only need to be unique per wallet
+            models.UniqueConstraint(
+                fields=['wallet', 'idempotency_key'], name='payment_wallet_idempotency_key'
+            ),
+        ]
+
     def __str__(self):
         return f"Payment {self.payment_id}: {self.type} {self.amount}"
 
-    def save(self, *args, **kwargs):
-        if not self.payment_id:
-            self.payment_id = f"PAY_{timezone.now().strftime('%Y%m%d%H%M%S')}"
-        super().save(*args, **kwargs)
+class DriverDailyEarnings(models.Model):
+    driver = models.ForeignKey(Driver, on_delete=models.CASCADE, related_name='daily_earnings')
+    date = models.DateField()
+    trip_count = models.IntegerField(default=0)
+    total_earnings = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    rating_sum = models.FloatField(default=0)
+    rated_trips = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ('driver', 'date')
+
+    def __str__(self):
+        return f"Earnings {self.driver_id} {self.date}: {self.total_earnings}"
+
+class PaymentDailyRollup(models.Model):
+    wallet = models.ForeignKey(Wallet, on_delete=models.CASCADE, related_name='daily_rollups')
+    date = models.DateField()
+    type = models.CharField(max_length=10)
+    status = models.CharField(max_length=20)
+    count = models.IntegerField(default=0)
+    total = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        unique_together = ('wallet', 'date', 'type', 'status')
+        indexes = [
+            # Staff reports across all wallets
+            models.Index(fields=['date', 'status'], name='payment_rollup_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"Payments {self.wallet_id} {self.date} {self.type}/{self.status}: {self.total}"
@@ -0,0 +1,116 @@
+import base64
+import json
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, _positive_int
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Newest-first cursor pagination on ``(created_at, pk)``.
+
+    Each page is one indexed range query for ``page_size + 1`` rows; there
+    is no ``COUNT(*)`` and no ``OFFSET``, so page 1000 costs the same as
+    page 1. Cursors are opaque base64 JSON holding the boundary row's key
+    and the direction to read in.
+    """
+
+    time_field = 'created_at'
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def __init__(self):
+        self.page_size = settings.REST_FRAMEWORK['PAGE_SIZE']
+        self.max_page_size = settings.MAX_PAGE_SIZE
+
+    def get_page_size(self, request):
+        try:
+            return _positive_int(
+                request.query_params[self.page_size_query_param],
+                strict=True, cutoff=self.max_page_size
+            )
+        except (KeyError, ValueError):
+            return self.page_size
+
+    def encode_cursor(self, row, reverse):
+        position = {
+            't': getattr(row, self.time_field).isoformat(),
+            'k': row.pk,
+            'r': int(reverse),
+        }
+        token = base64.urlsafe_b64encode(json.dumps(position).encode()).decode()
+        return replace_query_param(self.base_url, self.cursor_query_param, token)
+
+    def decode_cursor(self, request):
+        token = request.query_params.get(self.cursor_query_param)
+        if not token:
+            return None
+        try:
+            position = json.loads(base64.urlsafe_b64decode(token.encode()).decode())
+            moment = parse_datetime(position['t'])
+            if moment is None:
+                raise ValueError(position['t'])
+            return moment, position['k'], bool(position['r'])
+        except (TypeError, ValueError, KeyError, UnicodeDecodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        self.base_url = request.build_absolute_uri()
+        cursor = self.decode_cursor(request)
+        reverse = bool(cursor and cursor[2])
+        field = self.time_field
+
+        if cursor:
+            moment, key = cursor[0], cursor[1]
+            # Reading backwards walks towards newer rows. The extra inclusive
+            # bound on the time column lets the database seek the index.
+            lookup = 'gt' if reverse else 'lt'
+            queryset = queryset.filter(
+                Q(**{f'{field}__{lookup}e': moment}),
+                Q(**{f'{field}__{lookup}': moment}) | Q(**{f'pk__{lookup}': key})
+            )
+        if reverse:
+            queryset = queryset.order_by(field, 'pk')
+        else:
+            queryset = queryset.order_by(f'-{field}', '-pk')
+
+        rows = list(queryset[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+
+        self.next_link = self.previous_link = None
+        if rows:
+            if has_more or reverse:
+                self.next_link = self.encode_cursor(rows[-1], reverse=False)
+            if cursor and (has_more or not reverse):
+                self.previous_link = self.encode_cursor(rows[0], reverse=True)
+        elif reverse:
+            self.next_link = remove_query_param(self.base_url, self.cursor_query_param)
+        return rows
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.next_link),
+            ('previous', self.previous_link),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True},
+                'previous': {'type': 'string', 'nullable': True},
+                'results': schema,
+            },
+        }
@@ -0,0 +1,275 @@
+import math
+from decimal import Decimal
+
+from django.db import transaction
+
+from .events import send_trip_update
+from .ids import new_id
+from .response_cache import response_cache
+from .models import GolfCart, Route, Trip
+from .route_optimizer import AVERAGE_SPEED_KMH, get_coordinates, haversine_km
+from .spatial import cart_index
+
+MAX_DETOUR_RATIO = 1.5
+MIN_DETOUR_KM = 1.0
+MAX_PICKUP_KM = 3.0
+CANDIDATE_SHUTTLES = 5
+ACTIVE_STATUSES = ['ACCEPTED', 'STARTED']
+
+
+class PlanChanged(Exception):
+    """The shuttle's riders or availability changed after its plan was built."""
+
+
+def make_stop(trip, kind):
+    location = trip.start_location if kind == 'PICKUP' else trip.end_location
+    latitude, longitude = get_coordinates(location)
+    return {
+        'trip_id': trip.trip_id,
+        'kind': kind,
+        'latitude': latitude,
+        'longitude': longitude,
+        'seats': trip.no_of_seats_booked,
+        'direct_km': round(haversine_km(
+            get_coordinates(trip.start_location), get_coordinates(trip.end_location)
+        ), 3),
+    }
+
+
+class ShuttlePlan:
+    """
+    Ordered pickup/dropoff stops of one shuttle, starting at its position.
+
+    ``onboard`` is the number of seats already taken by riders whose pickup
+    has happened. A stop list is feasible when the load never exceeds the
+    cart capacity and nobody rides more than their detour allowance.
+    """
+
+    def __init__(self, gc_id, capacity, origin, stops=None, onboard=0, riders=()):
+        self.gc_id = gc_id
+        self.capacity = capacity
+        self.origin = origin
+        self.stops = list(stops or [])
+        self.onboard = onboard
+        self.riders = set(riders)
+
+    def cumulative(self, stops):
+        distances, total = [], 0.0
+        previous = self.origin
+        for stop in stops:
+            point = (stop['latitude'], stop['longitude'])
+            total += haversine_km(previous, point)
+            distances.append(total)
+            previous = point
+        return distances
+
+    def length(self, stops=None):
+        distances = self.cumulative(self.stops if stops is None else stops)
+        return distances[-1] if distances else 0.0
+
+    def loads(self, stops=None):
+        load, loads = self.onboard, []
+        for stop in self.stops if stops is None else stops:
+            load += stop['seats'] if stop['kind'] == 'PICKUP' else -stop['seats']
+            loads.append(load)
+        return loads
+
+    def remaining_seats(self):
+        return self.capacity - max([self.onboard] + self.loads())
+
+    def is_feasible(self, stops):
+        if any(load > self.capacity for load in self.loads(stops)):
+            return False
+        distances = self.cumulative(stops)
+        picked_up = {}
+        for stop, distance in zip(stops, distances):
+            if stop['kind'] == 'PICKUP':
+                picked_up[stop['trip_id']] = distance
+                continue
+            ride = distance - picked_up.get(stop['trip_id'], 0.0)
+            allowance = max(stop['direct_km'] * MAX_DETOUR_RATIO,
+                            stop['direct_km'] + MIN_DETOUR_KM)
+            if ride > allowance + 1e-9:
+                return False
+        return True
+
+    def best_insertion(self, pickup, dropoff):
+        """
+        Cheapest feasible positions for a new pickup/dropoff pair.
+
+        Returns ``(added_km, stops)`` or ``None`` when no position respects
+        the seat and detour limits.
+        """
+        base = self.length()
+        best = None
+        size = len(self.stops)
+        for i in range(size + 1):
+            for j in range(i, size + 1):
+                stops = (
+                    self.stops[:i] + [pickup] + self.stops[i:j]
+                    + [dropoff] + self.stops[j:]
+                )
+                added = self.length(stops) - base
+                if best is not None and added >= best[0]:
+                    continue
+                if self.is_feasible(stops):
+                    best = (added, stops)
+        return best
+
+    @classmethod
+    def for_cart(cls, cart, lock=False):
+        """
+        Rebuild the current plan of ``cart`` from its active trips, locking
+        their rows with ``lock`` so they can't change before the plan is saved.
+        """
+        trips = Trip.objects.filter(golf_cart=cart, status__in=ACTIVE_STATUSES)
+        if lock:
+            trips = trips.select_for_update()
+        trips = list(trips.select_related('route'))
+        origin = get_coordinates(cart.location)
+        onboard = sum(t.no_of_seats_booked for t in trips if t.status == 'STARTED')
+        plan = cls(cart.gc_id, cart.capacity, origin, onboard=onboard,
+                   riders=[t.trip_id for t in trips])
+
+        status_by_trip = {t.trip_id: t.status for t in trips}
+        route = next((t.route for t in trips if t.route and is_shuttle_route(t.route)), None)
+        if route:
+            plan.stops = [
+                stop for stop in route.stop_lists
+                if stop.get('trip_id') in status_by_trip
+                and not (stop['kind'] == 'PICKUP' and status_by_trip[stop['trip_id']] == 'STARTED')
+            ]
+
+        planned = {stop['trip_id'] for stop in plan.stops}
+        for trip in trips:
+            if trip.trip_id in planned:
+                continue
+            dropoff = make_stop(trip, 'DROPOFF')
+            if trip.status == 'STARTED':
+                plan.stops.append(dropoff)
+                continue
+            inserted = plan.best_insertion(make_stop(trip, 'PICKUP'), dropoff)
+            if inserted:
+                plan.stops = inserted[1]
+            else:
+                plan.stops += [make_stop(trip, 'PICKUP'), dropoff]
+        return plan
+
+    def save_route(self, route=None):
+        distance = self.length()
+        last = self.stops[-1] if self.stops else None
+        route = route or Route(
+            route_id=new_id(f"SHUTTLE_{self.gc_id}_")
+        )
+        route.start_coordinates = {'latitude': self.origin[0], 'longitude': self.origin[1]}
+        route.end_coordinates = (
+            {'latitude': last['latitude'], 'longitude': last['longitude']} if last else {}
+        )
+        route.stop_lists = self.stops
+        route.distance = Decimal(str(round(distance, 2)))
+        route.estimated_duration = math.ceil(distance / AVERAGE_SPEED_KMH * 60)
+        route.save()
+        return route
+
+
+def is_shuttle_route(route):
+    return route.route_id.startswith('SHUTTLE_')
+
+
+def pool_trip(trip):
+    """
+    Add a REQUESTED trip to the shuttle where it costs the fewest extra km.
+
+    Shuttles are tried from the cheapest insertion up; one whose riders or
+    availability changed since its plan was built is skipped for the next.
+    Returns the updated ``ShuttlePlan`` and the added distance, or
+    ``(None, None)`` when no nearby shuttle can take the trip.
+    """
+    pickup = make_stop(trip, 'PICKUP')
+    dropoff = make_stop(trip, 'DROPOFF')
+    candidates = cart_index.nearest(
+        pickup['latitude'], pickup['longitude'],
+        k=CANDIDATE_SHUTTLES,
+        max_distance_km=MAX_PICKUP_KM,
+        predicate=lambda entry: (
+            entry['type'] == 'SHUTTLE'
+            and entry['driver_id'] is not None
+            and entry['capacity'] >= trip.no_of_seats_booked
+        )
+    )
+
+    with transaction.atomic():
+        carts = GolfCart.objects.select_for_update().select_related('driver').filter(
+            gc_id__in=[entry['gc_id'] for _, entry in candidates],
+            status='ACTIVE',
+            driver__is_available=True
+        )
+        options = []
+        for cart in carts:
+            plan = ShuttlePlan.for_cart(cart, lock=True)
+            inserted = plan.best_insertion(pickup, dropoff)
+            if inserted:
+                options.append((inserted[0], plan, inserted[1], cart))
+        options.sort(key=lambda option: option[0])
+
+        for added_km, plan, stops, cart in options:
+            plan.stops = stops
+            try:
+                with transaction.atomic():
+                    route = commit_plan(trip, plan, cart)
+            except PlanChanged:
+                continue
+            if route is None:
+                # Someone else assigned the trip itself; no shuttle can help
+                return None, None
+            break
+        else:
+            return None, None
+
+        response_cache.invalidate('driver', cart.driver_id)
+        send_trip_update(
+            trip.trip_id, status='ACCEPTED', driver_id=cart.driver_id,
+            golf_cart_id=cart.gc_id, route_id=route.route_id
+        )
+        for trip_id in plan.riders:
+            send_trip_update(trip_id, route_id=route.route_id)
+    return plan, added_km
+
+
+def commit_plan(trip, plan, cart):
+    """
+    Save ``plan`` as the shuttle's route and assign ``trip`` to it.
+
+    Raises ``PlanChanged`` if the cart left service or its active riders are
+    no longer the ones the plan was built from, and returns ``None`` if the
+    trip is no longer an unassigned request.
+    """
+    if not GolfCart.objects.filter(
+        gc_id=cart.gc_id, status='ACTIVE', driver__is_available=True
+    ).exists():
+        raise PlanChanged(cart.gc_id)
+    # The riders were locked when the plan was built; this catches backends
+    # without row locks and trips assigned to the cart since
+    riders = set(Trip.objects.filter(
+        golf_cart=cart, status__in=ACTIVE_STATUSES
+    ).values_list('trip_id', flat=True))
+    if riders != plan.riders:
+        raise PlanChanged(cart.gc_id)
+
+    shared = Route.objects.filter(
+        trip__golf_cart=cart,
+        trip__status__in=ACTIVE_STATUSES,
+        route_id__startswith='SHUTTLE_'
+    ).first()
+    route = plan.save_route(shared)
+
+    updated = Trip.objects.filter(
+        trip_id=trip.trip_id, status='REQUESTED', driver__isnull=True
+    ).update(driver=cart.driver, golf_cart=cart, status='ACCEPTED', route=route)
+    if not updated:
+        transaction.set_rollback(True)
+        return None
+    Trip.objects.filter(
+        trip_id__in=plan.riders, status__in=ACTIVE_STATUSES
+    ).update(route=route)
+    return route
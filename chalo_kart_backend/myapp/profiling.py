@@ -0,0 +1,213 @@
+import collections
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+PROFILE_NAME = re.compile(r'^\d{13}-[\w.-]+-\d+ms\.collapsed$')
+
+
+def enabled():
+    return getattr(settings, 'PROFILING', False)
+
+
+def profile_dir():
+    return Path(getattr(settings, 'PROFILE_DIR', None) or Path(tempfile.gettempdir()) / 'chalo_kart_profiles')
+
+
+class ProfileSession:
+    """Stacks sampled from one thread while a request or message is handled."""
+
+    def __init__(self, label, thread_id, sampled):
+        self.label = label
+        self.thread_id = thread_id
+        self.sampled = sampled
+        self.started = time.perf_counter()
+        self.stacks = collections.Counter()
+
+
+class StackSampler:
+    """
+    Background thread that snapshots the stacks of threads with an open
+    session every ``interval`` seconds.
+
+    Nothing is traced: the profiled code runs at full speed and the cost is
+    one ``sys._current_frames()`` per tick, only while sessions are open.
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self._sessions = collections.defaultdict(list)
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self._names = {}
+
+    def start(self, session):
+        with self._lock:
+            self._sessions[session.thread_id].append(session)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+                self._thread.start()
+        self._wake.set()
+
+    def stop(self, session):
+        with self._lock:
+            sessions = self._sessions.get(session.thread_id, [])
+            if session in sessions:
+                sessions.remove(session)
+            if not sessions:
+                self._sessions.pop(session.thread_id, None)
+
+    def frame_name(self, code):
+        name = self._names.get(code)
+        if name is None:
+            filename = code.co_filename
+            for root in sys.path:
+                if root and filename.startswith(root):
+                    filename = filename[len(root):].lstrip(os.sep)
+                    break
+            name = self._names[code] = f'{code.co_name} ({filename}:{code.co_firstlineno})'
+        return name
+
+    def collapse(self, frame):
+        names = []
+        while frame is not None:
+            names.append(self.frame_name(frame.f_code))
+            frame = frame.f_back
+        return ';'.join(reversed(names))
+
+    def _run(self):
+        while True:
+            with self._lock:
+                active = {thread_id: list(sessions) for thread_id, sessions in self._sessions.items()}
+            if not active:
+                # Idle until the next session opens
+                self._wake.wait()
+                self._wake.clear()
+                continue
+            frames = sys._current_frames()
+            for thread_id, sessions in active.items():
+                frame = frames.get(thread_id)
+                if frame is None:
+                    continue
+                stack = self.collapse(frame)
+                for session in sessions:
+                    session.stacks[stack] += 1
+            del frames
+            time.sleep(self.interval)
+
+
+class ProfileStore:
+    """Bounded on-disk ring of collapsed-stack profiles, oldest dropped first."""
+
+    def __init__(self, directory=None, keep=None):
+        self._directory = directory
+        self._keep = keep
+        self._lock = threading.Lock()
+
+    @property
+    def directory(self):
+        return Path(self._directory or profile_dir())
+
+    @property
+    def keep(self):
+        return self._keep or getattr(settings, 'PROFILE_KEEP', 100)
+
+    def save(self, label, elapsed_ms, stacks):
+        label = re.sub(r'[^\w.-]+', '_', label)[:80] or 'unknown'
+        name = f'{int(time.time() * 1000)}-{label}-{int(elapsed_ms)}ms.collapsed'
+        body = ''.join(f'{stack} {count}\n' for stack, count in stacks.most_common())
+        with self._lock:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            (self.directory / name).write_text(body)
+            for stale in self.names()[self.keep:]:
+                (self.directory / stale).unlink(missing_ok=True)
+        return name
+
+    def names(self):
+        """Stored profiles, newest first."""
+        if not self.directory.is_dir():
+            return []
+        return sorted(
+            (path.name for path in self.directory.iterdir() if PROFILE_NAME.match(path.name)),
+            reverse=True
+        )
+
+    def path(self, name):
+        if not PROFILE_NAME.match(name):
+            return None
+        path = self.directory / name
+        return path if path.is_file() else None
+
+
+sampler = StackSampler()
+profile_store = ProfileStore()
+
+
+def begin(label):
+    """Open a session on the current thread, or None when profiling is off."""
+    if not enabled():
+        return None
+    rate = getattr(settings, 'PROFILE_SAMPLE_RATE', 0)
+    sampler.interval = getattr(settings, 'PROFILE_INTERVAL_MS', 5) / 1000
+    session = ProfileSession(label, threading.get_ident(), bool(rate) and random.randrange(rate) == 0)
+    sampler.start(session)
+    return session
+
+
+def finish(session):
+    """Close ``session`` and store it if it was slow or sampled."""
+    sampler.stop(session)
+    elapsed_ms = (time.perf_counter() - session.started) * 1000
+    slow = elapsed_ms >= getattr(settings, 'PROFILE_THRESHOLD_MS', 1000)
+    if (slow or session.sampled) and session.stacks:
+        return profile_store.save(session.label, elapsed_ms, session.stacks)
+    return None
+
+
+class SlowRequestProfilerMiddleware:
+    """
+    Samples every request's stack and keeps the profile of those slower than
+    ``PROFILE_THRESHOLD_MS`` (or picked 1 in ``PROFILE_SAMPLE_RATE``).
+    Not installed at all unless ``PROFILING`` is on.
+    """
+
+    def __init__(self, get_response):
+        if not enabled():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        session = begin(f'{request.method}_{request.path}')
+        try:
+            return self.get_response(request)
+        finally:
+            match = getattr(request, 'resolver_match', None)
+            if match is not None and match.view_name:
+                session.label = f'{request.method}_{match.view_name}'
+            finish(session)
+
+
+class ProfilingConsumerMixin:
+    """
+    Profiles consumer messages like the middleware does requests. Samples
+    come from the event loop thread, so concurrent messages on the same
+    loop share stacks.
+    """
+
+    async def dispatch(self, message):
+        session = begin(f"{self.__class__.__name__}_{message['type']}")
+        if session is None:
+            return await super().dispatch(message)
+        try:
+            await super().dispatch(message)
+        finally:
+            finish(session)
@@ -0,0 +1,120 @@
+"""
+Minimal Redis pub/sub server for running several ASGI workers locally.
+
+It speaks just enough of the Redis protocol (PING, ECHO, SELECT, CLIENT,
+PUBLISH, SUBSCRIBE, UNSUBSCRIBE, QUIT) for
+``channels_redis.pubsub.RedisPubSubChannelLayer``. Messages are not
+persisted; use a real Redis server in production.
+"""
+import asyncio
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def encode(value):
+    if value is None:
+        return b'$-1\r\n'
+    if isinstance(value, int):
+        return b':%d\r\n' % value
+    if isinstance(value, str):
+        value = value.encode()
+    if isinstance(value, bytes):
+        return b'$%d\r\n%s\r\n' % (len(value), value)
+    return b'*%d\r\n' % len(value) + b''.join(encode(item) for item in value)
+
+
+async def read_command(reader):
+    line = await reader.readline()
+    if not line:
+        return None
+    if not line.startswith(b'*'):
+        return line.strip().split()
+    args = []
+    for _ in range(int(line[1:])):
+        header = await reader.readline()
+        size = int(header[1:])
+        data = await reader.readexactly(size + 2)
+        args.append(data[:-2])
+    return args
+
+
+class PubSubServer:
+    def __init__(self, host='127.0.0.1', port=6379):
+        self.host = host
+        self.port = port
+        self.subscribers = {}
+        self.server = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(self.handle, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        logger.info(f"Redis stand-in listening on {self.host}:{self.port}")
+        return self
+
+    async def serve_forever(self):
+        if self.server is None:
+            await self.start()
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+
+    def publish(self, channel, message):
+        writers = self.subscribers.get(channel, ())
+        frame = encode([b'message', channel, message])
+        for writer in writers:
+            writer.write(frame)
+        return len(writers)
+
+    async def handle(self, reader, writer):
+        subscribed = set()
+        try:
+            while True:
+                command = await read_command(reader)
+                if not command:
+                    break
+                name, args = command[0].upper(), command[1:]
+                if name == b'PING':
+                    writer.write(encode(args[0]) if args else b'+PONG\r\n')
+                elif name == b'ECHO':
+                    writer.write(encode(args[0]))
+                elif name in (b'SELECT', b'CLIENT', b'AUTH'):
+                    writer.write(b'+OK\r\n')
+                elif name == b'PUBLISH':
+                    writer.write(encode(self.publish(args[0], args[1])))
+                elif name == b'SUBSCRIBE':
+                    for channel in args:
+                        subscribed.add(channel)
+                        self.subscribers.setdefault(channel, set()).add(writer)
+                        writer.write(encode([b'subscribe', channel, len(subscribed)]))
+                elif name == b'UNSUBSCRIBE':
+                    channels = args or list(subscribed)
+                    if not channels:
+                        writer.write(encode([b'unsubscribe', None, 0]))
+                    for channel in channels:
+                        subscribed.discard(channel)
+                        self._discard(channel, writer)
+                        writer.write(encode([b'unsubscribe', channel, len(subscribed)]))
+                elif name == b'QUIT':
+                    writer.write(b'+OK\r\n')
+                    break
+                else:
+                    writer.write(b'-ERR unknown command %s\r\n' % name)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            for channel in subscribed:
+                self._discard(channel, writer)
+            writer.close()
+
+    def _discard(self, channel, writer):
+        writers = self.subscribers.get(channel)
+        if writers:
+            writers.discard(writer)
+            if not writers:
+                del self.subscribers[channel]
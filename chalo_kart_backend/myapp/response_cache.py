@@ -0,0 +1,176 @@
+import collections
+import hashlib
+import json
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from rest_framework import status
+from rest_framework.response import Response
+
+DEFAULT_TIMEOUT = 300
+KEY_PREFIX = 'rc'
+
+
+class ResponseCache:
+    """
+    Versioned cache of serialized API responses.
+
+    Every namespace (one per viewset) has a list version and every object
+    a version of its own; list keys include the former, detail keys the
+    latter. Invalidating bumps the versions, so stale entries are simply
+    never read again and expire on their own. Versions live in the same
+    cache, so a shared backend (memcached, Redis) invalidates across
+    workers.
+    """
+
+    def __init__(self, alias=None, timeout=None):
+        self.alias = alias
+        self.timeout = timeout
+        self._stats = collections.Counter()
+        self._lock = threading.Lock()
+
+    @property
+    def cache(self):
+        return caches[self.alias or getattr(settings, 'RESPONSE_CACHE_ALIAS', 'default')]
+
+    @property
+    def ttl(self):
+        return self.timeout or getattr(settings, 'RESPONSE_CACHE_TIMEOUT', DEFAULT_TIMEOUT)
+
+    def version_key(self, namespace, pk=None):
+        return f'{KEY_PREFIX}:v:{namespace}' if pk is None else f'{KEY_PREFIX}:v:{namespace}:{pk}'
+
+    def versions(self, keys):
+        found = self.cache.get_many(keys)
+        for key in keys:
+            if key not in found:
+                # A fresh, never-used value: entries written under an evicted
+                # version can't be mistaken for current ones
+                self.cache.add(key, time.time_ns(), None)
+                found[key] = self.cache.get(key)
+        return [found[key] for key in keys]
+
+    def entry_key(self, namespace, pk, full_path, vary=()):
+        keys = [self.version_key(namespace, pk)]
+        digest = hashlib.sha1(
+            json.dumps([full_path, list(vary), self.versions(keys)]).encode()
+        ).hexdigest()
+        return f'{KEY_PREFIX}:{namespace}:{pk if pk is not None else "list"}:{digest}'
+
+    def invalidate(self, namespace, *pks):
+        """Bump the list version of ``namespace`` and the version of each pk."""
+        # After commit, so a concurrent read can't cache pre-commit data
+        # under the new version
+        transaction.on_commit(lambda: self.bump(namespace, pks))
+
+    def bump(self, namespace, pks):
+        for key in [self.version_key(namespace)] + [
+                self.version_key(namespace, pk) for pk in pks if pk is not None]:
+            try:
+                self.cache.incr(key)
+            except ValueError:
+                self.cache.set(key, time.time_ns(), None)
+        self.count('invalidations')
+
+    def get(self, key):
+        return self.cache.get(key)
+
+    def set(self, key, data):
+        body = json.dumps(data, cls=DjangoJSONEncoder, sort_keys=True)
+        entry = {'data': json.loads(body), 'etag': f'"{hashlib.sha1(body.encode()).hexdigest()}"'}
+        self.cache.set(key, entry, self.ttl)
+        self.count('stores')
+        return entry
+
+    def count(self, name, elapsed=None):
+        with self._lock:
+            self._stats[name] += 1
+            if elapsed is not None:
+                self._stats[f'{name}_ms'] += elapsed * 1000
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats.get('hits', 0) + stats.get('misses', 0)
+        report = {name: stats.get(name, 0) for name in
+                  ['hits', 'misses', 'not_modified', 'stores', 'invalidations']}
+        report['hit_rate'] = round(stats.get('hits', 0) / lookups, 4) if lookups else None
+        for name in ['hits', 'misses']:
+            report[f'{name}_avg_ms'] = (
+                round(stats.get(f'{name}_ms', 0) / stats[name], 3) if stats.get(name) else None
+            )
+        return report
+
+
+response_cache = ResponseCache()
+
+
+def etags(header):
+    return {tag.strip().replace('W/', '', 1) for tag in header.split(',') if tag.strip()}
+
+
+class CachedResponseMixin:
+    """
+    Serves ``list`` and ``retrieve`` from ``response_cache``.
+
+    Authentication and permissions still run first. Responses carry an
+    ETag; a matching ``If-None-Match`` gets a 304. Successful updates
+    write the new representation straight into the cache.
+    """
+
+    cache_namespace = None
+
+    def cache_vary(self, request):
+        """Extra key parts for responses that depend on more than the URL."""
+        return ()
+
+    def cached_response(self, request, pk, render):
+        started = time.perf_counter()
+        key = response_cache.entry_key(
+            self.cache_namespace, pk, request.get_full_path(), self.cache_vary(request)
+        )
+        entry = response_cache.get(key)
+        if entry is None:
+            response = render()
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            entry = response_cache.set(key, response.data)
+            response_cache.count('misses', time.perf_counter() - started)
+        else:
+            response_cache.count('hits', time.perf_counter() - started)
+
+        if entry['etag'] in etags(request.headers.get('If-None-Match', '')):
+            response_cache.count('not_modified')
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = Response(entry['data'])
+        response['ETag'] = entry['etag']
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(
+            request, None, lambda: super(CachedResponseMixin, self).list(request, *args, **kwargs)
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        pk = kwargs[self.lookup_url_kwarg or self.lookup_field]
+        return self.cached_response(
+            request, pk, lambda: super(CachedResponseMixin, self).retrieve(request, *args, **kwargs)
+        )
+
+    def update(self, request, *args, **kwargs):
+        response = super().update(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            # Signals have bumped the versions; store the new representation
+            # under the plain detail URL so the next read is a hit
+            pk = kwargs[self.lookup_url_kwarg or self.lookup_field]
+            key = response_cache.entry_key(
+                self.cache_namespace, pk, request.path, self.cache_vary(request)
+            )
+            entry = response_cache.set(key, response.data)
+            response['ETag'] = entry['etag']
+        return response
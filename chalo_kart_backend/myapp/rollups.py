@@ -0,0 +1,150 @@
+import datetime
+from types import SimpleNamespace
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import DriverDailyEarnings, Payment, PaymentDailyRollup, Trip
+
+
+# Fields the rollup keys read; instances loaded without them get their
+# previous key from the database when saved or deleted
+EARNINGS_FIELDS = {'status', 'driver_id', 'end_time'}
+PAYMENT_FIELDS = {'created_at', 'wallet_id', 'type', 'status', 'amount'}
+
+
+def stored_row(model, pk, fields):
+    """The saved values of ``fields`` for one row, as attributes, or ``None``."""
+    row = model.objects.filter(pk=pk).values(*fields).first() if pk is not None else None
+    return SimpleNamespace(**row) if row else None
+
+
+def earnings_key(trip):
+    """``(driver_id, day)`` a trip counts towards, or ``None`` if it does not count."""
+    if trip.status != 'COMPLETED' or trip.driver_id is None or trip.end_time is None:
+        return None
+    return trip.driver_id, timezone.localtime(trip.end_time).date()
+
+
+def day_bounds(day):
+    start = timezone.make_aware(datetime.datetime.combine(day, datetime.time.min))
+    return start, start + datetime.timedelta(days=1)
+
+
+def refresh_driver_earnings(driver_id, day):
+    """Recompute one driver-day row from its completed trips."""
+    start, end = day_bounds(day)
+    totals = Trip.objects.filter(
+        driver_id=driver_id, status='COMPLETED',
+        end_time__gte=start, end_time__lt=end
+    ).aggregate(
+        trip_count=Count('trip_id'),
+        total_earnings=Sum('fare'),
+        rating_sum=Sum('rating'),
+        rated_trips=Count('rating')
+    )
+    if not totals['trip_count']:
+        DriverDailyEarnings.objects.filter(driver_id=driver_id, date=day).delete()
+        return None
+    row, _ = DriverDailyEarnings.objects.update_or_create(
+        driver_id=driver_id, date=day,
+        defaults={
+            'trip_count': totals['trip_count'],
+            'total_earnings': totals['total_earnings'] or 0,
+            'rating_sum': totals['rating_sum'] or 0,
+            'rated_trips': totals['rated_trips'],
+        }
+    )
+    return row
+
+
+def backfill_driver_earnings(since=None):
+    """Rebuild every driver-day row (from ``since`` onwards) from the trip table."""
+    trips = Trip.objects.filter(status='COMPLETED', driver__isnull=False, end_time__isnull=False)
+    existing = DriverDailyEarnings.objects.all()
+    if since:
+        trips = trips.filter(end_time__gte=day_bounds(since)[0])
+        existing = existing.filter(date__gte=since)
+
+    rows = (
+        trips.annotate(day=TruncDate('end_time'))
+        .order_by()
+        .values('driver_id', 'day')
+        .annotate(
+            trip_count=Count('trip_id'),
+            total_earnings=Sum('fare'),
+            rating_sum=Sum('rating'),
+            rated_trips=Count('rating')
+        )
+    )
+    with transaction.atomic():
+        existing.delete()
+        created = DriverDailyEarnings.objects.bulk_create([
+            DriverDailyEarnings(
+                driver_id=row['driver_id'], date=row['day'],
+                trip_count=row['trip_count'],
+                total_earnings=row['total_earnings'] or 0,
+                rating_sum=row['rating_sum'] or 0,
+                rated_trips=row['rated_trips']
+            )
+            for row in rows.iterator()
+        ], batch_size=500)
+    return len(created)
+
+
+def payment_key(payment):
+    """``(wallet_id, day, type, status)`` of a saved payment, or ``None`` before it is saved."""
+    if payment.created_at is None or payment.wallet_id is None:
+        return None
+    return (
+        payment.wallet_id, timezone.localtime(payment.created_at).date(),
+        payment.type, payment.status
+    )
+
+
+def adjust_payment_rollup(key, count, amount):
+    """Add ``count`` payments worth ``amount`` to one rollup row."""
+    wallet_id, day, payment_type, payment_status = key
+    rows = PaymentDailyRollup.objects.filter(
+        wallet_id=wallet_id, date=day, type=payment_type, status=payment_status
+    )
+    if rows.update(count=F('count') + count, total=F('total') + amount) or count < 0:
+        # Nothing to subtract from when the row went away with its wallet
+        return
+    try:
+        with transaction.atomic():
+            PaymentDailyRollup.objects.create(
+                wallet_id=wallet_id, date=day, type=payment_type,
+                status=payment_status, count=count, total=amount
+            )
+    except IntegrityError:
+        # Another writer created the row first
+        rows.update(count=F('count') + count, total=F('total') + amount)
+
+
+def backfill_payment_rollups(since=None):
+    """Rebuild every payment rollup row (from ``since`` onwards) from the payment table."""
+    payments = Payment.objects.all()
+    existing = PaymentDailyRollup.objects.all()
+    if since:
+        payments = payments.filter(created_at__gte=day_bounds(since)[0])
+        existing = existing.filter(date__gte=since)
+
+    rows = (
+        payments.annotate(day=TruncDate('created_at'))
+        .order_by()
+        .values('wallet_id', 'day', 'type', 'status')
+        .annotate(count=Count('payment_id'), total=Sum('amount'))
+    )
+    with transaction.atomic():
+        existing.delete()
+        created = PaymentDailyRollup.objects.bulk_create([
+            PaymentDailyRollup(
+                wallet_id=row['wallet_id'], date=row['day'], type=row['type'],
+                status=row['status'], count=row['count'], total=row['total'] or 0
+            )
+            for row in rows.iterator()
+        ], batch_size=500)
+    return len(created)
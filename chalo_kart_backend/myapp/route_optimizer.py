@@ -0,0 +1,179 @@
+import math
+import time
+
+EARTH_RADIUS_KM = 6371.0088
+AVERAGE_SPEED_KMH = 15.0
+DEFAULT_TIME_BUDGET_MS = 50
+
+
+def get_coordinates(point):
+    """Return (latitude, longitude) floats for a stop or location payload."""
+    if isinstance(point, dict):
+        lat = point.get('latitude', point.get('lat'))
+        lng = point.get('longitude', point.get('lng', point.get('lon')))
+    elif isinstance(point, (list, tuple)) and len(point) == 2:
+        lat, lng = point
+    else:
+        raise ValueError(f"Invalid coordinates: {point!r}")
+
+    try:
+        lat, lng = float(lat), float(lng)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid coordinates: {point!r}")
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        raise ValueError(f"Coordinates out of range: {point!r}")
+    return lat, lng
+
+
+def haversine_km(a, b):
+    lat1, lng1 = map(math.radians, a)
+    lat2, lng2 = map(math.radians, b)
+    h = (
+        math.sin((lat2 - lat1) / 2) ** 2
+        + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(h)))
+
+
+def distance_matrix(points):
+    n = len(points)
+    radians = [(math.radians(lat), math.radians(lng)) for lat, lng in points]
+    cos_lat = [math.cos(lat) for lat, _ in radians]
+    matrix = [[0.0] * n for _ in range(n)]
+    for i in range(n):
+        lat1, lng1 = radians[i]
+        row = matrix[i]
+        for j in range(i + 1, n):
+            lat2, lng2 = radians[j]
+            h = (
+                math.sin((lat2 - lat1) / 2) ** 2
+                + cos_lat[i] * cos_lat[j] * math.sin((lng2 - lng1) / 2) ** 2
+            )
+            d = 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(h)))
+            row[j] = d
+            matrix[j][i] = d
+    return matrix
+
+
+def path_length(tour, matrix):
+    return sum(matrix[tour[k]][tour[k + 1]] for k in range(len(tour) - 1))
+
+
+def nearest_neighbour(matrix, start, end, nodes):
+    tour = [start]
+    remaining = set(nodes)
+    current = start
+    while remaining:
+        row = matrix[current]
+        current = min(remaining, key=row.__getitem__)
+        remaining.remove(current)
+        tour.append(current)
+    tour.append(end)
+    return tour
+
+
+def two_opt(tour, matrix, deadline):
+    """Reverse segments while it shortens the path. Both ends stay fixed."""
+    n = len(tour)
+    improved = True
+    while improved and time.perf_counter() < deadline:
+        improved = False
+        for i in range(1, n - 2):
+            a, b = tour[i - 1], tour[i]
+            row_a, row_b = matrix[a], matrix[b]
+            d_ab = row_a[b]
+            for j in range(i + 1, n - 1):
+                c, d = tour[j], tour[j + 1]
+                delta = row_a[c] + row_b[d] - d_ab - matrix[c][d]
+                if delta < -1e-9:
+                    tour[i:j + 1] = reversed(tour[i:j + 1])
+                    improved = True
+                    b = tour[i]
+                    row_b = matrix[b]
+                    d_ab = row_a[b]
+            if time.perf_counter() >= deadline:
+                break
+    return tour
+
+
+def or_opt(tour, matrix, deadline):
+    """Relocate runs of 1-3 consecutive stops (optionally reversed)."""
+    improved = True
+    while improved and time.perf_counter() < deadline:
+        improved = False
+        n = len(tour)
+        for length in (1, 2, 3):
+            for i in range(1, n - length):
+                first, last = tour[i], tour[i + length - 1]
+                prev, nxt = tour[i - 1], tour[i + length]
+                gain = matrix[prev][first] + matrix[last][nxt] - matrix[prev][nxt]
+                best_delta, best_move = -1e-9, None
+                for k in range(n - 1):
+                    if i - 1 <= k <= i + length - 1:
+                        continue
+                    a, b = tour[k], tour[k + 1]
+                    forward = matrix[a][first] + matrix[last][b] - matrix[a][b] - gain
+                    backward = matrix[a][last] + matrix[first][b] - matrix[a][b] - gain
+                    if forward < best_delta:
+                        best_delta, best_move = forward, (k, False)
+                    if backward < best_delta:
+                        best_delta, best_move = backward, (k, True)
+                if best_move:
+                    k, flip = best_move
+                    segment = tour[i:i + length]
+                    if flip:
+                        segment.reverse()
+                    rest = tour[:i] + tour[i + length:]
+                    insert_at = k + 1 if k < i else k + 1 - length
+                    tour[:] = rest[:insert_at] + segment + rest[insert_at:]
+                    improved = True
+                    break
+            if improved or time.perf_counter() >= deadline:
+                break
+    return tour
+
+
+def optimize_route(stops, return_to_start=False, fix_end=False,
+                   time_budget_ms=DEFAULT_TIME_BUDGET_MS,
+                   speed_kmh=AVERAGE_SPEED_KMH):
+    """
+    Order ``stops`` to minimise travel distance, starting at the first stop.
+
+    The path is built from a precomputed haversine matrix with a nearest
+    neighbour start, then improved with 2-opt and Or-opt until no move
+    helps or ``time_budget_ms`` runs out. With ``fix_end`` the last stop
+    stays last; with ``return_to_start`` the cart comes back to the first.
+    """
+    deadline = time.perf_counter() + time_budget_ms / 1000.0
+    points = [get_coordinates(stop) for stop in stops]
+    n = len(points)
+    matrix = distance_matrix(points)
+
+    if return_to_start:
+        end, nodes = 0, range(1, n)
+    elif fix_end:
+        end, nodes = n - 1, range(1, n - 1)
+    else:
+        # A zero-cost virtual stop lets an open path reuse the fixed-end moves
+        for row in matrix:
+            row.append(0.0)
+        matrix.append([0.0] * (n + 1))
+        end, nodes = n, range(1, n)
+
+    tour = nearest_neighbour(matrix, 0, end, nodes)
+    while time.perf_counter() < deadline:
+        before = path_length(tour, matrix)
+        two_opt(tour, matrix, deadline)
+        or_opt(tour, matrix, deadline)
+        if path_length(tour, matrix) >= before - 1e-9:
+            break
+
+    distance_km = path_length(tour, matrix)
+    order = tour if fix_end and not return_to_start else tour[:-1]
+
+    return {
+        'stops': [stops[index] for index in order],
+        'order': order,
+        'distance': round(distance_km, 3),
+        'estimated_duration': math.ceil(distance_km / speed_kmh * 60),
+    }
@@ -3,4 +3,5 @@ from . import consumers
 
 websocket_urlpatterns = [
     re_path(r'ws/trips/(?P<trip_id>\w+)/$', consumers.TripConsumer.as_asgi()),
+    re_path(r'ws/fleet/$', consumers.FleetConsumer.as_asgi()),
 ]
@@ -1,5 +1,6 @@
 from rest_framework import serializers
-from django.db.models import Avg
+from django.db.models import Count, DecimalField, Prefetch, Q, Sum, Value
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 from .models import User, Customer, Driver, Trip, Wallet, Payment, GolfCart, Route
 
@@ -40,11 +41,25 @@ class PaymentSerializer(serializers.ModelSerializer):
                  'status', 'created_at', 'wallet_balance']
         read_only_fields = ['payment_id', 'created_at', 'wallet_balance']
 
+    @staticmethod
+    def setup_eager_loading(queryset):
+        return queryset.select_related('wallet')
+
     def validate_amount(self, value):
         if value <= 0:
             raise serializers.ValidationError("Amount must be positive")
         return value
 
+def validate_past(value):
+    if value > timezone.now():
+        raise serializers.ValidationError("Cannot be in the future")
+    return value
+
+class PaymentImportSerializer(PaymentSerializer):
+    # Imports keep the source system's id and creation time
+    payment_id = serializers.CharField(max_length=50, required=False)
+    created_at = serializers.DateTimeField(required=False, validators=[validate_past])
+
 class WalletSerializer(serializers.ModelSerializer):
     recent_transactions = PaymentSerializer(many=True, read_only=True, source='payment_set')
     user_name = serializers.CharField(source='user.user_name', read_only=True)
@@ -53,7 +68,12 @@ class WalletSerializer(serializers.ModelSerializer):
         model = Wallet
         fields = ['wallet_id', 'user', 'user_name', 'current_balance', 
                  'last_updated', 'recent_transactions']
-        read_only_fields = ['wallet_id', 'last_updated']
+        # Balances only change through the ledger (Wallet.add_funds/deduct_funds)
+        read_only_fields = ['wallet_id', 'current_balance', 'last_updated']
+
+    @staticmethod
+    def setup_eager_loading(queryset):
+        return queryset.select_related('user').prefetch_related('payment_set')
 
 class RouteSerializer(serializers.ModelSerializer):
     duration_display = serializers.SerializerMethodField()
@@ -99,8 +119,12 @@ class TripSerializer(serializers.ModelSerializer):
                  'end_time', 'rating', 'payment', 'created_at']
         read_only_fields = ['trip_id', 'fare', 'created_at']
 
+    @staticmethod
+    def setup_eager_loading(queryset):
+        return queryset.select_related('customer', 'driver', 'route')
+
     def get_fare_display(self, obj):
-        return f"${float(obj.fare):.2f}"
+        return f"${obj.fare:.2f}"
 
     def validate_no_of_seats_booked(self, value):
         if value < 1:
@@ -109,6 +133,15 @@ class TripSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError("Cannot book more than 4 seats")
         return value
 
+class TripImportSerializer(TripSerializer):
+    # Bulk imports carry the route id so fares can be computed on ingest,
+    # and keep the source system's id and creation time
+    route = serializers.PrimaryKeyRelatedField(
+        queryset=Route.objects.all(), required=False, allow_null=True
+    )
+    trip_id = serializers.CharField(max_length=50, required=False)
+    created_at = serializers.DateTimeField(required=False, validators=[validate_past])
+
 class GolfCartSerializer(serializers.ModelSerializer):
     driver_name = serializers.CharField(source='driver.user_name', read_only=True)
     maintenance_status = serializers.SerializerMethodField()
@@ -120,6 +153,10 @@ class GolfCartSerializer(serializers.ModelSerializer):
                  'location', 'last_maintenance', 'maintenance_status']
         read_only_fields = ['gc_id']
 
+    @staticmethod
+    def setup_eager_loading(queryset):
+        return queryset.select_related('driver')
+
     def get_maintenance_status(self, obj):
         if not obj.maintenance_due:
             return "No maintenance scheduled"
@@ -146,7 +183,16 @@ class CustomerSerializer(serializers.ModelSerializer):
             'govt_id': {'write_only': True}
         }
 
+    @staticmethod
+    def setup_eager_loading(queryset):
+        return queryset.select_related('wallet').prefetch_related(
+            Prefetch('trip_set', queryset=TripSerializer.setup_eager_loading(Trip.objects.all())),
+            'wallet__payment_set'
+        ).annotate(trip_count=Count('trip'))
+
     def get_total_trips(self, obj):
+        if hasattr(obj, 'trip_count'):
+            return obj.trip_count
         return obj.trip_set.count()
 
 class DriverSerializer(serializers.ModelSerializer):
@@ -163,21 +209,42 @@ class DriverSerializer(serializers.ModelSerializer):
                  'golf_cart', 'active_trips', 'earnings_today']
         read_only_fields = ['id', 'rating', 'total_earnings', 'total_trips']
 
-    def get_active_trips(self, obj):
-        active_trips = Trip.objects.filter(
-            driver=obj,
-            status__in=['ACCEPTED', 'STARTED']
+    @staticmethod
+    def setup_eager_loading(queryset):
+        active_trips = TripSerializer.setup_eager_loading(
+            Trip.objects.filter(status__in=['ACCEPTED', 'STARTED'])
+        )
+        earnings_today = Coalesce(
+            Sum('trip__fare', filter=Q(
+                trip__status='COMPLETED',
+                trip__end_time__date=timezone.now().date()
+            )),
+            Value(0),
+            output_field=DecimalField(max_digits=10, decimal_places=2)
         )
+        return queryset.select_related('golf_cart').prefetch_related(
+            Prefetch('trip_set', queryset=active_trips, to_attr='active_trip_list')
+        ).annotate(earnings_today_total=earnings_today)
+
+    def get_active_trips(self, obj):
+        if hasattr(obj, 'active_trip_list'):
+            active_trips = obj.active_trip_list
+        else:
+            active_trips = TripSerializer.setup_eager_loading(Trip.objects.filter(
+                driver=obj,
+                status__in=['ACCEPTED', 'STARTED']
+            ))
         return TripSerializer(active_trips, many=True).data
 
     def get_earnings_today(self, obj):
+        if hasattr(obj, 'earnings_today_total'):
+            return obj.earnings_today_total
         today = timezone.now().date()
-        trips_today = Trip.objects.filter(
+        return Trip.objects.filter(
             driver=obj,
             status='COMPLETED',
             end_time__date=today
-        )
-        return sum(trip.fare for trip in trips_today)
+        ).aggregate(total=Sum('fare'))['total'] or 0
 
     def get_rating_display(self, obj):
         return f"{'★' * int(obj.rating)}{('☆' * (5 - int(obj.rating)))}"
@@ -0,0 +1,143 @@
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_init, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .models import Driver, GolfCart, Payment, Route, Trip
+from .fleet import drop_cart, sync_cart
+from .metrics import add_query_timer
+from .response_cache import response_cache
+from .surge import surge_monitor
+from .rollups import (
+    EARNINGS_FIELDS, PAYMENT_FIELDS, adjust_payment_rollup, earnings_key, payment_key,
+    refresh_driver_earnings, stored_row
+)
+
+# Previous rollup key of an instance loaded with deferred key fields
+UNKNOWN = object()
+
+
+@receiver(post_save, sender=GolfCart)
+def sync_cart_index(sender, instance, **kwargs):
+    sync_cart(instance)
+
+
+@receiver(post_delete, sender=GolfCart)
+def drop_cart_from_index(sender, instance, **kwargs):
+    drop_cart(instance.gc_id)
+
+
+@receiver(post_init, sender=Trip)
+def remember_earnings_key(sender, instance, **kwargs):
+    # Lets post_save also refresh the day a trip moved out of. Deferred
+    # fields are not read here: loading one builds another instance, which
+    # runs post_init again
+    if EARNINGS_FIELDS & instance.get_deferred_fields():
+        instance._earnings_key = UNKNOWN
+    else:
+        instance._earnings_key = earnings_key(instance)
+
+
+@receiver(pre_save, sender=Trip)
+@receiver(pre_delete, sender=Trip)
+def load_earnings_key(sender, instance, **kwargs):
+    if instance._earnings_key is UNKNOWN:
+        row = stored_row(Trip, instance.pk, EARNINGS_FIELDS)
+        instance._earnings_key = earnings_key(row) if row else None
+
+
+@receiver(post_save, sender=Trip)
+def count_trip_request(sender, instance, created, **kwargs):
+    if created and instance.status == 'REQUESTED':
+        surge_monitor.record_request(instance.start_location)
+
+
+@receiver(post_save, sender=Trip)
+def update_driver_earnings(sender, instance, **kwargs):
+    previous, current = instance._earnings_key, earnings_key(instance)
+    instance._earnings_key = current
+    if previous == current and current is None:
+        return
+    with transaction.atomic():
+        for key in {previous, current} - {None}:
+            refresh_driver_earnings(*key)
+
+
+@receiver(post_delete, sender=Trip)
+def remove_driver_earnings(sender, instance, **kwargs):
+    if instance._earnings_key:
+        refresh_driver_earnings(*instance._earnings_key)
+
+
+@receiver(post_init, sender=Payment)
+def remember_payment_key(sender, instance, **kwargs):
+    # Deferred fields are left for pre_save, as for trips
+    if PAYMENT_FIELDS & instance.get_deferred_fields():
+        instance._rollup_key = instance._rollup_amount = UNKNOWN
+    else:
+        instance._rollup_key = payment_key(instance)
+        instance._rollup_amount = instance.amount
+
+
+@receiver(pre_save, sender=Payment)
+@receiver(pre_delete, sender=Payment)
+def load_payment_key(sender, instance, **kwargs):
+    if instance._rollup_key is UNKNOWN:
+        row = stored_row(Payment, instance.pk, PAYMENT_FIELDS)
+        instance._rollup_key = payment_key(row) if row else None
+        instance._rollup_amount = row.amount if row else None
+
+
+@receiver(post_save, sender=Payment)
+def update_payment_rollup(sender, instance, **kwargs):
+    previous, current = instance._rollup_key, payment_key(instance)
+    if previous == current and instance._rollup_amount == instance.amount:
+        return
+    with transaction.atomic():
+        if previous:
+            adjust_payment_rollup(previous, -1, -instance._rollup_amount)
+        adjust_payment_rollup(current, 1, instance.amount)
+    instance._rollup_key = current
+    instance._rollup_amount = instance.amount
+
+
+@receiver(post_delete, sender=Payment)
+def remove_payment_rollup(sender, instance, **kwargs):
+    if instance._rollup_key:
+        adjust_payment_rollup(instance._rollup_key, -1, -instance._rollup_amount)
+
+
+@receiver(post_save, sender=GolfCart)
+@receiver(post_delete, sender=GolfCart)
+def invalidate_cart_responses(sender, instance, **kwargs):
+    response_cache.invalidate('golfcart', instance.gc_id)
+    # Driver profiles embed their cart
+    response_cache.invalidate('driver', instance.driver_id)
+
+
+@receiver(post_save, sender=Driver)
+@receiver(post_delete, sender=Driver)
+def invalidate_driver_responses(sender, instance, **kwargs):
+    response_cache.invalidate('driver', instance.pk)
+    # Carts show their driver's name
+    carts = GolfCart.objects.filter(driver_id=instance.pk).values_list('gc_id', flat=True)
+    response_cache.invalidate('golfcart', *carts)
+
+
+@receiver(post_save, sender=Route)
+@receiver(post_delete, sender=Route)
+def invalidate_route_responses(sender, instance, **kwargs):
+    response_cache.invalidate('route', instance.pk)
+
+
+@receiver(post_save, sender=Trip)
+@receiver(post_delete, sender=Trip)
+def invalidate_trip_driver_responses(sender, instance, **kwargs):
+    # Driver profiles list active trips and today's earnings
+    if instance.driver_id:
+        response_cache.invalidate('driver', instance.driver_id)
+
+
+@receiver(connection_created)
+def time_queries(sender, connection, **kwargs):
+    add_query_timer(connection)
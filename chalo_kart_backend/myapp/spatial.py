@@ -0,0 +1,269 @@
+import heapq
+import math
+import threading
+import time
+
+from .route_optimizer import get_coordinates, haversine_km
+
+CELL_SIZE_DEG = 0.005
+KM_PER_DEG = 111.32
+# Seconds before the shared index reloads, picking up carts changed by other workers
+RELOAD_INTERVAL = 30.0
+GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+
+def geohash(latitude, longitude, precision=5):
+    lat_range, lng_range = [-90.0, 90.0], [-180.0, 180.0]
+    chars, bits, value, even = [], 0, 0, True
+    while len(chars) < precision:
+        interval, coordinate = (lng_range, longitude) if even else (lat_range, latitude)
+        middle = (interval[0] + interval[1]) / 2
+        value <<= 1
+        if coordinate >= middle:
+            value |= 1
+            interval[0] = middle
+        else:
+            interval[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(GEOHASH_ALPHABET[value])
+            bits, value = 0, 0
+    return ''.join(chars)
+
+
+def geohash_cell_size(precision):
+    """(height, width) in degrees of a geohash cell."""
+    bits = 5 * precision
+    return 180.0 / 2 ** (bits // 2), 360.0 / 2 ** ((bits + 1) // 2)
+
+
+def geohash_tiles(south, west, north, east, precision=5, limit=None):
+    """
+    Geohashes covering a bounding box, or ``None`` if more than ``limit``.
+    """
+    height, width = geohash_cell_size(precision)
+    rows = math.floor((north + 90) / height) - math.floor((south + 90) / height) + 1
+    cols = math.floor((east + 180) / width) - math.floor((west + 180) / width) + 1
+    if limit is not None and rows * cols > limit:
+        return None
+    first_lat = (math.floor((south + 90) / height) + 0.5) * height - 90
+    first_lng = (math.floor((west + 180) / width) + 0.5) * width - 180
+    return {
+        geohash(first_lat + row * height, first_lng + col * width, precision)
+        for row in range(rows)
+        for col in range(cols)
+    }
+
+
+class CartIndex:
+    """
+    In-memory uniform grid of live cart positions.
+
+    Only ACTIVE carts with a known location are indexed. Lookups walk rings
+    of cells outwards from the query point and stop as soon as the next
+    ring cannot hold anything closer than the k-th best match.
+
+    Signals only reach the process that saved a cart, so with ``max_age``
+    set the index reloads from the database once it is that many seconds
+    old.
+    """
+
+    def __init__(self, cell_size=CELL_SIZE_DEG, lazy=True, max_age=None):
+        self.cell_size = cell_size
+        self.max_age = max_age
+        self._cells = {}
+        self._carts = {}
+        self._lock = threading.RLock()
+        self._loaded = not lazy
+        self._loaded_at = time.monotonic()
+        self._reloading = False
+
+    def _cell(self, lat, lng):
+        return (math.floor(lat / self.cell_size), math.floor(lng / self.cell_size))
+
+    def __len__(self):
+        return len(self._carts)
+
+    def __contains__(self, gc_id):
+        return gc_id in self._carts
+
+    def stale(self):
+        return not self._loaded or (
+            self.max_age is not None and time.monotonic() - self._loaded_at > self.max_age
+        )
+
+    def ensure_loaded(self):
+        if not self.stale():
+            return
+        with self._lock:
+            # One thread reloads; the others keep using the current index
+            if self._loaded and self._reloading:
+                return
+            self._reloading = True
+        try:
+            from .models import GolfCart
+            carts = list(
+                GolfCart.objects.filter(status='ACTIVE', location__isnull=False).values_list(
+                    'gc_id', 'location', 'type', 'capacity', 'driver_id'
+                )
+            )
+            with self._lock:
+                self._cells.clear()
+                self._carts.clear()
+                for gc_id, location, cart_type, capacity, driver_id in carts:
+                    self._upsert(gc_id, location, cart_type, capacity, driver_id)
+                self._loaded = True
+                self._loaded_at = time.monotonic()
+        finally:
+            self._reloading = False
+
+    def _upsert(self, gc_id, location, cart_type='PRIVATE', capacity=4, driver_id=None):
+        try:
+            lat, lng = get_coordinates(location)
+        except ValueError:
+            self._remove(gc_id)
+            return False
+        cell = self._cell(lat, lng)
+        previous = self._carts.get(gc_id)
+        if previous and previous['cell'] != cell:
+            self._discard_from_cell(gc_id, previous['cell'])
+        self._carts[gc_id] = {
+            'gc_id': gc_id,
+            'latitude': lat,
+            'longitude': lng,
+            'cell': cell,
+            'type': cart_type,
+            'capacity': capacity,
+            'driver_id': driver_id,
+        }
+        self._cells.setdefault(cell, set()).add(gc_id)
+        return True
+
+    def _discard_from_cell(self, gc_id, cell):
+        members = self._cells.get(cell)
+        if members:
+            members.discard(gc_id)
+            if not members:
+                del self._cells[cell]
+
+    def _remove(self, gc_id):
+        entry = self._carts.pop(gc_id, None)
+        if entry:
+            self._discard_from_cell(gc_id, entry['cell'])
+
+    def add(self, gc_id, location, cart_type='PRIVATE', capacity=4, driver_id=None):
+        with self._lock:
+            return self._upsert(gc_id, location, cart_type, capacity, driver_id)
+
+    def update_cart(self, cart):
+        """Sync a GolfCart instance into the index (or drop it)."""
+        with self._lock:
+            if cart.status != 'ACTIVE' or not cart.location:
+                self._remove(cart.gc_id)
+                return False
+            return self._upsert(
+                cart.gc_id, cart.location, cart.type, cart.capacity, cart.driver_id
+            )
+
+    def move(self, gc_id, location):
+        """Update the position of an already indexed cart."""
+        with self._lock:
+            entry = self._carts.get(gc_id)
+            if not entry:
+                return False
+            return self._upsert(
+                gc_id, location, entry['type'], entry['capacity'], entry['driver_id']
+            )
+
+    def remove(self, gc_id):
+        with self._lock:
+            self._remove(gc_id)
+
+    def get(self, gc_id):
+        entry = self._carts.get(gc_id)
+        return dict(entry) if entry else None
+
+    def within(self, south, west, north, east):
+        """Indexed carts inside a bounding box."""
+        self.ensure_loaded()
+        (row_min, col_min), (row_max, col_max) = self._cell(south, west), self._cell(north, east)
+        with self._lock:
+            if (row_max - row_min + 1) * (col_max - col_min + 1) > len(self._cells):
+                entries = self._carts.values()
+            else:
+                entries = [
+                    self._carts[gc_id]
+                    for row in range(row_min, row_max + 1)
+                    for col in range(col_min, col_max + 1)
+                    for gc_id in self._cells.get((row, col), ())
+                ]
+            return [
+                dict(entry) for entry in entries
+                if south <= entry['latitude'] <= north and west <= entry['longitude'] <= east
+            ]
+
+    def nearest(self, latitude, longitude, k=5, max_distance_km=None, predicate=None):
+        """
+        Return up to ``k`` ``(distance_km, entry)`` pairs ordered by distance.
+        """
+        self.ensure_loaded()
+        if k <= 0:
+            return []
+        row, col = self._cell(latitude, longitude)
+        lng_km = KM_PER_DEG * max(math.cos(math.radians(latitude)), 0.01)
+        ring_km = self.cell_size * min(KM_PER_DEG, lng_km)
+        best = []
+
+        with self._lock:
+            total, seen, ring = len(self._carts), 0, 0
+            max_ring = None
+            if max_distance_km is not None:
+                max_ring = int(max_distance_km / ring_km) + 1
+
+            while seen < total and (max_ring is None or ring <= max_ring):
+                if len(best) == k and (ring - 1) * ring_km > -best[0][0]:
+                    break
+                for cell in self._ring_cells(row, col, ring):
+                    members = self._cells.get(cell)
+                    if not members:
+                        continue
+                    seen += len(members)
+                    for gc_id in members:
+                        entry = self._carts[gc_id]
+                        if predicate and not predicate(entry):
+                            continue
+                        distance = haversine_km(
+                            (latitude, longitude), (entry['latitude'], entry['longitude'])
+                        )
+                        if max_distance_km is not None and distance > max_distance_km:
+                            continue
+                        item = (-distance, gc_id, entry)
+                        if len(best) < k:
+                            heapq.heappush(best, item)
+                        elif distance < -best[0][0]:
+                            heapq.heapreplace(best, item)
+                ring += 1
+
+        return [(-neg, dict(entry)) for neg, _, entry in sorted(best, reverse=True)]
+
+    @staticmethod
+    def _ring_cells(row, col, ring):
+        if ring == 0:
+            yield (row, col)
+            return
+        for c in range(col - ring, col + ring + 1):
+            yield (row - ring, c)
+            yield (row + ring, c)
+        for r in range(row - ring + 1, row + ring):
+            yield (r, col - ring)
+            yield (r, col + ring)
+
+    def clear(self):
+        with self._lock:
+            self._cells.clear()
+            self._carts.clear()
+            self._loaded = False
+
+
+cart_index = CartIndex(max_age=RELOAD_INTERVAL)
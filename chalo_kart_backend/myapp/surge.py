@@ -0,0 +1,318 @@
+import logging
+import os
+import threading
+import time
+from datetime import timedelta
+from decimal import ROUND_FLOOR, Decimal
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+from .route_optimizer import get_coordinates
+from .spatial import geohash, geohash_cell_size
+
+logger = logging.getLogger(__name__)
+
+ONE = Decimal('1')
+DEFAULT_SURGE = {
+    # Off unless a deployment opts in, so upgrading never changes fares
+    'enabled': False,
+    # Geohash precision 6 cells are about 1.2 x 0.6 km
+    'precision': 6,
+    'window_seconds': 600,
+    'bucket_seconds': 60,
+    # Every worker rebuilds its counts from the database this often, in a
+    # background thread, so changes handled by other workers show up
+    'resync_seconds': 60,
+    # Share of the 8 neighbouring cells' requests and drivers counted with a cell
+    'neighbour_weight': '0.5',
+    # Fewer (smoothed) requests than this never surge
+    'min_requests': 3,
+    # Requests per available driver before the price moves
+    'threshold': '1.0',
+    # Multiplier added per extra request per driver above the threshold
+    'sensitivity': '0.25',
+    'max_multiplier': '2.0',
+    'step': '0.05',
+}
+
+
+_config = (None, None)
+
+
+def config():
+    """``SURGE_PRICING`` merged over the defaults, rebuilt only when the setting changes."""
+    global _config
+    source = getattr(settings, 'SURGE_PRICING', None) or {}
+    if _config[0] is not source:
+        _config = (source, {**DEFAULT_SURGE, **source})
+    return _config[1]
+
+
+def enabled():
+    return config()['enabled']
+
+
+class DemandRing:
+    """Request counts in fixed time buckets covering the rolling window."""
+
+    __slots__ = ('buckets', 'counts')
+
+    def __init__(self, size):
+        self.buckets = [None] * size
+        self.counts = [0] * size
+
+    def add(self, bucket, count=1):
+        slot = bucket % len(self.buckets)
+        if self.buckets[slot] != bucket:
+            self.buckets[slot] = bucket
+            self.counts[slot] = 0
+        self.counts[slot] += count
+
+    def remove(self, bucket):
+        slot = bucket % len(self.buckets)
+        if self.buckets[slot] == bucket and self.counts[slot] > 0:
+            self.counts[slot] -= 1
+
+    def total(self, bucket):
+        oldest = bucket - len(self.buckets)
+        return sum(
+            count for seen, count in zip(self.buckets, self.counts)
+            if seen is not None and oldest < seen <= bucket
+        )
+
+
+class SurgeMonitor:
+    """
+    Rolling trip-request counts and available drivers per geohash cell.
+
+    Requests come from trip creation and leave on cancellation, supply
+    from availability toggles and cart moves. Every change drops the cached
+    multipliers of its cell and the neighbouring ones, and reads recompute
+    only when the window has moved on, so pricing a pickup costs a geohash
+    and a dict lookup.
+
+    State is per process, like the cart index: each worker rebuilds it
+    from the database every ``resync_seconds`` on a background thread,
+    which also forgets cells that went quiet. Requests never wait on the
+    database; until the first resync finishes they see only live changes.
+    """
+
+    def __init__(self):
+        self._demand = {}
+        self._supply = {}
+        self._driver_cells = {}
+        self._multipliers = {}
+        self._neighbours = {}
+        self._lock = threading.RLock()
+        self._thread = None
+        self._thread_pid = None
+
+    def locate(self, location):
+        """The geohash cell of ``location``; its neighbours are remembered for smoothing."""
+        latitude, longitude = get_coordinates(location)
+        precision = config()['precision']
+        cell = geohash(latitude, longitude, precision)
+        if cell not in self._neighbours:
+            height, width = geohash_cell_size(precision)
+            self._neighbours[cell] = tuple(
+                geohash(
+                    max(-90.0, min(90.0, latitude + rows * height)),
+                    (longitude + cols * width + 180) % 360 - 180,
+                    precision
+                )
+                for rows in (-1, 0, 1) for cols in (-1, 0, 1) if rows or cols
+            )
+        return cell
+
+    def bucket(self, now=None):
+        return int((time.time() if now is None else now) // config()['bucket_seconds'])
+
+    def ring_size(self):
+        options = config()
+        return max(1, options['window_seconds'] // options['bucket_seconds'])
+
+    def ensure_started(self):
+        """Start this process's resync thread (again after a fork)."""
+        pid = os.getpid()
+        if self._thread_pid == pid:
+            return
+        with self._lock:
+            if self._thread_pid != pid:
+                self._thread_pid = pid
+                self._thread = threading.Thread(target=self._run, name='surge-resync', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            try:
+                self.resync()
+            except Exception as e:
+                logger.error(f"Surge resync failed: {str(e)}")
+            finally:
+                close_old_connections()
+            time.sleep(config()['resync_seconds'])
+
+    def resync(self):
+        from .models import Driver, Trip
+
+        window = timedelta(seconds=config()['window_seconds'])
+        # Cancelled trips are not demand
+        requests = list(Trip.objects.filter(
+            created_at__gte=timezone.now() - window
+        ).exclude(status='CANCELLED').values_list('start_location', 'created_at'))
+        drivers = list(Driver.objects.filter(
+            is_available=True, golf_cart__status='ACTIVE', golf_cart__location__isnull=False
+        ).values_list('pk', 'golf_cart__location'))
+        with self._lock:
+            self._demand.clear()
+            self._supply.clear()
+            self._driver_cells.clear()
+            self._multipliers.clear()
+            self._neighbours.clear()
+            for location, created_at in requests:
+                self._record_request(location, self.bucket(created_at.timestamp()))
+            for driver_id, location in drivers:
+                self._set_available(driver_id, location, True)
+
+    def _changed(self, cell):
+        self._multipliers.pop(cell, None)
+        for neighbour in self._neighbours.get(cell, ()):
+            self._multipliers.pop(neighbour, None)
+
+    def _record_request(self, location, bucket):
+        try:
+            cell = self.locate(location)
+        except ValueError:
+            return None
+        ring = self._demand.get(cell)
+        if ring is None:
+            ring = self._demand[cell] = DemandRing(self.ring_size())
+        ring.add(bucket)
+        self._changed(cell)
+        return cell
+
+    def record_request(self, location, now=None):
+        if not enabled():
+            return None
+        self.ensure_started()
+        with self._lock:
+            return self._record_request(location, self.bucket(now))
+
+    def cancel_request(self, location, requested_at):
+        """Stop counting a request that was cancelled while still in the window."""
+        if not enabled() or not location:
+            return None
+        self.ensure_started()
+        with self._lock:
+            try:
+                cell = self.locate(location)
+            except ValueError:
+                return None
+            ring = self._demand.get(cell)
+            if ring is not None:
+                ring.remove(self.bucket(requested_at.timestamp()))
+                self._changed(cell)
+            return cell
+
+    def _set_available(self, driver_id, location, available):
+        previous = self._driver_cells.pop(driver_id, None)
+        if previous is not None:
+            drivers = self._supply[previous]
+            drivers.discard(driver_id)
+            if not drivers:
+                del self._supply[previous]
+            self._changed(previous)
+        if not available or not location:
+            return None
+        try:
+            cell = self.locate(location)
+        except ValueError:
+            return None
+        self._supply.setdefault(cell, set()).add(driver_id)
+        self._driver_cells[driver_id] = cell
+        self._changed(cell)
+        return cell
+
+    def set_available(self, driver_id, location, available):
+        if not enabled():
+            return None
+        self.ensure_started()
+        with self._lock:
+            return self._set_available(driver_id, location, available)
+
+    def move_driver(self, driver_id, location):
+        # Only drivers counted as supply follow their cart between cells
+        if driver_id not in self._driver_cells:
+            return None
+        with self._lock:
+            if driver_id in self._driver_cells:
+                return self._set_available(driver_id, location, True)
+        return None
+
+    def counts(self, cell, bucket):
+        ring = self._demand.get(cell)
+        return (ring.total(bucket) if ring else 0), len(self._supply.get(cell, ()))
+
+    def compute(self, cell, bucket):
+        """``(multiplier, requests, drivers)`` for ``cell``, smoothed over its neighbours."""
+        options = config()
+        demand, supply = self.counts(cell, bucket)
+        weight = Decimal(options['neighbour_weight'])
+        smoothed_demand, smoothed_supply = Decimal(demand), Decimal(supply)
+        for neighbour in self._neighbours.get(cell, ()):
+            around_demand, around_supply = self.counts(neighbour, bucket)
+            smoothed_demand += weight * around_demand
+            smoothed_supply += weight * around_supply
+        if smoothed_demand < options['min_requests']:
+            return ONE, demand, supply
+        excess = smoothed_demand / max(smoothed_supply, ONE) - Decimal(options['threshold'])
+        if excess <= 0:
+            return ONE, demand, supply
+        step = Decimal(options['step'])
+        raw = min(ONE + excess * Decimal(options['sensitivity']), Decimal(options['max_multiplier']))
+        return ((raw / step).to_integral_value(ROUND_FLOOR) * step).quantize(step), demand, supply
+
+    def multiplier(self, location, now=None):
+        """Surge multiplier for a pickup at ``location`` (1 when off or unknown)."""
+        if not enabled() or not location:
+            return ONE
+        try:
+            cell = self.locate(location)
+        except ValueError:
+            return ONE
+        self.ensure_started()
+        bucket = self.bucket(now)
+        cached = self._multipliers.get(cell)
+        if cached is not None and cached[0] == bucket:
+            return cached[1]
+        with self._lock:
+            value = self.compute(cell, bucket)[0]
+            self._multipliers[cell] = (bucket, value)
+        return value
+
+    def hottest(self, limit=10, now=None):
+        if not enabled():
+            return []
+        self.ensure_started()
+        bucket = self.bucket(now)
+        with self._lock:
+            rows = []
+            for cell in set(self._demand) | set(self._supply):
+                value, demand, supply = self.compute(cell, bucket)
+                if demand or supply:
+                    rows.append({'cell': cell, 'multiplier': str(value), 'requests': demand,
+                                 'available_drivers': supply})
+        rows.sort(key=lambda row: (Decimal(row['multiplier']), row['requests']), reverse=True)
+        return rows[:limit]
+
+    def reset(self):
+        with self._lock:
+            self._demand.clear()
+            self._supply.clear()
+            self._driver_cells.clear()
+            self._multipliers.clear()
+
+
+surge_monitor = SurgeMonitor()
@@ -0,0 +1,114 @@
+from django.conf import settings
+from django.core import signing
+from django.utils.crypto import constant_time_compare, salted_hmac
+
+ACCESS_SALT = 'myapp.tokens.access'
+REFRESH_SALT = 'myapp.tokens.refresh'
+DEFAULT_ACCESS_LIFETIME = 15 * 60
+DEFAULT_REFRESH_LIFETIME = 14 * 24 * 60 * 60
+
+
+class TokenError(Exception):
+    pass
+
+
+class TokenUser:
+    """
+    The user an access token was issued to, rebuilt from its claims.
+
+    Stands in for ``request.user`` without loading a row; ``account_id`` is
+    the ``myapp.User`` primary key (also the Customer/Driver key).
+    """
+
+    is_authenticated = True
+    is_anonymous = False
+    is_active = True
+    is_superuser = False
+
+    def __init__(self, claims):
+        self.account_id = claims['uid']
+        self.pk = self.id = claims['uid']
+        self.role = claims.get('role', 'user')
+        self.is_staff = bool(claims.get('staff'))
+
+    def __str__(self):
+        return f"{self.role} {self.account_id}"
+
+
+def access_lifetime():
+    return getattr(settings, 'ACCESS_TOKEN_LIFETIME', DEFAULT_ACCESS_LIFETIME)
+
+
+def refresh_lifetime():
+    return getattr(settings, 'REFRESH_TOKEN_LIFETIME', DEFAULT_REFRESH_LIFETIME)
+
+
+def user_role(user):
+    # Multi-table children share the parent's primary key
+    if hasattr(user, 'driver'):
+        return 'driver'
+    if hasattr(user, 'customer'):
+        return 'customer'
+    return 'user'
+
+
+def password_fingerprint(user):
+    # Changes with the password hash, so a new password retires old refresh tokens
+    return salted_hmac(REFRESH_SALT, user.password).hexdigest()[:16]
+
+
+def issue_tokens(user):
+    """Signed access and refresh tokens for a ``myapp.User``."""
+    claims = {'uid': user.pk, 'role': user_role(user), 'staff': user.is_staff}
+    return {
+        'access': signing.dumps(claims, salt=ACCESS_SALT, compress=True),
+        'refresh': signing.dumps(
+            {'uid': user.pk, 'pwd': password_fingerprint(user)},
+            salt=REFRESH_SALT, compress=True
+        ),
+        'expires_in': access_lifetime(),
+    }
+
+
+def verify_access_token(token):
+    """
+    The ``TokenUser`` for a valid, unexpired access token.
+
+    One HMAC check and a JSON decode; no query and no password hash.
+    """
+    try:
+        claims = signing.loads(token, salt=ACCESS_SALT, max_age=access_lifetime())
+    except signing.SignatureExpired:
+        raise TokenError('Token has expired')
+    except signing.BadSignature:
+        raise TokenError('Invalid token')
+    return TokenUser(claims)
+
+
+def refresh_tokens(token):
+    """
+    New tokens for a valid refresh token.
+
+    Refreshing is rare, so it does read the user: deactivated accounts and
+    changed passwords stop refresh tokens from working.
+    """
+    from .models import User
+
+    try:
+        claims = signing.loads(token, salt=REFRESH_SALT, max_age=refresh_lifetime())
+    except signing.SignatureExpired:
+        raise TokenError('Refresh token has expired')
+    except signing.BadSignature:
+        raise TokenError('Invalid refresh token')
+    try:
+        user = User.objects.get(pk=claims['uid'], is_active=True)
+    except User.DoesNotExist:
+        raise TokenError('Invalid refresh token')
+    if not constant_time_compare(claims.get('pwd', ''), password_fingerprint(user)):
+        raise TokenError('Invalid refresh token')
+    return user, issue_tokens(user)
+
+
+def account_id(user):
+    """The ``myapp.User`` key behind ``request.user``; None for staff sessions."""
+    return getattr(user, 'account_id', None)
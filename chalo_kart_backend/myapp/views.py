@@ -1,29 +1,107 @@
 from rest_framework import viewsets, status, filters
-from rest_framework.decorators import action
+from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, IsAdminUser
-from rest_framework.exceptions import PermissionDenied
+from rest_framework.exceptions import NotFound, PermissionDenied, ValidationError
+from rest_framework.fields import BooleanField
 from django_filters.rest_framework import DjangoFilterBackend
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 from decimal import Decimal
-from .models import User, Customer, Driver, Trip, Wallet, Payment, Route, GolfCart
+from .models import (
+    User, Customer, Driver, Trip, Wallet, Payment, Route, GolfCart, PaymentDailyRollup
+)
+from .spatial import cart_index
+from .pooling import pool_trip
+from .events import send_trip_update, trip_delta, trip_snapshot
+from .ledger import IdempotencyConflict, apply_wallet_change
+from .pagination import KeysetPagination
+from .fares import as_json, candidate_leg, quote_many
+from .metrics import timed_serializer
+from .profiling import enabled as profiling_enabled, profile_store
+from .response_cache import CachedResponseMixin, response_cache
+from .surge import surge_monitor
+from .tokens import TokenError, account_id, issue_tokens, refresh_tokens
+from .ingest import CHUNK_SIZE, PaymentIngestor, TripIngestor
+from .export import FORMATS as EXPORT_FORMATS, PAYMENT_EXPORT_FIELDS, TRIP_EXPORT_FIELDS, stream_export
 from .serializers import (
     UserSerializer, CustomerSerializer, DriverSerializer,
     TripSerializer, WalletSerializer, PaymentSerializer,
     RouteSerializer, GolfCartSerializer
 )
 import logging
-from django.db.models import Avg, Sum
+from django.db.models import Sum
 from django.utils import timezone
-from django.db import transaction
+from django.utils.dateparse import parse_date, parse_datetime
+from django.contrib.auth.hashers import check_password
+from django.http import FileResponse
+from django.urls import reverse
 
 logger = logging.getLogger(__name__)
 
+MAX_QUOTE_CANDIDATES = 100
+
+def parse_bool(value):
+    """Read a flag the way DRF's BooleanField does, so "false" and "0" are False."""
+    try:
+        return BooleanField().to_internal_value(value)
+    except ValidationError:
+        raise ValueError(f"Invalid boolean: {value!r}")
+
 class BaseViewSet(viewsets.ModelViewSet):
     def handle_exception(self, exc):
         logger.error(f"Error in {self.__class__.__name__}: {str(exc)}")
         return super().handle_exception(exc)
 
+    def get_serializer(self, *args, **kwargs):
+        return timed_serializer(super().get_serializer(*args, **kwargs))
+
+    def bulk_ingest(self, request, ingestor_class):
+        # The NDJSON body is read line by line, never parsed as a whole
+        try:
+            chunk_size = int(request.query_params.get('chunk_size', CHUNK_SIZE))
+        except ValueError:
+            return Response(
+                {'error': 'chunk_size must be an integer'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            report = ingestor_class(chunk_size=min(max(chunk_size, 1), 5000)).run(request.stream or [])
+        except Exception as e:
+            logger.error(f"Bulk ingest error: {str(e)}")
+            return Response(
+                {'error': 'Failed to ingest rows'},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+        return Response(
+            report,
+            status=status.HTTP_201_CREATED if report['created'] else status.HTTP_400_BAD_REQUEST
+        )
+
+    def export(self, request, fields, date_field, filename):
+        output = request.query_params.get('output', 'csv')
+        if output not in EXPORT_FORMATS:
+            return Response(
+                {'error': f"output must be one of: {', '.join(EXPORT_FORMATS)}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        queryset = self.filter_queryset(self.get_queryset())
+        for param, lookup in [('since', 'gte'), ('until', 'lt')]:
+            value = request.query_params.get(param)
+            if not value:
+                continue
+            moment = parse_datetime(value)
+            if moment is None and parse_date(value):
+                moment = datetime.combine(parse_date(value), datetime.min.time())
+            if moment is None:
+                return Response(
+                    {'error': f'{param} must be an ISO date or datetime'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            if timezone.is_naive(moment):
+                moment = timezone.make_aware(moment)
+            queryset = queryset.filter(**{f'{date_field}__{lookup}': moment})
+        return stream_export(queryset, fields, output, filename)
+
 class UserViewSet(BaseViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
@@ -31,7 +109,7 @@ class UserViewSet(BaseViewSet):
     search_fields = ['user_name', 'email', 'phone']
     
     def get_permissions(self):
-        if self.action in ['login', 'register']:
+        if self.action in ['login', 'register', 'refresh']:
             return []
         if self.action in ['list', 'destroy']:
             return [IsAdminUser()]
@@ -57,8 +135,8 @@ class UserViewSet(BaseViewSet):
                         status=status.HTTP_403_FORBIDDEN
                     )
                 
-                # Use Django's built-in password hashing
-                from django.contrib.auth.hashers import check_password, make_password
+                # The only password hash a session pays for; requests
+                # carry the signed access token instead
                 if not check_password(password, user.password):
                     return Response(
                         {'error': 'Invalid credentials'},
@@ -66,8 +144,11 @@ class UserViewSet(BaseViewSet):
                     )
                     
                 serializer = self.get_serializer(user)
+                tokens = issue_tokens(user)
                 return Response({
-                    'token': 'dummy_token',  # Replace with proper JWT token
+                    'token': tokens['access'],
+                    'refresh': tokens['refresh'],
+                    'expires_in': tokens['expires_in'],
                     'user': serializer.data
                 })
             except User.DoesNotExist:
@@ -82,6 +163,24 @@ class UserViewSet(BaseViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+    @action(detail=False, methods=['post'])
+    def refresh(self, request):
+        token = request.data.get('refresh')
+        if not token:
+            return Response(
+                {'error': 'Refresh token is required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            user, tokens = refresh_tokens(token)
+        except TokenError as e:
+            return Response({'error': str(e)}, status=status.HTTP_401_UNAUTHORIZED)
+        return Response({
+            'token': tokens['access'],
+            'refresh': tokens['refresh'],
+            'expires_in': tokens['expires_in'],
+        })
+
     @action(detail=False, methods=['post'])
     def register(self, request):
         serializer = self.get_serializer(data=request.data)
@@ -113,7 +212,7 @@ class UserViewSet(BaseViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        if user.password != old_password:
+        if not check_password(old_password, user.password):
             return Response(
                 {'error': 'Invalid old password'},
                 status=status.HTTP_400_BAD_REQUEST
@@ -150,15 +249,25 @@ class CustomerViewSet(BaseViewSet):
     filterset_fields = ['is_student']
     search_fields = ['user_name', 'email']
 
+    def get_queryset(self):
+        # Actions like trip_history only need the customer row itself
+        if self.action in ['list', 'retrieve']:
+            return CustomerSerializer.setup_eager_loading(super().get_queryset())
+        return super().get_queryset()
+
     @action(detail=True, methods=['get'])
     def trip_history(self, request, pk=None):
         try:
             customer = self.get_object()
-            page = self.paginate_queryset(
-                Trip.objects.filter(customer=customer).order_by('-start_time')
+            paginator = KeysetPagination()
+            page = paginator.paginate_queryset(
+                TripSerializer.setup_eager_loading(Trip.objects.filter(customer=customer)),
+                request, view=self
             )
             serializer = TripSerializer(page, many=True)
-            return self.get_paginated_response(serializer.data)
+            return paginator.get_paginated_response(serializer.data)
+        except NotFound:
+            raise
         except Exception as e:
             logger.error(f"Trip history error: {str(e)}")
             return Response(
@@ -188,16 +297,30 @@ class CustomerViewSet(BaseViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
-class DriverViewSet(BaseViewSet):
+class DriverViewSet(CachedResponseMixin, BaseViewSet):
     queryset = Driver.objects.all()
     serializer_class = DriverSerializer
     filter_backends = [filters.SearchFilter]
     search_fields = ['user_name', 'driving_license']
+    cache_namespace = 'driver'
+
+    def cache_vary(self, request):
+        # earnings_today rolls over at midnight
+        return (timezone.localdate().isoformat(),)
+
+    def get_queryset(self):
+        # Built per request because earnings_today depends on the current date
+        if self.action in ['list', 'retrieve']:
+            return DriverSerializer.setup_eager_loading(super().get_queryset())
+        return super().get_queryset()
 
     @action(detail=True, methods=['post'])
     def toggle_availability(self, request, pk=None):
         driver = self.get_object()
-        is_available = request.data.get('is_available', False)
+        try:
+            is_available = parse_bool(request.data.get('is_available', False))
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
         
         if not driver.golf_cart:
             return Response(
@@ -210,6 +333,7 @@ class DriverViewSet(BaseViewSet):
             driver.golf_cart.status = 'ACTIVE' if is_available else 'INACTIVE'
             driver.golf_cart.save()
             driver.save()
+            surge_monitor.set_available(driver.pk, driver.golf_cart.location, is_available)
             return Response({
                 'status': driver.golf_cart.status,
                 'is_available': driver.is_available
@@ -225,34 +349,46 @@ class DriverViewSet(BaseViewSet):
     def earnings_report(self, request, pk=None):
         driver = self.get_object()
         period = request.query_params.get('period', 'week')
-        
         try:
-            if period == 'week':
-                start_date = datetime.now() - timedelta(days=7)
-            elif period == 'month':
-                start_date = datetime.now() - timedelta(days=30)
-            else:
-                start_date = datetime.now() - timedelta(days=365)
-                
-            completed_trips = Trip.objects.filter(
-                driver=driver,
-                end_time__gte=start_date,
-                status='COMPLETED'
+            include_trips = parse_bool(request.query_params.get('include_trips', False))
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            days = {'week': 7, 'month': 30}.get(period, 365)
+            # Today is the last of the period's days
+            start_date = timezone.localdate() - timedelta(days=days - 1)
+
+            totals = driver.daily_earnings.filter(date__gte=start_date).aggregate(
+                total_earnings=Sum('total_earnings'),
+                total_trips=Sum('trip_count'),
+                rating_sum=Sum('rating_sum'),
+                rated_trips=Sum('rated_trips')
             )
-            
-            total_earnings = sum(trip.fare for trip in completed_trips)
-            total_trips = completed_trips.count()
-            average_rating = completed_trips.exclude(rating__isnull=True).aggregate(
-                Avg('rating')
-            )['rating__avg'] or 0
-            
-            return Response({
+            average_rating = (
+                totals['rating_sum'] / totals['rated_trips'] if totals['rated_trips'] else 0
+            )
+            report = {
                 'period': period,
-                'total_earnings': str(total_earnings),
-                'total_trips': total_trips,
+                'total_earnings': str(
+                    Decimal(totals['total_earnings'] or 0).quantize(Decimal('0.01'))
+                ),
+                'total_trips': totals['total_trips'] or 0,
                 'average_rating': round(average_rating, 2),
-                'completed_trips': TripSerializer(completed_trips, many=True).data
-            })
+            }
+
+            # The trip listing is opt-in and paginated; totals never load trips
+            if include_trips:
+                page = self.paginate_queryset(TripSerializer.setup_eager_loading(
+                    Trip.objects.filter(
+                        driver=driver,
+                        end_time__date__gte=start_date,
+                        status='COMPLETED'
+                    ).order_by('-end_time')
+                ))
+                report['completed_trips'] = TripSerializer(page, many=True).data
+                report['next'] = self.paginator.get_next_link()
+            return Response(report)
         except Exception as e:
             logger.error(f"Earnings report error: {str(e)}")
             return Response(
@@ -261,15 +397,89 @@ class DriverViewSet(BaseViewSet):
             )
 
 class TripViewSet(BaseViewSet):
-    queryset = Trip.objects.all()
+    queryset = TripSerializer.setup_eager_loading(Trip.objects.all())
     serializer_class = TripSerializer
+    pagination_class = KeysetPagination
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['status']
 
     def perform_create(self, serializer):
+        # Priced before the insert, so the trip is written once
+        fare = Trip(**serializer.validated_data).calculate_fare(surge=True)
+        trip = serializer.save(fare=fare)
+        send_trip_update(trip.trip_id, status=trip.status, fare=trip.fare)
+
+    def perform_update(self, serializer):
+        before = trip_snapshot(serializer.instance)
         trip = serializer.save()
-        trip.fare = trip.calculate_fare()
-        trip.save()
+        send_trip_update(trip.trip_id, **trip_delta(before, trip))
+
+    @action(detail=False, methods=['post'], permission_classes=[IsAdminUser])
+    def bulk(self, request):
+        return self.bulk_ingest(request, TripIngestor)
+
+    @action(detail=False, methods=['post'])
+    def quote(self, request):
+        candidates = request.data.get('candidates')
+        if not isinstance(candidates, list) or not candidates:
+            return Response(
+                {'error': 'candidates must be a non-empty list'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(candidates) > MAX_QUOTE_CANDIDATES:
+            return Response(
+                {'error': f'At most {MAX_QUOTE_CANDIDATES} candidates per quote'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            seats = int(request.data.get('seats', 1))
+            if not 1 <= seats <= 4:
+                raise ValueError
+        except (TypeError, ValueError):
+            return Response(
+                {'error': 'seats must be between 1 and 4'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        at = None
+        if request.data.get('at'):
+            at = parse_datetime(str(request.data['at']))
+            if at is None:
+                return Response(
+                    {'error': 'at must be an ISO 8601 datetime'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            if timezone.is_naive(at):
+                at = timezone.make_aware(at)
+
+        # Staff may quote for any customer; everyone else for themselves
+        customer_id = account_id(request.user)
+        if request.user.is_staff and request.data.get('customer'):
+            customer_id = request.data['customer']
+        try:
+            student = Customer.objects.filter(pk=customer_id, is_student=True).exists()
+        except (TypeError, ValueError):
+            return Response({'error': 'Invalid customer'}, status=status.HTTP_400_BAD_REQUEST)
+
+        routes = Route.objects.in_bulk([
+            candidate['route'] for candidate in candidates
+            if isinstance(candidate, dict) and candidate.get('route')
+        ])
+        try:
+            legs = [candidate_leg(candidate, routes) for candidate in candidates]
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        quotes = quote_many(
+            legs, at=at, seats=seats,
+            shuttle=request.data.get('type') == 'SHUTTLE', student=student,
+            # Live surge only means something for trips starting now
+            surge=at is None
+        )
+        return Response({'quotes': [as_json(quote) for quote in quotes]})
+
+    @action(detail=False, methods=['get'], permission_classes=[IsAdminUser])
+    def export(self, request):
+        return super().export(request, TRIP_EXPORT_FIELDS, 'created_at', 'trips')
 
     @action(detail=True, methods=['post'])
     def cancel(self, request, pk=None):
@@ -283,6 +493,8 @@ class TripViewSet(BaseViewSet):
         try:
             trip.status = 'CANCELLED'
             trip.save()
+            surge_monitor.cancel_request(trip.start_location, trip.created_at)
+            send_trip_update(trip.trip_id, status=trip.status)
             return Response({'message': 'Trip cancelled successfully'})
         except Exception as e:
             logger.error(f"Trip cancellation error: {str(e)}")
@@ -291,6 +503,43 @@ class TripViewSet(BaseViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+    @action(detail=True, methods=['post'])
+    def pool(self, request, pk=None):
+        trip = self.get_object()
+        if trip.status != 'REQUESTED' or trip.driver_id:
+            return Response(
+                {'error': 'Only unassigned requested trips can be pooled'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            plan, added_km = pool_trip(trip)
+        except ValueError:
+            return Response(
+                {'error': 'Trip has invalid start or end location'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        except Exception as e:
+            logger.error(f"Trip pooling error: {str(e)}")
+            return Response(
+                {'error': 'Failed to pool trip'},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+        if plan is None:
+            return Response(
+                {'error': 'No shuttle can take this trip'},
+                status=status.HTTP_409_CONFLICT
+            )
+        trip.refresh_from_db()
+        return Response({
+            'trip': TripSerializer(trip).data,
+            'golf_cart': plan.gc_id,
+            'added_distance': round(added_km, 3),
+            'remaining_seats': plan.remaining_seats(),
+            'stops': plan.stops
+        })
+
     @action(detail=True, methods=['post'])
     def rate_trip(self, request, pk=None):
         trip = self.get_object()
@@ -318,6 +567,7 @@ class TripViewSet(BaseViewSet):
         try:
             trip.rating = rating_value
             trip.save()
+            send_trip_update(trip.trip_id, rating=trip.rating)
             
             # Update driver's rating
             driver = trip.driver
@@ -337,13 +587,13 @@ class TripViewSet(BaseViewSet):
 
 class WalletViewSet(BaseViewSet):
     permission_classes = [IsAuthenticated]
-    queryset = Wallet.objects.all()
+    queryset = WalletSerializer.setup_eager_loading(Wallet.objects.all())
     serializer_class = WalletSerializer
     
     @action(detail=False, methods=['get'])
     def info(self, request):
         try:
-            wallet = self.queryset.get(user=request.user)
+            wallet = self.queryset.get(user_id=account_id(request.user))
             serializer = self.get_serializer(wallet)
             return Response(serializer.data)
         except Wallet.DoesNotExist:
@@ -373,21 +623,23 @@ class WalletViewSet(BaseViewSet):
                     status=status.HTTP_400_BAD_REQUEST
                 )
                 
-            wallet = self.queryset.get(user=request.user)
-            wallet.add_funds(amount)
+            wallet = self.queryset.get(user_id=account_id(request.user))
+            payment = wallet.add_funds(
+                amount, idempotency_key=request.headers.get('Idempotency-Key')
+            )
             
             return Response({
                 'message': 'Funds added successfully',
                 'new_balance': str(wallet.current_balance),
-                'transaction': PaymentSerializer(
-                    wallet.payment_set.latest('created_at')
-                ).data
+                'transaction': PaymentSerializer(payment).data
             })
         except Wallet.DoesNotExist:
             return Response(
                 {'error': 'Wallet not found'},
                 status=status.HTTP_404_NOT_FOUND
             )
+        except IdempotencyConflict as e:
+            return Response({'error': str(e)}, status=status.HTTP_409_CONFLICT)
         except (ValueError, TypeError):
             return Response(
                 {'error': 'Invalid amount'},
@@ -400,9 +652,10 @@ class WalletViewSet(BaseViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
-class RouteViewSet(BaseViewSet):
+class RouteViewSet(CachedResponseMixin, BaseViewSet):
     queryset = Route.objects.all()
     serializer_class = RouteSerializer
+    cache_namespace = 'route'
 
     @action(detail=False, methods=['post'])
     def optimize(self, request):
@@ -414,8 +667,22 @@ class RouteViewSet(BaseViewSet):
             )
             
         try:
-            optimized_route = Route.calculate_optimal_route(stops)
-            return Response({'optimized_route': optimized_route})
+            result = Route.calculate_optimal_route(
+                stops,
+                return_to_start=parse_bool(request.data.get('return_to_start', False)),
+                fix_end=parse_bool(request.data.get('fix_end', False))
+            )
+            return Response({
+                'optimized_route': result['stops'],
+                'order': result['order'],
+                'distance': result['distance'],
+                'estimated_duration': result['estimated_duration']
+            })
+        except ValueError as e:
+            return Response(
+                {'error': str(e)},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         except Exception as e:
             logger.error(f"Route optimization error: {str(e)}")
             return Response(
@@ -423,11 +690,12 @@ class RouteViewSet(BaseViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
-class GolfCartViewSet(BaseViewSet):
-    queryset = GolfCart.objects.all()
+class GolfCartViewSet(CachedResponseMixin, BaseViewSet):
+    queryset = GolfCartSerializer.setup_eager_loading(GolfCart.objects.all())
     serializer_class = GolfCartSerializer
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ['status', 'type']
+    cache_namespace = 'golfcart'
 
     @action(detail=True, methods=['post'])
     def update_location(self, request, pk=None):
@@ -442,7 +710,7 @@ class GolfCartViewSet(BaseViewSet):
             
         try:
             cart.location = location
-            cart.save()
+            cart.save(update_fields=['location'])
             return Response({'message': 'Location updated successfully'})
         except Exception as e:
             logger.error(f"Location update error: {str(e)}")
@@ -451,6 +719,50 @@ class GolfCartViewSet(BaseViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+    @action(detail=False, methods=['get'])
+    def nearby(self, request):
+        try:
+            latitude = float(request.query_params['latitude'])
+            longitude = float(request.query_params['longitude'])
+            k = min(int(request.query_params.get('k', 5)), 50)
+            radius = float(request.query_params.get('radius', 5))
+            seats = int(request.query_params.get('seats', 1))
+        except (KeyError, TypeError, ValueError):
+            return Response(
+                {'error': 'latitude and longitude are required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        cart_type = request.query_params.get('type')
+        try:
+            # The index is the source of truth: signals keep it current in this
+            # worker and it reloads every RELOAD_INTERVAL to pick up the others
+            matches = cart_index.nearest(
+                latitude, longitude, k=k, max_distance_km=radius,
+                predicate=lambda entry: (
+                    (not cart_type or entry['type'] == cart_type)
+                    and entry['capacity'] >= seats
+                )
+            )
+            carts = GolfCart.objects.select_related('driver').in_bulk(
+                [entry['gc_id'] for _, entry in matches]
+            )
+            results = []
+            for distance, entry in matches:
+                cart = carts.get(entry['gc_id'])
+                if cart is None:
+                    continue
+                data = GolfCartSerializer(cart).data
+                data['distance'] = round(distance, 3)
+                results.append(data)
+            return Response({'count': len(results), 'results': results})
+        except Exception as e:
+            logger.error(f"Nearby carts error: {str(e)}")
+            return Response(
+                {'error': 'Failed to find nearby carts'},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
     @action(detail=True, methods=['post'])
     def schedule_maintenance(self, request, pk=None):
         cart = self.get_object()
@@ -473,8 +785,9 @@ class GolfCartViewSet(BaseViewSet):
             )
 
 class PaymentViewSet(BaseViewSet):
-    queryset = Payment.objects.all()
+    queryset = PaymentSerializer.setup_eager_loading(Payment.objects.all())
     serializer_class = PaymentSerializer
+    pagination_class = KeysetPagination
     filter_backends = [DjangoFilterBackend, filters.SearchFilter]
     filterset_fields = ['type', 'status']
     search_fields = ['payment_id']
@@ -484,30 +797,42 @@ class PaymentViewSet(BaseViewSet):
         # Users can only see their own payments
         if self.request.user.is_staff:
             return self.queryset
-        return self.queryset.filter(wallet__user=self.request.user)
+        return self.queryset.filter(wallet__user_id=account_id(self.request.user))
+
+    def get_rollups(self):
+        # Reports read the daily rollups, never the raw payment table
+        rollups = PaymentDailyRollup.objects.all()
+        if self.request.user.is_staff:
+            return rollups
+        return rollups.filter(wallet__user_id=account_id(self.request.user))
 
     def perform_create(self, serializer):
         # Validate wallet ownership
         wallet = serializer.validated_data['wallet']
-        if wallet.user != self.request.user and not self.request.user.is_staff:
+        if wallet.user_id != account_id(self.request.user) and not self.request.user.is_staff:
             raise PermissionDenied("You don't have permission to make payments for this wallet")
         serializer.save()
 
+    @action(detail=False, methods=['post'], permission_classes=[IsAdminUser])
+    def bulk(self, request):
+        return self.bulk_ingest(request, PaymentIngestor)
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        return super().export(request, PAYMENT_EXPORT_FIELDS, 'created_at', 'payments')
+
     @action(detail=False, methods=['get'])
     def summary(self, request):
         try:
-            user_payments = self.get_queryset()
-            total_added = user_payments.filter(
-                type='ADD',
-                status='COMPLETED'
-            ).aggregate(total=Sum('amount'))['total'] or 0
-            
-            total_spent = user_payments.filter(
-                type='DEDUCT',
-                status='COMPLETED'
-            ).aggregate(total=Sum('amount'))['total'] or 0
+            totals = dict(
+                self.get_rollups().filter(status='COMPLETED')
+                .values('type').annotate(amount=Sum('total'))
+                .values_list('type', 'amount')
+            )
+            total_added = totals.get('ADD') or 0
+            total_spent = totals.get('DEDUCT') or 0
             
-            recent_transactions = user_payments.order_by('-created_at')[:5]
+            recent_transactions = self.get_queryset().order_by('-created_at')[:5]
             
             return Response({
                 'total_added': str(total_added),
@@ -528,20 +853,18 @@ class PaymentViewSet(BaseViewSet):
             today = timezone.now().date()
             start_of_month = today.replace(day=1)
             
-            monthly_payments = self.get_queryset().filter(
-                created_at__gte=start_of_month,
+            monthly_rollups = self.get_rollups().filter(
+                date__gte=start_of_month,
                 status='COMPLETED'
             )
             
-            by_type = monthly_payments.values('type').annotate(
-                count=models.Count('id'),
-                total=models.Sum('amount')
-            )
+            by_type = monthly_rollups.values('type').annotate(
+                count=Sum('count'),
+                total=Sum('total')
+            ).order_by('type')
             
-            daily_totals = monthly_payments.annotate(
-                date=models.functions.TruncDate('created_at')
-            ).values('date').annotate(
-                total=models.Sum('amount')
+            daily_totals = monthly_rollups.values('date').annotate(
+                total=Sum('total')
             ).order_by('date')
             
             return Response({
@@ -566,24 +889,15 @@ class PaymentViewSet(BaseViewSet):
             )
             
         try:
-            with transaction.atomic():
-                # Create refund payment
-                refund = Payment.objects.create(
-                    wallet=payment.wallet,
-                    amount=payment.amount,
-                    type='ADD',
-                    status='COMPLETED',
-                    trip=payment.trip
-                )
-                
-                # Update wallet balance
-                payment.wallet.current_balance += payment.amount
-                payment.wallet.save()
-                
-                return Response({
-                    'message': 'Payment refunded successfully',
-                    'refund': PaymentSerializer(refund).data
-                })
+            # Keyed on the original payment, so a payment is refunded at most once
+            refund, created = apply_wallet_change(
+                payment.wallet_id, payment.amount, 'ADD', trip=payment.trip,
+                idempotency_key=f"refund:{payment.payment_id}"
+            )
+            return Response({
+                'message': 'Payment refunded successfully' if created else 'Payment already refunded',
+                'refund': PaymentSerializer(refund).data
+            })
         except Exception as e:
             logger.error(f"Payment refund error: {str(e)}")
             return Response(
@@ -597,32 +911,31 @@ class PaymentViewSet(BaseViewSet):
             year = int(request.query_params.get('year', timezone.now().year))
             month = int(request.query_params.get('month', timezone.now().month))
             
-            start_date = timezone.datetime(year, month, 1)
+            start_date = date(year, month, 1)
             if month == 12:
-                end_date = timezone.datetime(year + 1, 1, 1)
+                end_date = date(year + 1, 1, 1)
             else:
-                end_date = timezone.datetime(year, month + 1, 1)
+                end_date = date(year, month + 1, 1)
             
-            payments = self.get_queryset().filter(
-                created_at__gte=start_date,
-                created_at__lt=end_date,
+            rollups = self.get_rollups().filter(
+                date__gte=start_date,
+                date__lt=end_date,
                 status='COMPLETED'
             )
+            daily_summary = list(rollups.values('date').annotate(
+                count=Sum('count'),
+                total=Sum('total')
+            ).order_by('date'))
             
             report_data = {
                 'period': f"{year}-{month:02d}",
-                'total_transactions': payments.count(),
-                'total_amount': str(payments.aggregate(total=Sum('amount'))['total'] or 0),
-                'by_type': payments.values('type').annotate(
-                    count=models.Count('id'),
-                    total=models.Sum('amount')
-                ),
-                'daily_summary': payments.annotate(
-                    date=models.functions.TruncDate('created_at')
-                ).values('date').annotate(
-                    count=models.Count('id'),
-                    total=models.Sum('amount')
-                ).order_by('date')
+                'total_transactions': sum(day['count'] for day in daily_summary),
+                'total_amount': str(sum((day['total'] for day in daily_summary), Decimal('0'))),
+                'by_type': rollups.values('type').annotate(
+                    count=Sum('count'),
+                    total=Sum('total')
+                ).order_by('type'),
+                'daily_summary': daily_summary
             }
             
             return Response(report_data)
@@ -632,3 +945,36 @@ class PaymentViewSet(BaseViewSet):
                 {'error': 'Failed to generate monthly report'},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def cache_stats(request):
+    return Response(response_cache.stats())
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def surge_status(request):
+    return Response({'cells': surge_monitor.hottest()})
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def profile_list(request):
+    profiles = []
+    for name in profile_store.names():
+        path = profile_store.path(name)
+        if path is None:
+            continue
+        profiles.append({
+            'name': name,
+            'bytes': path.stat().st_size,
+            'url': request.build_absolute_uri(reverse('profile-detail', args=[name])),
+        })
+    return Response({'enabled': profiling_enabled(), 'profiles': profiles})
+
+@api_view(['GET'])
+@permission_classes([IsAdminUser])
+def profile_detail(request, name):
+    path = profile_store.path(name)
+    if path is None:
+        return Response({'error': 'Profile not found'}, status=status.HTTP_404_NOT_FOUND)
+    return FileResponse(open(path, 'rb'), as_attachment=True, filename=name, content_type='text/plain')